@@ -0,0 +1,265 @@
+import hashlib                # Hash de la clave de deduplicación
+import sqlite3                # Para conectarse a bases de datos SQLite
+import time                   # Para medir filas por segundo
+from itertools import islice  # Para partir el stream de filas en lotes
+
+import numpy as np
+import pandas as pd
+
+from espejo_parquet import espejar_lote
+from esquema import centavos, columnas_db
+from manifiesto import buscar_batch, cerrar_batch, registrar_batch
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BATCH_SIZE = 5000  # Filas por executemany (ajustable por llamada)
+CACHE_KB = 65536   # Caché de páginas de SQLite durante la carga (KB)
+
+# Columnas de movimientos_bancarios que salen de los parsers (en este orden;
+# los parsers entregan los montos en centavos, ver esquema.py)
+COLUMNAS_MOVIMIENTOS = [
+    "fecha",
+    "banco",
+    "cuenta",
+    "banco_origen",
+    "cuenta_origen",
+    "rut_pagador",
+    "nombre_contraparte",
+    "tipo_documento",
+    "moneda",
+    "descripcion",
+    "comentario_movimiento",
+    "referencia_movimiento",
+    "abonos",
+    "cargos",
+    "saldo",
+    "neto",
+]
+
+# Columnas que se insertan (las de los parsers + la clave de deduplicación)
+COLUMNAS_INSERT = COLUMNAS_MOVIMIENTOS + ["dedup_key"]
+
+# ==============================
+# HELPERS
+# ==============================
+def configurar_pragmas_carga(conn, temp_en_memoria=True):
+    """
+    Ajusta la conexión para cargas masivas:
+    - WAL: los lectores no quedan bloqueados mientras se escribe
+    - synchronous=NORMAL: seguro con WAL y mucho más rápido que FULL
+    - tablas temporales en memoria (o en disco si la carga es por bloques
+      y no debe quedar completa en RAM)
+    - caché de páginas de 64 MB: dedup_key es un hash, así que las inserciones
+      caen en páginas al azar del índice y con la caché por defecto (2 MB)
+      casi todas son fallos
+    """
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_KB};")
+    conn.execute(f"PRAGMA temp_store = {'MEMORY' if temp_en_memoria else 'FILE'};")
+
+
+def _mezclar(h):
+    """Finalizador splitmix64 sobre un array uint64 (avalancha de bits)."""
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def _hash_texto(serie):
+    """Hash de 64 bits del texto normalizado (mayúsculas, sin espacios extremos); uno por valor distinto."""
+    codigos, valores = pd.factorize(serie, use_na_sentinel=False)
+    hashes = np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(("" if pd.isna(v) else str(v)).strip().upper().encode("utf-8"), digest_size=8).digest(),
+                "big",
+            )
+            for v in valores
+        ],
+        dtype=np.uint64,
+    )
+    return hashes[codigos] if len(hashes) else np.zeros(len(serie), dtype=np.uint64)
+
+
+def _centavos(df, columna):
+    """Monto en centavos (uint64 con complemento a 2) y máscara de faltantes; ver esquema.centavos."""
+    valores, faltante = centavos(df, columna)
+    return valores.view(np.uint64), faltante
+
+
+def clave_dedup(df):
+    """
+    Clave de deduplicación de 64 bits (entero con signo) por movimiento.
+
+    Se calcula sobre campos que no dependen de cómo se parsea el concepto:
+    fecha, banco, cuenta, abonos, cargos y saldo (montos en centavos).
+    Da la misma clave para un DataFrame del esquema del parser (montos
+    *_centavos) que para las filas leídas de la base (montos en pesos).
+    El saldo corrido distingue movimientos iguales del mismo día; solo si
+    falta el saldo se agregan descripcion y referencia_movimiento.
+
+    Todo es vectorizado: los textos se hashean una vez por valor distinto y
+    los componentes se combinan con la mezcla splitmix64.
+
+    Devuelve un array int64 alineado con las filas de df.
+    """
+    dias = pd.to_datetime(df["fecha"]).to_numpy(dtype="datetime64[D]").astype(np.int64).view(np.uint64)
+    abonos, _ = _centavos(df, "abonos")
+    cargos, _ = _centavos(df, "cargos")
+    saldo, sin_saldo = _centavos(df, "saldo")
+
+    h = np.full(len(df), 0x9E3779B97F4A7C15, dtype=np.uint64)
+    for componente in (dias, _hash_texto(df["banco"]), _hash_texto(df["cuenta"]), abonos, cargos, saldo):
+        h = _mezclar(h ^ componente)
+
+    if sin_saldo.any():
+        textos = _mezclar(
+            _mezclar(h ^ _hash_texto(df["descripcion"]) ^ np.uint64(1)) ^ _hash_texto(df["referencia_movimiento"])
+        )
+        h = np.where(sin_saldo, textos, h)
+
+    return h.view(np.int64)
+
+
+def iter_tuplas_movimientos(df):
+    """
+    Genera las filas del DataFrame normalizado como tuplas listas para
+    executemany, en el orden de COLUMNAS_INSERT.
+    - los montos en centavos (esquema.ESQUEMA_MOVIMIENTOS) pasan a pesos
+    - fecha se formatea como YYYY-MM-DD
+    - dedup_key se calcula con clave_dedup
+    - los valores faltantes se envían como None (NULL)
+    """
+    datos = columnas_db(df)[COLUMNAS_MOVIMIENTOS].copy()
+    datos["dedup_key"] = clave_dedup(df)
+    datos["fecha"] = pd.to_datetime(datos["fecha"]).dt.strftime("%Y-%m-%d")
+    datos = datos.astype(object)
+    datos = datos.where(datos.notna(), None)
+    return datos.itertuples(index=False, name=None)
+
+
+def iter_lotes(filas, batch_size):
+    """Parte un iterable de filas en listas de hasta batch_size elementos."""
+    filas = iter(filas)
+    while True:
+        lote = list(islice(filas, batch_size))
+        if not lote:
+            return
+        yield lote
+
+# ==============================
+# CARGA MASIVA
+# ==============================
+def guardar_movimientos(datos, db_path, batch_size=BATCH_SIZE, usar_staging=True, orden_inverso=False,
+                        manifiesto=None):
+    """
+    Inserta los movimientos normalizados en movimientos_bancarios en una sola
+    transacción, ignorando duplicados (INSERT OR IGNORE sobre dedup_key).
+
+    - datos puede ser un DataFrame o un iterable de DataFrames (bloques); en
+      ese caso cada bloque se escribe y se suelta antes de leer el siguiente.
+    - Las filas se envían como tuplas con executemany en lotes de batch_size.
+    - Con usar_staging=True se cargan primero en una tabla temporal y luego
+      se pasan con un único INSERT ... SELECT, que entrega de una vez cuántas
+      filas eran nuevas y cuántas duplicadas.
+    - orden_inverso=True inserta las filas en el orden contrario al recibido
+      (cartolas que vienen de la más nueva a la más antigua). Requiere staging.
+    - manifiesto (ver manifiesto.preparar_manifiesto) registra la carga en
+      ingest_batches dentro de la misma transacción y marca cada fila con su
+      batch_id. Si ese contenido ya estaba cargado no se inserta nada.
+      Las filas nuevas del lote se copian además al espejo Parquet.
+
+    Devuelve un dict con: filas, insertados, ignorados, segundos,
+    filas_por_segundo, batch_id y omitido
+    """
+    if orden_inverso and not usar_staging:
+        raise ValueError("orden_inverso requiere usar_staging=True")
+
+    por_bloques = not isinstance(datos, pd.DataFrame)
+    bloques = datos if por_bloques else [datos]
+
+    columnas = ", ".join(COLUMNAS_INSERT)
+    placeholders = ", ".join("?" for _ in COLUMNAS_INSERT)
+
+    conn = sqlite3.connect(db_path)
+    configurar_pragmas_carga(conn, temp_en_memoria=not por_bloques)
+    cursor = conn.cursor()
+
+    inicio = time.perf_counter()
+    filas = 0
+    insertados = 0
+    batch_id = None
+
+    try:
+        cursor.execute("BEGIN")
+
+        if manifiesto is not None:
+            batch_id = buscar_batch(conn, manifiesto)
+            if batch_id is not None:
+                # Mismo contenido y misma versión del parser: ya está cargado
+                conn.rollback()
+                return {
+                    "filas": 0, "insertados": 0, "ignorados": 0, "segundos": 0.0,
+                    "filas_por_segundo": 0.0, "batch_id": batch_id, "omitido": True,
+                }
+            batch_id = registrar_batch(cursor, manifiesto)
+
+        if usar_staging:
+            cursor.execute(f"""
+                CREATE TEMP TABLE IF NOT EXISTS staging_movimientos AS
+                SELECT {columnas} FROM movimientos_bancarios WHERE 0
+            """)
+            cursor.execute("DELETE FROM staging_movimientos")
+
+            insert_sql = f"INSERT INTO staging_movimientos ({columnas}) VALUES ({placeholders})"
+            for bloque in bloques:
+                for lote in iter_lotes(iter_tuplas_movimientos(bloque), batch_size):
+                    cursor.executemany(insert_sql, lote)
+                    filas += len(lote)
+
+            # Un solo paso: lo que no choca con dedup_key se inserta, el resto se ignora
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO movimientos_bancarios ({columnas}, batch_id)
+                SELECT {columnas}, ? FROM staging_movimientos
+                ORDER BY rowid {"DESC" if orden_inverso else "ASC"}
+            """, (batch_id,))
+            insertados = cursor.rowcount
+
+            cursor.execute("DROP TABLE staging_movimientos")
+        else:
+            insert_sql = f"INSERT OR IGNORE INTO movimientos_bancarios ({columnas}, batch_id) VALUES ({placeholders}, ?)"
+            for bloque in bloques:
+                for lote in iter_lotes(iter_tuplas_movimientos(bloque), batch_size):
+                    cursor.executemany(insert_sql, [fila + (batch_id,) for fila in lote])
+                    insertados += cursor.rowcount
+                    filas += len(lote)
+
+        if batch_id is not None:
+            cerrar_batch(cursor, batch_id, filas, insertados)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    segundos = time.perf_counter() - inicio
+
+    # Copia columnar para análisis (si pyarrow está instalado; ver espejo_parquet.py)
+    if batch_id is not None and insertados:
+        espejar_lote(db_path, batch_id)
+
+    return {
+        "filas": filas,
+        "insertados": insertados,
+        "ignorados": filas - insertados,
+        "segundos": segundos,
+        "filas_por_segundo": filas / segundos if segundos > 0 else float(filas),
+        "batch_id": batch_id,
+        "omitido": False,
+    }
@@ -0,0 +1,256 @@
+import argparse
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+LIMITE = 50                # Resultados devueltos por búsqueda
+MAX_CANDIDATOS = 2000      # Coincidencias más recientes que se ordenan por relevancia
+MIN_FRAGMENTO = 3          # Largo mínimo de un fragmento de referencia (trigramas)
+
+# Columnas indexadas y su peso en el ranking (bm25): un acierto en la
+# referencia o en el nombre pesa más que uno en la descripción
+COLUMNAS_TEXTO = {
+    "descripcion": 1.0,
+    "comentario_movimiento": 1.0,
+    "referencia_movimiento": 2.0,
+    "nombre_contraparte": 2.0,
+}
+
+COLUMNAS_RESULTADO = [
+    "id", "fecha", "banco", "cuenta", "abonos", "cargos", "nombre_contraparte",
+    "descripcion", "comentario_movimiento", "referencia_movimiento",
+]
+
+# ==============================
+# ÍNDICE FTS5
+# ==============================
+# Dos tablas FTS5 de contenido externo (el texto vive solo en
+# movimientos_bancarios; el índice guarda los tokens):
+# - movimientos_fts: palabras de COLUMNAS_TEXTO, sin mayúsculas ni acentos
+#   (unicode61 remove_diacritics 2: "CAMPAÑA" = "campana"), con índice de
+#   prefijos para buscar el inicio de un nombre o de una referencia larga
+# - movimientos_ref_fts: trigramas de referencia_movimiento, para un trozo
+#   del medio o del final de una clave SPEI / folio ("...4471")
+# Los triggers las mantienen al día en cada INSERT / DELETE / UPDATE de
+# movimientos_bancarios (INSERT OR IGNORE no dispara nada en los duplicados).
+#
+# FTS5 vacía su buffer de términos al cerrar cada sentencia: insertar fila
+# a fila con executemany cuesta ~4 veces más que el único INSERT ... SELECT
+# desde staging de bulk_loader.guardar_movimientos, que es el camino de carga.
+
+TOKENIZADOR = "unicode61 remove_diacritics 2"
+PREFIJOS = "2 4"
+
+
+def _valores(alias, columnas):
+    return ", ".join(f"{alias}.{c}" for c in columnas)
+
+
+def crear_indice(conn):
+    """
+    Crea las tablas FTS5 y sus triggers (si no existen) y las llena con los
+    movimientos ya cargados. Devuelve cuántos movimientos quedaron indexados.
+    """
+    columnas = list(COLUMNAS_TEXTO)
+    texto = ", ".join(columnas)
+    with conn:
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS movimientos_fts USING fts5(
+                {texto},
+                content = 'movimientos_bancarios',
+                content_rowid = 'id',
+                tokenize = '{TOKENIZADOR}',
+                prefix = '{PREFIJOS}'
+            )
+        """)
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS movimientos_ref_fts USING fts5(
+                referencia_movimiento,
+                content = 'movimientos_bancarios',
+                content_rowid = 'id',
+                tokenize = 'trigram'
+            )
+        """)
+
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS movimientos_fts_insert
+            AFTER INSERT ON movimientos_bancarios BEGIN
+                INSERT INTO movimientos_fts (rowid, {texto}) VALUES (new.id, {_valores("new", columnas)});
+                INSERT INTO movimientos_ref_fts (rowid, referencia_movimiento)
+                VALUES (new.id, new.referencia_movimiento);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS movimientos_fts_delete
+            AFTER DELETE ON movimientos_bancarios BEGIN
+                INSERT INTO movimientos_fts (movimientos_fts, rowid, {texto})
+                VALUES ('delete', old.id, {_valores("old", columnas)});
+                INSERT INTO movimientos_ref_fts (movimientos_ref_fts, rowid, referencia_movimiento)
+                VALUES ('delete', old.id, old.referencia_movimiento);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS movimientos_fts_update
+            AFTER UPDATE OF {texto} ON movimientos_bancarios BEGIN
+                INSERT INTO movimientos_fts (movimientos_fts, rowid, {texto})
+                VALUES ('delete', old.id, {_valores("old", columnas)});
+                INSERT INTO movimientos_fts (rowid, {texto}) VALUES (new.id, {_valores("new", columnas)});
+                INSERT INTO movimientos_ref_fts (movimientos_ref_fts, rowid, referencia_movimiento)
+                VALUES ('delete', old.id, old.referencia_movimiento);
+                INSERT INTO movimientos_ref_fts (rowid, referencia_movimiento)
+                VALUES (new.id, new.referencia_movimiento);
+            END
+        """)
+
+        # Reconstruye desde movimientos_bancarios (también repara un índice desalineado)
+        conn.execute("INSERT INTO movimientos_fts (movimientos_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO movimientos_ref_fts (movimientos_ref_fts) VALUES ('rebuild')")
+
+    return conn.execute("SELECT COUNT(*) FROM movimientos_bancarios").fetchone()[0]
+
+
+def optimizar_indice(conn):
+    """Junta los segmentos del índice en uno (conviene tras cargas grandes)."""
+    with conn:
+        conn.execute("INSERT INTO movimientos_fts (movimientos_fts) VALUES ('optimize')")
+        conn.execute("INSERT INTO movimientos_ref_fts (movimientos_ref_fts) VALUES ('optimize')")
+
+# ==============================
+# BÚSQUEDA
+# ==============================
+def consulta_fts(texto):
+    """
+    Texto libre -> expresión MATCH: cada palabra como prefijo y todas
+    obligatorias ("pago spei 0012" -> "pago"* "spei"* "0012"*). Las de una
+    letra van completas (no hay índice de prefijos de 1). None si no queda
+    ninguna palabra.
+    """
+    palabras = re.findall(r"\w+", str(texto))
+    if not palabras:
+        return None
+    return " ".join(f'"{p}"*' if len(p) >= 2 else f'"{p}"' for p in palabras)
+
+
+def _filtros(banco, fecha_desde, fecha_hasta):
+    condiciones, params = [], []
+    if banco is not None:
+        condiciones.append("m.banco = ?")
+        params.append(banco)
+    if fecha_desde is not None:
+        condiciones.append("m.fecha >= ?")
+        params.append(fecha_desde)
+    if fecha_hasta is not None:
+        condiciones.append("m.fecha <= ?")
+        params.append(fecha_hasta)
+    return "".join(f" AND {c}" for c in condiciones), params
+
+
+def _sql_busqueda(tabla, pesos, filtros, excluir=""):
+    """
+    Las MAX_CANDIDATOS coincidencias más recientes (orden de rowid, que FTS5
+    entrega sin ordenar aparte) y, entre ellas, las más relevantes: ordenar
+    por bm25 todas las coincidencias de una palabra frecuente ("SPEI")
+    tomaría segundos con millones de movimientos.
+    """
+    columnas = ", ".join(f"m.{c}" for c in COLUMNAS_RESULTADO)
+    return f"""
+        SELECT {columnas}, c.puntaje
+        FROM (
+            SELECT f.rowid AS id, bm25({tabla}{pesos}) AS puntaje
+            FROM {tabla} f
+            JOIN movimientos_bancarios m ON m.id = f.rowid
+            WHERE {tabla} MATCH ?{filtros}{excluir}
+            ORDER BY f.rowid DESC
+            LIMIT {MAX_CANDIDATOS}
+        ) c
+        JOIN movimientos_bancarios m ON m.id = c.id
+        ORDER BY c.puntaje
+        LIMIT ?
+    """
+
+
+def buscar(conn, texto, limite=LIMITE, banco=None, fecha_desde=None, fecha_hasta=None):
+    """
+    Movimientos que contienen las palabras de texto (o el inicio de cada una)
+    en descripción, comentario, referencia o nombre de la contraparte, sin
+    importar mayúsculas ni acentos. Ordenados por relevancia (bm25, columna
+    puntaje: más negativo = más relevante) entre las MAX_CANDIDATOS
+    coincidencias más recientes.
+
+    Si las palabras no alcanzan a llenar el límite, se completa con los
+    movimientos cuya referencia contiene texto en cualquier posición
+    (coincidencia = "fragmento", al final de la lista).
+    """
+    filtros, params_filtros = _filtros(banco, fecha_desde, fecha_hasta)
+    partes = []
+
+    expresion = consulta_fts(texto)
+    if expresion is not None:
+        pesos = "".join(f", {p}" for p in COLUMNAS_TEXTO.values())
+        palabras = pd.read_sql(
+            _sql_busqueda("movimientos_fts", pesos, filtros),
+            conn, params=(expresion, *params_filtros, limite),
+        )
+        partes.append(palabras.assign(coincidencia="palabra"))
+
+    fragmento = str(texto).strip()
+    faltan = limite - sum(len(p) for p in partes)
+    if faltan > 0 and len(fragmento) >= MIN_FRAGMENTO:
+        vistos = partes[0]["id"].tolist() if partes else []
+        excluir = f" AND m.id NOT IN ({', '.join('?' * len(vistos))})" if vistos else ""
+        fragmentos = pd.read_sql(
+            _sql_busqueda("movimientos_ref_fts", "", filtros, excluir),
+            conn, params=('"' + fragmento.replace('"', '""') + '"', *params_filtros, *vistos, faltan),
+        )
+        partes.append(fragmentos.assign(coincidencia="fragmento"))
+
+    if not partes:
+        return pd.DataFrame(columns=[*COLUMNAS_RESULTADO, "puntaje", "coincidencia"])
+    return pd.concat(partes, ignore_index=True)
+
+# ==============================
+# MAIN
+# ==============================
+def main():
+    ap = argparse.ArgumentParser(description="Búsqueda de texto en movimientos bancarios")
+    ap.add_argument("texto", nargs="?", help="Nombre, folio o referencia (o parte)")
+    ap.add_argument("--db", default=str(DB_PATH))
+    ap.add_argument("--banco")
+    ap.add_argument("--desde", help="YYYY-MM-DD")
+    ap.add_argument("--hasta", help="YYYY-MM-DD")
+    ap.add_argument("--limite", type=int, default=LIMITE)
+    ap.add_argument("--reconstruir", action="store_true", help="Reconstruye y optimiza el índice")
+    args = ap.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.reconstruir:
+            inicio = time.perf_counter()
+            total = crear_indice(conn)
+            optimizar_indice(conn)
+            print(f"🔧 {total:,} movimientos indexados en {time.perf_counter() - inicio:.2f} s")
+        if args.texto is None:
+            return
+
+        inicio = time.perf_counter()
+        resultado = buscar(conn, args.texto, args.limite, args.banco, args.desde, args.hasta)
+        milisegundos = (time.perf_counter() - inicio) * 1000
+    finally:
+        conn.close()
+
+    print(f"🔎 {len(resultado)} movimientos para '{args.texto}' ({milisegundos:.1f} ms)")
+    with pd.option_context("display.max_columns", None, "display.width", 200, "display.max_colwidth", 40):
+        print(resultado.drop(columns="puntaje").to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
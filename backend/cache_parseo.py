@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa            # Opcional: sin pyarrow no hay caché (se parsea siempre)
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+CACHE_DIR = BASE_DIR / "cache" / "parseo"  # Un archivo por (contenido, parser, versión)
+
+MAX_CACHE_MB = 512  # Tamaño máximo de la caché; al pasarse se borran las menos usadas
+
+# ==============================
+# CACHÉ DE ARCHIVOS PARSEADOS
+# ==============================
+# Guarda el DataFrame normalizado de cada archivo de entrada para no volver
+# a parsear un Excel/TXT que no cambió. La clave es:
+#   sha256 del contenido + parser + versión del parser + huella del código
+# La huella es el hash del código fuente de los módulos que parsean (reglas,
+# formatos, normalización): cualquier cambio ahí deja las entradas viejas
+# sin uso, y el LRU las termina borrando.
+#
+# Formato: Parquet (columnar, lectura sin ejecutar código, a diferencia de
+# pickle). Parquet no distingue object / str / string[python] ni guarda una
+# categoría sin valores, así que el dtype de cada columna va en los metadatos
+# del archivo y se restaura al leer: el DataFrame sale igual al parseado.
+# Sin pyarrow (dependencia opcional, como en exportador y espejo_parquet) la
+# caché queda desactivada. Un DataFrame que Parquet no puede guardar (una
+# columna object con tipos mezclados) simplemente no se guarda.
+#
+# LRU: cada lectura actualiza la fecha de modificación del archivo; al
+# guardar, si la carpeta pasa de MAX_CACHE_MB se borran los más antiguos.
+
+EXTENSION = ".parquet"
+EXTENSION_ANTERIOR = ".pkl"  # Formato anterior: nunca se lee, se borra al podar
+META_DTYPES = b"conciliador.dtypes"
+
+
+def cache_disponible():
+    return pq is not None
+
+
+def _nombre_dtype(dtype):
+    if isinstance(dtype, pd.CategoricalDtype):
+        return "category"
+    if isinstance(dtype, pd.StringDtype):
+        return f"string[{dtype.storage}]"
+    return str(dtype)
+
+
+def _restaurar_dtypes(df, dtypes):
+    for col, nombre in dtypes.items():
+        if nombre == _nombre_dtype(df[col].dtype):
+            continue
+        if nombre == "object":
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+        else:
+            df[col] = df[col].astype(nombre)
+    return df
+
+
+def huella_modulos(*modulos):
+    """Hash corto del código fuente de los módulos (cambia con cualquier edición de reglas o parseo)."""
+    h = hashlib.sha256()
+    for modulo in modulos:
+        h.update(Path(modulo.__file__).read_bytes())
+    return h.hexdigest()[:16]
+
+
+def clave_cache(sha256, parser, version):
+    return hashlib.sha256(f"{sha256}|{parser}|{version}".encode()).hexdigest()
+
+
+def _archivo(clave, cache_dir):
+    return Path(cache_dir) / f"{clave}{EXTENSION}"
+
+
+def leer_cache(clave, cache_dir=CACHE_DIR):
+    """DataFrame guardado con esa clave, o None si no está (o está dañado, o no hay pyarrow)."""
+    if not cache_disponible():
+        return None
+
+    archivo = _archivo(clave, cache_dir)
+    try:
+        tabla = pq.read_table(archivo)
+        dtypes = json.loads(tabla.schema.metadata[META_DTYPES])
+        df = _restaurar_dtypes(tabla.to_pandas(), dtypes)
+    except FileNotFoundError:
+        return None
+    except (pa.ArrowException, OSError, KeyError, TypeError, ValueError):
+        archivo.unlink(missing_ok=True)
+        return None
+
+    os.utime(archivo)  # Marca de uso para el LRU
+    return df
+
+
+def guardar_cache(clave, df, cache_dir=CACHE_DIR, max_mb=MAX_CACHE_MB):
+    """
+    Guarda el DataFrame (escritura atómica) y poda la caché al tamaño máximo.
+    Devuelve False si no se guardó (sin pyarrow o columnas que Parquet no admite).
+    """
+    if not cache_disponible():
+        return False
+
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowException, TypeError, ValueError):
+        return False
+    dtypes = {col: _nombre_dtype(df[col].dtype) for col in df.columns}
+    tabla = tabla.replace_schema_metadata({**(tabla.schema.metadata or {}), META_DTYPES: json.dumps(dtypes)})
+
+    archivo = _archivo(clave, cache_dir)
+    temporal = archivo.with_name(f"{archivo.name}.{os.getpid()}.tmp")
+    pq.write_table(tabla, temporal, compression="zstd")
+    os.replace(temporal, archivo)  # Otro proceso nunca ve un archivo a medio escribir
+
+    podar_cache(cache_dir, max_mb)
+    return True
+
+
+def podar_cache(cache_dir=CACHE_DIR, max_mb=MAX_CACHE_MB):
+    """Borra las entradas usadas hace más tiempo hasta quedar bajo max_mb. Devuelve cuántas borró."""
+    for anterior in Path(cache_dir).glob(f"*{EXTENSION_ANTERIOR}"):
+        anterior.unlink(missing_ok=True)
+
+    entradas = []
+    for archivo in Path(cache_dir).glob(f"*{EXTENSION}"):
+        try:
+            info = archivo.stat()
+        except FileNotFoundError:  # Otro proceso la borró
+            continue
+        entradas.append((info.st_mtime, info.st_size, archivo))
+
+    total = sum(tamano for _, tamano, _ in entradas)
+    limite = max_mb * 1024 * 1024
+    borradas = 0
+    for _, tamano, archivo in sorted(entradas, key=lambda e: e[0]):
+        if total <= limite:
+            break
+        archivo.unlink(missing_ok=True)
+        total -= tamano
+        borradas += 1
+    return borradas
+
+
+def parsear_con_cache(path, parser, version, parsear, sha256, cache_dir=CACHE_DIR, max_mb=MAX_CACHE_MB):
+    """
+    Devuelve (df, desde_cache): el DataFrame de la caché si existe para ese
+    contenido y versión; si no, lo parsea con `parsear(path)` y lo guarda.
+    Sin pyarrow siempre parsea.
+    """
+    clave = clave_cache(sha256, parser, version)
+    df = leer_cache(clave, cache_dir)
+    if df is not None:
+        return df, True
+
+    df = parsear(path)
+    guardar_cache(clave, df, cache_dir, max_mb)
+    return df, False
+
+
+def vaciar_cache(cache_dir=CACHE_DIR):
+    return podar_cache(cache_dir, max_mb=0)
+
+# ==============================
+# MAIN
+# ==============================
+def main():
+    ap = argparse.ArgumentParser(description="Caché de archivos parseados")
+    ap.add_argument("--vaciar", action="store_true", help="Borrar todas las entradas")
+    args = ap.parse_args()
+
+    if args.vaciar:
+        print(f"🧹 {vaciar_cache()} entradas borradas")
+        return
+    if not cache_disponible():
+        print("⚠️ pyarrow no está instalado: la caché de parseo está desactivada")
+
+    entradas = sorted(CACHE_DIR.glob(f"*{EXTENSION}"), key=lambda p: p.stat().st_mtime, reverse=True)
+    total = sum(p.stat().st_size for p in entradas)
+    print(f"📦 {len(entradas)} entradas, {total / 1024 / 1024:.1f} MB de {MAX_CACHE_MB} MB ({CACHE_DIR})")
+    for p in entradas[:20]:
+        usado = time.strftime("%Y-%m-%d %H:%M", time.localtime(p.stat().st_mtime))
+        print(f"   {p.stem[:16]}  {p.stat().st_size / 1024:>9.0f} KB  usada {usado}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,578 @@
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from consultas import abonos_pendientes, facturas_abiertas
+from indice_contrapartes import actualizar_indice, cargar_indice, resolver_rfc_por_nombre
+from tipo_cambio import MONEDA_EMPRESA, convertir_facturas, convertir_movimientos
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+VENTANA_DIAS = 90               # Días máximos entre la emisión de la factura y el abono
+DIAS_ANTES = 5                  # El abono puede llegar hasta N días antes de la emisión
+VENTANA_REFERENCIA_DIAS = 365   # Ventana para aceptar una coincidencia por folio
+TOLERANCIA_CENTAVOS = 100       # Diferencia máxima de monto en la etapa de tolerancia
+MAX_CANDIDATOS = 50             # Candidatos por movimiento en búsquedas por rango
+
+SUFIJO_EMPRESA = MONEDA_EMPRESA.lower()  # Montos convertidos: abonos_mxn, total_mxn
+
+ETAPA_REFERENCIA = "REFERENCIA"
+ETAPA_MONTO_FECHA = "MONTO_FECHA"
+ETAPA_MONTO_TOLERANCIA = "MONTO_TOLERANCIA"
+ETAPA_MULTIPLE = "MULTIPLE"              # Un abono paga varias facturas
+ETAPA_PARCIALIDADES = "PARCIALIDADES"    # Una factura pagada con varios abonos
+
+# Conciliación múltiple (subset-sum acotado)
+MAX_CANDIDATOS_CLIENTE = 24         # Facturas/abonos del cliente que entran a la búsqueda
+PRESUPUESTO_SEGUNDOS = 30.0         # Tiempo total para la etapa múltiple
+PRESUPUESTO_CLIENTE_SEGUNDOS = 2.0  # Tiempo máximo por cliente
+RFC_GENERICOS = ("XAXX010101000", "XEXX010101000")  # Público en general / extranjero
+
+# UUID con o sin guiones (se buscan después de quitar los guiones)
+PATRON_UUID = r"(?<![0-9A-F])[0-9A-F]{32}(?![0-9A-F])"
+# Folio marcado: "F17197", "FACTURA 17652", "fact. 17109", "FACTURA N 17406"...
+PATRON_FOLIO_MARCADO = r"(?<![A-Z])(?:FACTURA|FACT|FAC|FOLIO|F)(?:\s*N[O°º]?)?[\s.:#-]*(\d{3,})(?!\d)"
+# Cualquier número suelto: solo se acepta si además cuadra el monto
+PATRON_FOLIO = r"(?<!\d)\d{3,}(?!\d)"
+
+# Separa monto y día en una sola clave ordenable (centavos * ESCALA + día)
+ESCALA_DIAS = 1 << 20
+
+# ==============================
+# HELPERS
+# ==============================
+def a_centavos(montos):
+    """Convierte una columna de montos a centavos enteros (int64)."""
+    valores = pd.to_numeric(montos, errors="coerce").fillna(0).to_numpy(dtype=float)
+    return np.rint(valores * 100).astype(np.int64)
+
+
+def a_dias(fechas):
+    """Convierte una columna de fechas a número de día (float, NaN si no es fecha)."""
+    fechas = pd.to_datetime(fechas, errors="coerce")
+    dias = fechas.to_numpy(dtype="datetime64[D]").astype(np.int64).astype(float)
+    dias[fechas.isna().to_numpy()] = np.nan
+    return dias
+
+
+def _expandir_rangos(claves_ordenadas, lo, hi, limite):
+    """
+    Para cada par (lo[i], hi[i]) busca con searchsorted el rango de
+    claves_ordenadas dentro de [lo, hi] y lo expande a pares
+    (posición del movimiento, posición en claves_ordenadas).
+    Cada rango se recorta a los `limite` elementos más cercanos a hi.
+    """
+    ini = np.searchsorted(claves_ordenadas, lo, side="left")
+    fin = np.searchsorted(claves_ordenadas, hi, side="right")
+    ini = np.maximum(ini, fin - limite)
+    n = np.maximum(fin - ini, 0)
+
+    pos_mov = np.repeat(np.arange(len(lo)), n)
+    desplazamiento = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    pos_ordenada = np.repeat(ini, n) + desplazamiento
+    return pos_mov, pos_ordenada
+
+
+def _armar_candidatos(movs, facts, pos_mov, pos_fact):
+    """Arma el DataFrame de candidatos (movimiento, factura) a partir de posiciones."""
+    m = movs.iloc[pos_mov]
+    f = facts.iloc[pos_fact]
+
+    diferencia = m["centavos"].to_numpy() - f["centavos"].to_numpy()
+    dias = m["dia"].to_numpy() - f["dia"].to_numpy()
+
+    return pd.DataFrame({
+        "movimiento_id": m["id"].to_numpy(),
+        "factura_id": f["id"].to_numpy(),
+        "abono_centavos": m["centavos"].to_numpy(),
+        "total_centavos": f["centavos"].to_numpy(),
+        "diferencia_centavos": diferencia,
+        "dias": dias,
+        "abs_diferencia": np.abs(diferencia),
+        "abs_dias": np.abs(dias),
+    })
+
+
+def _asignar_uno_a_uno(candidatos, orden):
+    """
+    Elige pares uno a uno de forma greedy: ordena los candidatos por
+    preferencia y toma cada par si ni el movimiento ni la factura fueron
+    usados antes. Una sola pasada lineal sobre los candidatos ordenados.
+    """
+    if candidatos.empty:
+        return candidatos
+
+    candidatos = candidatos.sort_values(orden + ["movimiento_id", "factura_id"], kind="stable")
+
+    usados_mov = set()
+    usados_fact = set()
+    elegidos = []
+
+    for pos, (mov_id, fact_id) in enumerate(zip(
+        candidatos["movimiento_id"].to_numpy(),
+        candidatos["factura_id"].to_numpy(),
+    )):
+        if mov_id in usados_mov or fact_id in usados_fact:
+            continue
+        usados_mov.add(mov_id)
+        usados_fact.add(fact_id)
+        elegidos.append(pos)
+
+    return candidatos.iloc[elegidos]
+
+# ==============================
+# CARGA DE PENDIENTES
+# ==============================
+def _con_tipo_cambio(df, monto, nombre):
+    """Quita (y avisa) las filas en otra moneda sin tipo de cambio a su fecha."""
+    sin_tipo = df[f"{monto}_{SUFIJO_EMPRESA}"].isna() & df[monto].notna()
+    if sin_tipo.any():
+        monedas = ", ".join(sorted(df.loc[sin_tipo, "moneda"].astype(str).unique()))
+        print(f"⚠️ {int(sin_tipo.sum())} {nombre} sin tipo de cambio ({monedas}): no se concilian")
+    return df[~sin_tipo].reset_index(drop=True)
+
+
+def cargar_pendientes(conn):
+    """
+    Lee los abonos y las facturas de ingreso que aún no tienen conciliación.
+    Agrega a ambos las columnas 'centavos' (int64, en la moneda de la
+    empresa) y 'dia' (número de día). Lo que está en otra moneda y no tiene
+    tipo de cambio a su fecha queda fuera.
+    """
+    movs = convertir_movimientos(conn, abonos_pendientes(conn))
+    facts = convertir_facturas(conn, facturas_abiertas(conn))
+
+    movs = _con_tipo_cambio(movs, "abonos", "abonos")
+    facts = _con_tipo_cambio(facts, "total", "facturas")
+
+    movs["centavos"] = a_centavos(movs[f"abonos_{SUFIJO_EMPRESA}"])
+    movs["dia"] = a_dias(movs["fecha"])
+
+    facts["centavos"] = a_centavos(facts[f"total_{SUFIJO_EMPRESA}"])
+    facts["dia"] = a_dias(facts["fecha_emision"])
+
+    return movs, facts
+
+# ==============================
+# ETAPAS
+# ==============================
+def candidatos_referencia(movs, facts, dias_antes=DIAS_ANTES, ventana_dias=VENTANA_REFERENCIA_DIAS,
+                          tolerancia_centavos=TOLERANCIA_CENTAVOS):
+    """
+    Etapa 1: UUID o folio de la factura encontrado en referencia_movimiento /
+    comentario_movimiento. Se extraen todos los tokens de una vez y se cruzan
+    con las claves de las facturas con un hash join (merge).
+    Las coincidencias por folio además deben caer en la ventana de fechas.
+    """
+    texto = (
+        movs["referencia_movimiento"].fillna("").astype(str)
+        + " "
+        + movs["comentario_movimiento"].fillna("").astype(str)
+    ).str.upper()
+
+    tokens_uuid = texto.str.replace("-", "", regex=False).str.findall(PATRON_UUID).explode().dropna()
+    tokens_marcados = texto.str.findall(PATRON_FOLIO_MARCADO).explode().dropna().str.lstrip("0")
+    tokens_folio = texto.str.findall(PATRON_FOLIO).explode().dropna().str.lstrip("0")
+
+    tokens = pd.concat([
+        pd.DataFrame({"pos_mov": tokens_uuid.index, "clave": "U" + tokens_uuid.astype(str), "prioridad": 0}),
+        pd.DataFrame({"pos_mov": tokens_marcados.index, "clave": "F" + tokens_marcados.astype(str), "prioridad": 1}),
+        pd.DataFrame({"pos_mov": tokens_folio.index, "clave": "F" + tokens_folio.astype(str), "prioridad": 2}),
+    ], ignore_index=True)
+    tokens = tokens[tokens["clave"].str.len() > 1]
+    tokens = tokens.sort_values("prioridad", kind="stable").drop_duplicates(["pos_mov", "clave"])
+
+    uuid_fact = facts["uuid"].fillna("").astype(str).str.upper().str.replace("-", "", regex=False)
+    folio_fact = facts["folio"].fillna("").astype(str).str.strip().str.lstrip("0")
+
+    claves_fact = pd.concat([
+        pd.DataFrame({"pos_fact": facts.index, "clave": "U" + uuid_fact}),
+        pd.DataFrame({"pos_fact": facts.index, "clave": "F" + folio_fact}),
+    ], ignore_index=True)
+    claves_fact = claves_fact[claves_fact["clave"].str.len() > 1]
+
+    cruce = tokens.merge(claves_fact, on="clave")
+
+    candidatos = _armar_candidatos(movs, facts, cruce["pos_mov"].to_numpy(), cruce["pos_fact"].to_numpy())
+    candidatos["prioridad"] = cruce["prioridad"].to_numpy()
+
+    # El folio es una clave débil: exigir que la fecha sea coherente y, si el
+    # número no viene marcado como factura, también que cuadre el monto
+    en_ventana = candidatos["dias"].between(-dias_antes, ventana_dias)
+    cuadra_monto = candidatos["abs_diferencia"] <= tolerancia_centavos
+    candidatos = candidatos[
+        (candidatos["prioridad"] == 0)
+        | ((candidatos["prioridad"] == 1) & en_ventana)
+        | ((candidatos["prioridad"] == 2) & en_ventana & cuadra_monto)
+    ]
+
+    return candidatos
+
+
+def candidatos_monto_fecha(movs, facts, dias_antes=DIAS_ANTES, ventana_dias=VENTANA_DIAS):
+    """
+    Etapa 2: monto exacto y fecha de emisión dentro de la ventana.
+    Las facturas se ordenan por la clave (centavos, día) y cada abono
+    busca su rango con searchsorted, sin comparar todos contra todos.
+    """
+    facts = facts[facts["dia"].notna()].reset_index(drop=True)
+    movs = movs[movs["dia"].notna()].reset_index(drop=True)
+
+    claves = facts["centavos"].to_numpy() * ESCALA_DIAS + facts["dia"].to_numpy().astype(np.int64)
+    orden = np.argsort(claves, kind="stable")
+    claves = claves[orden]
+
+    base = movs["centavos"].to_numpy() * ESCALA_DIAS
+    dia_mov = movs["dia"].to_numpy().astype(np.int64)
+    pos_mov, pos_ordenada = _expandir_rangos(
+        claves,
+        base + dia_mov - ventana_dias,
+        base + dia_mov + dias_antes,
+        MAX_CANDIDATOS,
+    )
+
+    return _armar_candidatos(movs, facts, pos_mov, orden[pos_ordenada])
+
+
+def candidatos_monto_tolerancia(movs, facts, dias_antes=DIAS_ANTES, ventana_dias=VENTANA_DIAS,
+                                tolerancia_centavos=TOLERANCIA_CENTAVOS):
+    """
+    Etapa 3: monto dentro de la tolerancia y fecha dentro de la ventana.
+    Igual que la etapa 2 (clave (centavos, día) con searchsorted), una vez
+    por cada centavo de diferencia: cada rango trae solo facturas dentro de
+    la ventana de fechas, así que el recorte a MAX_CANDIDATOS no deja fuera
+    pares válidos cuando un monto se repite mucho. De todos los rangos se
+    quedan, por abono, los MAX_CANDIDATOS de menor diferencia y distancia.
+    """
+    facts = facts[facts["dia"].notna()].reset_index(drop=True)
+    movs = movs[movs["dia"].notna()].reset_index(drop=True)
+
+    claves = facts["centavos"].to_numpy() * ESCALA_DIAS + facts["dia"].to_numpy().astype(np.int64)
+    orden = np.argsort(claves, kind="stable")
+    claves = claves[orden]
+
+    abono = movs["centavos"].to_numpy()
+    dia_mov = movs["dia"].to_numpy().astype(np.int64)
+
+    posiciones_mov, posiciones_fact = [], []
+    for diferencia in range(-tolerancia_centavos, tolerancia_centavos + 1):
+        base = (abono - diferencia) * ESCALA_DIAS
+        pos_mov, pos_ordenada = _expandir_rangos(
+            claves,
+            base + dia_mov - ventana_dias,
+            base + dia_mov + dias_antes,
+            MAX_CANDIDATOS,
+        )
+        posiciones_mov.append(pos_mov)
+        posiciones_fact.append(orden[pos_ordenada])
+
+    candidatos = _armar_candidatos(movs, facts, np.concatenate(posiciones_mov), np.concatenate(posiciones_fact))
+    candidatos = candidatos.sort_values(["movimiento_id", "abs_diferencia", "abs_dias"], kind="stable")
+    return candidatos[candidatos.groupby("movimiento_id").cumcount() < MAX_CANDIDATOS]
+
+
+ETAPAS = [
+    (ETAPA_REFERENCIA, candidatos_referencia, ["prioridad", "abs_diferencia", "abs_dias"]),
+    (ETAPA_MONTO_FECHA, candidatos_monto_fecha, ["abs_dias"]),
+    (ETAPA_MONTO_TOLERANCIA, candidatos_monto_tolerancia, ["abs_diferencia", "abs_dias"]),
+]
+
+# ==============================
+# CONCILIACIÓN MÚLTIPLE (SUBSET-SUM)
+# ==============================
+def resolver_rfc_movimientos(conn, movs):
+    """
+    Asigna a cada abono el RFC del cliente que probablemente lo pagó:
+    1) cuenta_origen ya conciliada antes con facturas de un solo RFC
+    2) nombre_contraparte buscado en el índice de n-gramas de razon_receptor
+       (indice_contrapartes), solo si el mejor candidato es claro
+
+    Devuelve una Series (mismo índice que movs) con el RFC o NaN.
+    """
+    rfc = pd.Series(np.nan, index=movs.index, dtype=object)
+
+    # 1) Historial de conciliaciones por cuenta de origen
+    historial = pd.read_sql("""
+        SELECT m.cuenta_origen, f.rfc_receptor, COUNT(*) AS n
+        FROM conciliaciones c
+        JOIN movimientos_bancarios m ON m.id = c.movimiento_id
+        JOIN facturas_emitidas_mx f ON f.id = c.factura_id
+        WHERE m.cuenta_origen IS NOT NULL AND f.rfc_receptor IS NOT NULL
+        GROUP BY m.cuenta_origen, f.rfc_receptor
+    """, conn)
+    historial = historial.sort_values("n", ascending=False).drop_duplicates("cuenta_origen")
+    por_cuenta = movs["cuenta_origen"].map(historial.set_index("cuenta_origen")["rfc_receptor"])
+    rfc = rfc.fillna(por_cuenta)
+
+    # 2) Nombre de la contraparte contra el índice de n-gramas de razones sociales
+    buscar = rfc.isna() & movs["nombre_contraparte"].notna()
+    if buscar.any():
+        actualizar_indice(conn)
+        indice = cargar_indice(conn)
+        rfc = rfc.fillna(resolver_rfc_por_nombre(indice, movs.loc[buscar, "nombre_contraparte"]).dropna())
+
+    return rfc
+
+
+def _sumas_subconjuntos(valores):
+    """Todas las sumas de subconjuntos de `valores` (con su máscara de bits y cantidad)."""
+    h = len(valores)
+    mascaras = np.arange(1 << h, dtype=np.int64)
+    bits = (mascaras[:, None] >> np.arange(h)) & 1
+    return bits @ valores, bits.sum(axis=1), mascaras
+
+
+def buscar_combinacion(objetivo, valores, tolerancia_centavos=TOLERANCIA_CENTAVOS, min_items=2):
+    """
+    Busca un subconjunto de `valores` (centavos enteros) cuya suma quede a
+    `tolerancia_centavos` o menos de `objetivo`, con al menos `min_items`
+    elementos. Meet-in-the-middle: se enumeran las sumas de cada mitad y se
+    cruzan con searchsorted sobre las sumas ordenadas de la otra mitad.
+
+    Devuelve las posiciones elegidas (la combinación de menor diferencia y,
+    a igual diferencia, con menos elementos) o None.
+    """
+    valores = np.asarray(valores, dtype=np.int64)
+    if len(valores) < min_items:
+        return None
+
+    mitad = len(valores) // 2
+    suma_a, cant_a, mask_a = _sumas_subconjuntos(valores[:mitad])
+    suma_b, cant_b, mask_b = _sumas_subconjuntos(valores[mitad:])
+
+    orden = np.argsort(suma_b, kind="stable")
+    suma_b, cant_b, mask_b = suma_b[orden], cant_b[orden], mask_b[orden]
+
+    # Para cada suma de la mitad A, la suma de B más cercana al resto entre
+    # las de cada cantidad de elementos: si se buscara entre todas juntas, la
+    # más cercana podría no llegar a min_items y tapar otra que sí cumple
+    resto = objetivo - suma_a
+    sin_solucion = np.iinfo(np.int64).max
+    mejor_diff = np.full(len(suma_a), sin_solucion)
+    mejor_cant = np.zeros(len(suma_a), dtype=np.int64)
+    mejor_idx = np.zeros(len(suma_a), dtype=np.int64)
+    for cantidad in np.unique(cant_b):
+        posiciones = np.flatnonzero(cant_b == cantidad)  # Siguen ordenadas por suma
+        sumas = suma_b[posiciones]
+        cant = cant_a + cantidad
+        idx = np.searchsorted(sumas, resto)
+        for cand in (np.minimum(idx, len(sumas) - 1), np.maximum(idx - 1, 0)):
+            diff = np.abs(resto - sumas[cand])
+            diff[cant < min_items] = sin_solucion
+            mejora = (diff < mejor_diff) | ((diff == mejor_diff) & (cant < mejor_cant))
+            mejor_diff[mejora] = diff[mejora]
+            mejor_cant[mejora] = cant[mejora]
+            mejor_idx[mejora] = posiciones[cand[mejora]]
+
+    validos = np.flatnonzero(mejor_diff <= tolerancia_centavos)
+    if len(validos) == 0:
+        return None
+    i = validos[np.lexsort((mejor_cant[validos], mejor_diff[validos]))[0]]
+
+    elegidos = [k for k in range(mitad) if (mask_a[i] >> k) & 1]
+    elegidos += [mitad + k for k in range(len(valores) - mitad) if (mask_b[mejor_idx[i]] >> k) & 1]
+    return elegidos
+
+
+def _buscar_grupo(objetivos, candidatos, desde_dias, hasta_dias, tolerancia_centavos, vence):
+    """
+    Para cada objetivo (en orden de fecha) busca una combinación entre los
+    candidatos libres cuya fecha caiga en [dia + desde_dias, dia + hasta_dias].
+    Devuelve una lista de (posición objetivo, posiciones candidatos, diferencia).
+    """
+    libres = np.ones(len(candidatos), dtype=bool)
+    dia_cand = candidatos["dia"].to_numpy()
+    cent_cand = candidatos["centavos"].to_numpy()
+    encontrados = []
+
+    for pos, (dia, centavos) in enumerate(zip(objetivos["dia"].to_numpy(), objetivos["centavos"].to_numpy())):
+        if time.perf_counter() > vence:
+            break
+
+        aptos = np.flatnonzero(
+            libres
+            & (dia_cand >= dia + desde_dias)
+            & (dia_cand <= dia + hasta_dias)
+            & (cent_cand <= centavos + tolerancia_centavos)
+        )
+        if len(aptos) < 2:
+            continue
+
+        # Los más cercanos en fecha, hasta el límite por cliente
+        aptos = aptos[np.argsort(np.abs(dia_cand[aptos] - dia), kind="stable")[:MAX_CANDIDATOS_CLIENTE]]
+
+        combinacion = buscar_combinacion(centavos, cent_cand[aptos], tolerancia_centavos)
+        if combinacion is None:
+            continue
+
+        elegidos = aptos[combinacion]
+        libres[elegidos] = False
+        encontrados.append((pos, elegidos, int(centavos - cent_cand[elegidos].sum())))
+
+    return encontrados
+
+
+def conciliar_multiples(conn, movs, facts, dias_antes=DIAS_ANTES, ventana_dias=VENTANA_DIAS,
+                        tolerancia_centavos=TOLERANCIA_CENTAVOS):
+    """
+    Etapa múltiple sobre lo que quedó pendiente, agrupado por cliente (RFC):
+    - MULTIPLE: un abono que paga varias facturas abiertas del cliente
+    - PARCIALIDADES: una factura pagada con varios abonos del cliente
+
+    La búsqueda es un subset-sum acotado sobre centavos enteros, con
+    MAX_CANDIDATOS_CLIENTE por búsqueda, PRESUPUESTO_CLIENTE_SEGUNDOS por
+    cliente y PRESUPUESTO_SEGUNDOS para toda la etapa.
+    """
+    columnas = ["movimiento_id", "factura_id", "etapa", "monto_aplicado", "diferencia", "dias"]
+    filas = []
+
+    movs = movs.assign(rfc=resolver_rfc_movimientos(conn, movs))
+    movs = movs[movs["rfc"].notna() & movs["dia"].notna() & ~movs["rfc"].isin(RFC_GENERICOS)]
+    facts = facts[facts["rfc_receptor"].notna() & facts["dia"].notna()]
+    facts_por_rfc = dict(tuple(facts.groupby("rfc_receptor")))
+
+    vence_etapa = time.perf_counter() + PRESUPUESTO_SEGUNDOS
+
+    for rfc, movs_cliente in movs.groupby("rfc"):
+        facts_cliente = facts_por_rfc.get(rfc)
+        if facts_cliente is None:
+            continue
+        if time.perf_counter() > vence_etapa:
+            break
+        vence = min(vence_etapa, time.perf_counter() + PRESUPUESTO_CLIENTE_SEGUNDOS)
+
+        movs_cliente = movs_cliente.sort_values("dia").reset_index(drop=True)
+        facts_cliente = facts_cliente.sort_values("dia").reset_index(drop=True)
+
+        # Un abono -> varias facturas emitidas antes del abono
+        usados_fact = set()
+        usados_mov = set()
+        for pos, elegidos, diferencia in _buscar_grupo(
+            movs_cliente, facts_cliente, -ventana_dias, dias_antes, tolerancia_centavos, vence,
+        ):
+            mov = movs_cliente.iloc[pos]
+            usados_mov.add(pos)
+            for k in elegidos:
+                fact = facts_cliente.iloc[k]
+                usados_fact.add(k)
+                filas.append((mov["id"], fact["id"], ETAPA_MULTIPLE, fact["centavos"] / 100,
+                              diferencia / 100, mov["dia"] - fact["dia"]))
+
+        # Una factura -> varios abonos posteriores a la emisión
+        movs_libres = movs_cliente.drop(index=list(usados_mov)).reset_index(drop=True)
+        facts_libres = facts_cliente.drop(index=list(usados_fact)).reset_index(drop=True)
+        for pos, elegidos, diferencia in _buscar_grupo(
+            facts_libres, movs_libres, -dias_antes, ventana_dias, tolerancia_centavos, vence,
+        ):
+            fact = facts_libres.iloc[pos]
+            for k in elegidos:
+                mov = movs_libres.iloc[k]
+                filas.append((mov["id"], fact["id"], ETAPA_PARCIALIDADES, mov["centavos"] / 100,
+                              diferencia / 100, mov["dia"] - fact["dia"]))
+
+    return pd.DataFrame(filas, columns=columnas)
+
+# ==============================
+# MOTOR
+# ==============================
+def conciliar_pendientes(movs, facts):
+    """
+    Ejecuta las etapas en orden sobre los pendientes. Lo conciliado en una
+    etapa ya no participa en las siguientes.
+
+    Devuelve un DataFrame con: movimiento_id, factura_id, etapa,
+    monto_aplicado, diferencia, dias
+    """
+    resultados = []
+
+    for etapa, buscar_candidatos, orden in ETAPAS:
+        if movs.empty or facts.empty:
+            break
+
+        elegidos = _asignar_uno_a_uno(buscar_candidatos(movs, facts), orden)
+        if elegidos.empty:
+            continue
+
+        elegidos = elegidos.assign(etapa=etapa)
+        resultados.append(elegidos)
+
+        movs = movs[~movs["id"].isin(elegidos["movimiento_id"])].reset_index(drop=True)
+        facts = facts[~facts["id"].isin(elegidos["factura_id"])].reset_index(drop=True)
+
+    columnas = ["movimiento_id", "factura_id", "etapa", "monto_aplicado", "diferencia", "dias"]
+    if not resultados:
+        return pd.DataFrame(columns=columnas)
+
+    matches = pd.concat(resultados, ignore_index=True)
+    matches["monto_aplicado"] = np.minimum(matches["abono_centavos"], matches["total_centavos"]) / 100
+    matches["diferencia"] = matches["diferencia_centavos"] / 100
+    return matches[columnas]
+
+
+def guardar_conciliaciones(conn, matches):
+    """Inserta los pares en la tabla conciliaciones en una sola transacción."""
+    dias = matches["dias"].astype(object).where(matches["dias"].notna(), None)
+    filas = zip(
+        matches["movimiento_id"].astype(int).tolist(),
+        matches["factura_id"].astype(int).tolist(),
+        matches["etapa"].tolist(),
+        matches["monto_aplicado"].astype(float).tolist(),
+        matches["diferencia"].astype(float).tolist(),
+        [None if d is None else int(d) for d in dias],
+    )
+
+    with conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO conciliaciones (
+                movimiento_id, factura_id, etapa, monto_aplicado, diferencia, dias
+            ) VALUES (?, ?, ?, ?, ?, ?)
+        """, filas)
+
+
+def conciliar(db_path=DB_PATH):
+    """
+    Concilia los abonos pendientes contra las facturas de ingreso pendientes
+    y guarda el resultado en la tabla conciliaciones.
+    Devuelve el DataFrame de pares encontrados.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        movs, facts = cargar_pendientes(conn)
+        matches = conciliar_pendientes(movs, facts)
+        guardar_conciliaciones(conn, matches)
+
+        # Lo que quedó sin par uno a uno pasa a la búsqueda de combinaciones
+        movs = movs[~movs["id"].isin(matches["movimiento_id"])]
+        facts = facts[~facts["id"].isin(matches["factura_id"])]
+        multiples = conciliar_multiples(conn, movs, facts)
+        guardar_conciliaciones(conn, multiples)
+    finally:
+        conn.close()
+
+    return pd.concat([matches, multiples], ignore_index=True)
+
+# ==============================
+# MAIN
+# ==============================
+def main():
+    print("🔎 Conciliando abonos contra facturas emitidas:", DB_PATH)
+
+    inicio = time.perf_counter()
+    matches = conciliar()
+    segundos = time.perf_counter() - inicio
+
+    for etapa in [e for e, _, _ in ETAPAS] + [ETAPA_MULTIPLE, ETAPA_PARCIALIDADES]:
+        print(f"🟢 {etapa}: {int((matches['etapa'] == etapa).sum())}")
+
+    print(f"⏱️ Conciliación terminada en {segundos:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from bulk_loader import COLUMNAS_MOVIMIENTOS
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+TIPO_INGRESO = "I - Ingreso"
+
+# ==============================
+# CONSULTAS POR RANGO
+# ==============================
+# Consultas compartidas por los exportadores y la conciliación. Cada una
+# está escrita para usar un índice de la migración 003_indices_consulta
+# (ver migraciones.py); verificar_indices() lo comprueba con EXPLAIN QUERY PLAN.
+#
+# Las funciones sql_* devuelven (query, params) para leer por bloques
+# (exportador.exportar_consulta); las demás ejecutan y devuelven un DataFrame.
+
+# Columnas de los reportes (sin las internas dedup_key y batch_id: un hash
+# de 64 bits que Excel guarda como double pierde dígitos). "*" queda para
+# los usos internos de sql_movimientos
+COLUMNAS_MOVIMIENTOS_EXPORT = ["id", *COLUMNAS_MOVIMIENTOS, "created_at"]
+
+COLUMNAS_FACTURAS_EXPORT = [
+    "id",
+    "uuid",
+    "folio",
+    "tipo",
+    "fecha_emision",
+    "fecha_certificacion",
+    "rfc_receptor",
+    "razon_receptor",
+    "estado",
+    "estado_cancelacion",
+    "claves_de_productos",
+    "moneda",
+    "subtotal",
+    "iva_trasladado",
+    "total",
+    "created_at",
+    "updated_at",
+]
+
+
+def sql_movimientos(banco=None, fecha_desde=None, fecha_hasta=None, columnas="*"):
+    """
+    Movimientos de un banco (o de todos) entre dos fechas YYYY-MM-DD,
+    ordenados por fecha e id. columnas: "*" o una lista de columnas.
+    Índices: (banco, fecha) con banco, (fecha) sin banco.
+    """
+    condiciones, params = [], []
+    if banco is not None:
+        condiciones.append("banco = ?")
+        params.append(banco)
+    if fecha_desde is not None:
+        condiciones.append("fecha >= ?")
+        params.append(fecha_desde)
+    if fecha_hasta is not None:
+        condiciones.append("fecha <= ?")
+        params.append(fecha_hasta)
+
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    query = f"""
+        SELECT {columnas if isinstance(columnas, str) else ", ".join(columnas)}
+        FROM movimientos_bancarios
+        {where}
+        ORDER BY fecha ASC, id ASC
+    """
+    return query, tuple(params)
+
+
+def sql_facturas(fecha_desde=None, fecha_hasta=None, columnas=COLUMNAS_FACTURAS_EXPORT):
+    """
+    Facturas emitidas entre dos fechas YYYY-MM-DD (el día final completo:
+    fecha_emision trae hora), ordenadas por fecha de emisión.
+    Índice: (fecha_emision).
+    """
+    condiciones, params = [], []
+    if fecha_desde is not None:
+        condiciones.append("fecha_emision >= ?")
+        params.append(fecha_desde)
+    if fecha_hasta is not None:
+        condiciones.append("fecha_emision < date(?, '+1 day')")
+        params.append(fecha_hasta)
+
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    query = f"""
+        SELECT {", ".join(columnas)}
+        FROM facturas_emitidas_mx
+        {where}
+        ORDER BY fecha_emision ASC
+    """
+    return query, tuple(params)
+
+
+def movimientos_por_rango(conn, banco=None, fecha_desde=None, fecha_hasta=None, columnas="*"):
+    query, params = sql_movimientos(banco, fecha_desde, fecha_hasta, columnas)
+    return pd.read_sql(query, conn, params=params)
+
+
+def movimientos_por_referencia(conn, referencias):
+    """Movimientos cuya referencia_movimiento es alguna de las dadas. Índice: (referencia_movimiento)."""
+    referencias = list(dict.fromkeys(referencias))
+    if not referencias:
+        return pd.read_sql("SELECT * FROM movimientos_bancarios WHERE 0", conn)
+
+    # De a 500 para no pasar el límite de parámetros de SQLite
+    bloques = [
+        pd.read_sql(f"""
+            SELECT *
+            FROM movimientos_bancarios
+            WHERE referencia_movimiento IN ({", ".join("?" * len(bloque))})
+        """, conn, params=tuple(bloque))
+        for bloque in (referencias[i:i + 500] for i in range(0, len(referencias), 500))
+    ]
+    return pd.concat(bloques, ignore_index=True).sort_values("id", ignore_index=True)
+
+# ==============================
+# PENDIENTES DE CONCILIAR
+# ==============================
+def sql_abonos_pendientes(banco=None, fecha_desde=None, fecha_hasta=None):
+    """Abonos sin conciliación, opcionalmente acotados por banco / rango de fechas."""
+    condiciones, params = ["abonos > 0", "id NOT IN (SELECT movimiento_id FROM conciliaciones)"], []
+    if banco is not None:
+        condiciones.append("banco = ?")
+        params.append(banco)
+    if fecha_desde is not None:
+        condiciones.append("fecha >= ?")
+        params.append(fecha_desde)
+    if fecha_hasta is not None:
+        condiciones.append("fecha <= ?")
+        params.append(fecha_hasta)
+
+    query = f"""
+        SELECT id, fecha, abonos, moneda, cuenta_origen, nombre_contraparte,
+               referencia_movimiento, comentario_movimiento
+        FROM movimientos_bancarios
+        WHERE {" AND ".join(condiciones)}
+        ORDER BY id
+    """
+    return query, tuple(params)
+
+
+def sql_facturas_abiertas(rfc=None):
+    """
+    Facturas de ingreso no canceladas y sin conciliación; con rfc, solo las
+    de ese cliente (índice (rfc_receptor, fecha_emision)).
+    """
+    condiciones = [
+        "tipo = ?",
+        "UPPER(COALESCE(estado, '')) NOT LIKE 'CANCELAD%'",
+        "id NOT IN (SELECT factura_id FROM conciliaciones)",
+    ]
+    params = [TIPO_INGRESO]
+    if rfc is not None:
+        condiciones.insert(0, "rfc_receptor = ?")
+        params.insert(0, rfc)
+
+    query = f"""
+        SELECT id, uuid, folio, fecha_emision, rfc_receptor, razon_receptor, moneda, total
+        FROM facturas_emitidas_mx
+        WHERE {" AND ".join(condiciones)}
+        ORDER BY {"fecha_emision, id" if rfc is not None else "id"}
+    """
+    return query, tuple(params)
+
+
+def abonos_pendientes(conn, banco=None, fecha_desde=None, fecha_hasta=None):
+    query, params = sql_abonos_pendientes(banco, fecha_desde, fecha_hasta)
+    return pd.read_sql(query, conn, params=params)
+
+
+def facturas_abiertas(conn, rfc=None):
+    query, params = sql_facturas_abiertas(rfc)
+    return pd.read_sql(query, conn, params=params)
+
+# ==============================
+# ÚLTIMO MES REGISTRADO
+# ==============================
+def _rango_mes(max_fecha):
+    """Del día 1 del mes de max_fecha hasta max_fecha (YYYY-MM-DD); None si no hay fecha."""
+    if not max_fecha:
+        return None
+    max_fecha = pd.to_datetime(max_fecha)
+    return max_fecha.replace(day=1).strftime("%Y-%m-%d"), max_fecha.strftime("%Y-%m-%d")
+
+
+def ultimo_mes_movimientos(conn, banco=None):
+    """Rango del último mes con movimientos (de un banco o de todos). Índices: (banco, fecha) / (fecha)."""
+    if banco is None:
+        fila = conn.execute("SELECT MAX(fecha) FROM movimientos_bancarios").fetchone()
+    else:
+        fila = conn.execute("SELECT MAX(fecha) FROM movimientos_bancarios WHERE banco = ?", (banco,)).fetchone()
+    return _rango_mes(fila[0])
+
+
+def ultimo_mes_facturas(conn):
+    """Rango del último mes con facturas emitidas. Índice: (fecha_emision)."""
+    return _rango_mes(conn.execute("SELECT MAX(fecha_emision) FROM facturas_emitidas_mx").fetchone()[0])
+
+# ==============================
+# VERIFICACIÓN DE ÍNDICES
+# ==============================
+def plan_consulta(conn, query, params=()):
+    """Líneas de EXPLAIN QUERY PLAN de la consulta."""
+    return [fila[3] for fila in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+
+def _consultas_a_verificar():
+    """
+    (nombre, query, params, índice que debe aparecer en el plan, si además
+    debe salir ordenada por el índice, sin B-tree temporal).
+    """
+    movimientos_banco = sql_movimientos("BBVA", "2025-01-01", "2025-01-31")
+    movimientos_todos = sql_movimientos(None, "2025-01-01", "2025-01-31")
+    facturas_rango = sql_facturas("2025-01-01", "2025-01-31")
+    return [
+        ("movimientos por banco y rango", *movimientos_banco, "idx_movimientos_banco_fecha", True),
+        ("movimientos por rango", *movimientos_todos, "idx_movimientos_fecha", True),
+        ("último mes de un banco", "SELECT MAX(fecha) FROM movimientos_bancarios WHERE banco = ?",
+         ("BBVA",), "idx_movimientos_banco_fecha", False),
+        ("último mes", "SELECT MAX(fecha) FROM movimientos_bancarios", (), "idx_movimientos_fecha", False),
+        ("movimientos por referencia",
+         "SELECT * FROM movimientos_bancarios WHERE referencia_movimiento IN (?)", ("X",),
+         "idx_movimientos_referencia", False),
+        ("facturas por rango", *facturas_rango, "idx_facturas_fecha", True),
+        ("último mes de facturas", "SELECT MAX(fecha_emision) FROM facturas_emitidas_mx", (), "idx_facturas_fecha", False),
+        ("abonos pendientes de un banco", *sql_abonos_pendientes("BBVA", "2025-01-01", "2025-01-31"),
+         "idx_movimientos_banco_fecha", False),
+        ("facturas abiertas por RFC", *sql_facturas_abiertas("XAXX010101000"), "idx_facturas_rfc_fecha", True),
+    ]
+
+
+def verificar_indices(conn):
+    """
+    Revisa con EXPLAIN QUERY PLAN que cada consulta del módulo use su índice
+    (y, las que lo piden, que no ordenen con un B-tree temporal). Devuelve una lista de dicts:
+    consulta, indice, ok, plan.
+    """
+    resultado = []
+    for nombre, query, params, indice, ordenada in _consultas_a_verificar():
+        plan = plan_consulta(conn, query, params)
+        usa_indice = any(indice in linea for linea in plan)
+        ordena_aparte = any("USE TEMP B-TREE" in linea for linea in plan)
+        resultado.append({
+            "consulta": nombre,
+            "indice": indice,
+            "ok": usa_indice and not (ordenada and ordena_aparte),
+            "plan": plan,
+        })
+    return resultado
+
+
+def main():
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        for r in verificar_indices(conn):
+            print(f"{'🟢' if r['ok'] else '🔴'} {r['consulta']}: {' | '.join(r['plan'])}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
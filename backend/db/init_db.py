@@ -1,15 +1,45 @@
 import sqlite3
+import sys
 from pathlib import Path
 
 BASE_DIR = Path(__file__).parent
 DB_PATH = BASE_DIR / "conciliador.db"
 
+# Las migraciones viven junto a los parsers (usan bulk_loader)
+sys.path.insert(0, str(BASE_DIR.parent))
+from migraciones import aplicar_migraciones  # noqa: E402
+
 # Crear carpeta si no existe
 DB_PATH.parent.mkdir(exist_ok=True)
 
 conn = sqlite3.connect(DB_PATH)
 cursor = conn.cursor()
 
+# Manifiesto de cargas: un registro por archivo cargado (ver manifiesto.py)
+cursor.execute("""
+CREATE TABLE IF NOT EXISTS ingest_batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+    archivo TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+
+    parser TEXT NOT NULL,
+    parser_version TEXT NOT NULL,
+
+    filas INTEGER,
+    insertados INTEGER,
+
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE (sha256, parser, parser_version)
+);
+""")
+
+cursor.execute("""
+CREATE INDEX IF NOT EXISTS idx_ingest_batches_archivo
+ON ingest_batches (archivo);
+""")
+
 cursor.execute("""
 CREATE TABLE IF NOT EXISTS movimientos_bancarios (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -37,25 +67,116 @@ CREATE TABLE IF NOT EXISTS movimientos_bancarios (
     saldo REAL,
     neto REAL,
 
+    batch_id INTEGER REFERENCES ingest_batches (id),
+
+    -- Hash de 64 bits de fecha, banco, cuenta y montos en centavos
+    -- (ver bulk_loader.clave_dedup): evita duplicados con un índice chico
+    dedup_key INTEGER NOT NULL UNIQUE,
+
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+""")
+
+cursor.execute("""
+CREATE TABLE IF NOT EXISTS facturas_emitidas_mx (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+    uuid TEXT NOT NULL UNIQUE,
+    folio TEXT,
+    tipo TEXT,
+
+    fecha_emision TEXT,
+    fecha_certificacion TEXT,
+
+    rfc_receptor TEXT,
+    razon_receptor TEXT,
+
+    claves_de_productos TEXT,
+    uso_cfdi TEXT,
+
+    estado TEXT,
+    fecha_proceso_cancelacion TEXT,
+    estado_cancelacion TEXT,
+
+    moneda TEXT,
+    subtotal REAL,
+    iva_trasladado REAL,
+    total REAL,
+
+    extras TEXT,
+
+    contenido_hash TEXT,  -- Detecta cambios al recargar (parse_facturas_emitidas.guardar_facturas)
+    version INTEGER,      -- Crece en cada inserción / cambio: marca de sync_postgres.py
+
     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+""")
+
+cursor.execute("""
+CREATE TABLE IF NOT EXISTS conciliaciones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+    movimiento_id INTEGER NOT NULL REFERENCES movimientos_bancarios (id),
+    factura_id INTEGER NOT NULL REFERENCES facturas_emitidas_mx (id),
+
+    etapa TEXT NOT NULL,
+
+    monto_aplicado REAL,
+    diferencia REAL,
+    dias INTEGER,
+
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE (movimiento_id, factura_id)
+);
+""")
+
+cursor.execute("""
+CREATE TABLE IF NOT EXISTS contrapartes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
 
-    UNIQUE (
-        fecha,
-        banco,
-        cuenta,
-        tipo_documento,
-        descripcion,
-        comentario_movimiento,
-        referencia_movimiento,
-        abonos,
-        cargos,
-        saldo
-    )
+    rfc_receptor TEXT NOT NULL,
+    razon_receptor TEXT NOT NULL,
+    clave TEXT NOT NULL,
+
+    UNIQUE (rfc_receptor, razon_receptor)
 );
 """)
 
+# Índice invertido de n-gramas de la razón social (ver indice_contrapartes.py)
+cursor.execute("""
+CREATE TABLE IF NOT EXISTS contrapartes_ngramas (
+    ngrama TEXT NOT NULL,
+    contraparte_id INTEGER NOT NULL REFERENCES contrapartes (id),
+
+    PRIMARY KEY (ngrama, contraparte_id)
+) WITHOUT ROWID;
+""")
+
+conn.commit()
+conn.close()
+
+# ==============================
+# MIGRACIONES (batch_id y dedup_key en bases anteriores; índices de consulta;
+# tabla tipos_cambio)
+# ==============================
+for nombre, detalle in aplicar_migraciones(DB_PATH):
+    print(f"🔧 Migración {nombre}: {detalle}")
+
+# ==============================
+# ÍNDICES (después de migrar: usan columnas nuevas)
+# ==============================
+conn = sqlite3.connect(DB_PATH)
+
+# Para revertir una carga con un solo DELETE ... WHERE batch_id = ?
+conn.execute("""
+CREATE INDEX IF NOT EXISTS idx_movimientos_batch
+ON movimientos_bancarios (batch_id);
+""")
+
 conn.commit()
 conn.close()
 
-print("✅ Base de datos y tabla creadas correctamente")
+print("✅ Base de datos y tablas creadas correctamente")
 print(f"📁 Ruta: {DB_PATH}")
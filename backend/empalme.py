@@ -0,0 +1,172 @@
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bulk_loader import clave_dedup, guardar_movimientos
+from esquema import centavos
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+# ==============================
+# HELPERS
+# ==============================
+def cargar_cola(conn, banco, cuenta, desde):
+    """
+    Movimientos guardados de la misma cuenta desde la fecha `desde`, en el
+    orden en que se insertaron (id), que es el orden de la cartola.
+    """
+    return pd.read_sql("""
+        SELECT id, fecha, abonos, cargos, saldo, dedup_key
+        FROM movimientos_bancarios
+        WHERE banco = ? AND cuenta IS ? AND fecha >= ?
+        ORDER BY id
+    """, conn, params=(banco, cuenta, desde))
+
+
+def largo_solape(cola, nuevas):
+    """
+    Largo del sufijo más largo de `cola` que es a la vez prefijo de `nuevas`
+    (secuencias de claves). KMP: O(len(cola) + len(nuevas)).
+    """
+    if not len(cola) or not len(nuevas):
+        return 0
+
+    # Función de prefijos de `nuevas`
+    prefijo = [0] * len(nuevas)
+    k = 0
+    for i in range(1, len(nuevas)):
+        while k and nuevas[i] != nuevas[k]:
+            k = prefijo[k - 1]
+        if nuevas[i] == nuevas[k]:
+            k += 1
+        prefijo[i] = k
+
+    # Recorrer la cola buscando `nuevas` (lo que queda calzado al final es el solape)
+    k = 0
+    ultimo = len(cola) - 1
+    for i, clave in enumerate(cola):
+        while k and clave != nuevas[k]:
+            k = prefijo[k - 1]
+        if clave == nuevas[k]:
+            k += 1
+        if k == len(nuevas) and i < ultimo:
+            # Calce completo antes del final de la cola: seguir buscando uno que llegue al final
+            k = prefijo[k - 1]
+    return k
+
+
+def quiebres_saldo(df, saldo_anterior=None):
+    """
+    Revisa la cadena de saldos: saldo[i] debe ser saldo[i-1] + abonos[i] - cargos[i]
+    (en centavos; df puede venir en el esquema del parser o en pesos). La primera fila se compara contra `saldo_anterior` si se da.
+
+    Devuelve un DataFrame con las filas donde la cadena se corta
+    (fila, fecha, saldo_esperado, saldo).
+    """
+    if df.empty:
+        return pd.DataFrame(columns=["fila", "fecha", "saldo_esperado", "saldo"])
+
+    saldo, sin_saldo = centavos(df, "saldo")
+    con_saldo = ~sin_saldo
+    previo = np.concatenate([[0], saldo[:-1]])
+    revisar = con_saldo & np.concatenate([[False], con_saldo[:-1]])
+
+    if saldo_anterior is not None and not pd.isna(saldo_anterior):
+        previo[0] = int(round(float(saldo_anterior) * 100))
+        revisar[0] = bool(con_saldo[0])
+
+    esperado = previo + centavos(df, "abonos")[0] - centavos(df, "cargos")[0]
+    quiebre = revisar & (esperado != saldo)
+    return pd.DataFrame({
+        "fila": np.flatnonzero(quiebre),
+        "fecha": df["fecha"].to_numpy()[quiebre],
+        "saldo_esperado": esperado[quiebre] / 100,
+        "saldo": saldo[quiebre] / 100,
+    })
+
+# ==============================
+# EMPALME
+# ==============================
+def empalmar(df, db_path=DB_PATH, manifiesto=None):
+    """
+    Carga una cartola (de la más antigua a la más reciente) empalmándola con
+    lo ya guardado de la misma cuenta:
+
+    1) trae la cola guardada desde la primera fecha del archivo
+    2) busca el solape: el tramo final de la cola que coincide fila a fila
+       (misma fecha, montos y saldo) con el inicio del archivo
+    3) inserta solo la continuación, sin pasar las filas del solape por el
+       índice; como el solape se alinea por posición, dos movimientos
+       iguales (misma comisión dos veces el mismo día) cuentan como dos
+    4) revisa la cadena de saldos desde el último saldo guardado y marca
+       cada quiebre
+
+    Si el archivo completo ya está dentro de lo guardado (descarga vieja) no
+    se inserta nada (modo CONTENIDO). Si las fechas se cruzan con lo guardado
+    pero no hay solape reconocible, se marca y se carga normal (INSERT OR
+    IGNORE por dedup_key, modo SIN_SOLAPE).
+
+    Devuelve un dict con: modo, solape, continuacion, insertados, ignorados,
+    batch_id, omitido y quiebres (DataFrame).
+    """
+    df = df.reset_index(drop=True)
+    bancos = df["banco"].dropna().unique()
+    cuentas = df["cuenta"].dropna().unique()
+    if len(bancos) > 1 or len(cuentas) > 1:
+        raise ValueError("El empalme es por cuenta: el archivo trae más de un banco o cuenta")
+
+    banco = bancos[0] if len(bancos) else None
+    cuenta = cuentas[0] if len(cuentas) else None
+    desde = pd.to_datetime(df["fecha"]).min().strftime("%Y-%m-%d")
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cola = cargar_cola(conn, banco, cuenta, desde)
+        ultimo = conn.execute("""
+            SELECT saldo FROM movimientos_bancarios
+            WHERE banco = ? AND cuenta IS ?
+            ORDER BY id DESC LIMIT 1
+        """, (banco, cuenta)).fetchone()
+    finally:
+        conn.close()
+
+    claves = clave_dedup(df).tolist()
+    solape = largo_solape(cola["dedup_key"].tolist(), claves)
+
+    if solape or cola.empty:
+        modo = "EMPALME"
+        continuacion = df.iloc[solape:]
+        saldo_anterior = ultimo[0] if ultimo else None
+    elif set(claves) <= set(cola["dedup_key"].tolist()):
+        # Descarga vieja: todo el archivo ya está dentro de lo guardado
+        modo = "CONTENIDO"
+        continuacion = df.iloc[:0]
+        saldo_anterior = None
+    else:
+        # Fechas cruzadas sin calce: no se puede saber dónde sigue la cartola
+        modo = "SIN_SOLAPE"
+        continuacion = df
+        saldo_anterior = None
+
+    quiebres = quiebres_saldo(continuacion.reset_index(drop=True), saldo_anterior)
+    quiebres["fila"] += len(df) - len(continuacion)
+
+    resultado = guardar_movimientos(continuacion, db_path, manifiesto=manifiesto)
+
+    return {
+        "modo": modo,
+        "solape": solape,
+        "continuacion": len(continuacion),
+        "insertados": resultado["insertados"],
+        "ignorados": resultado["ignorados"],
+        "batch_id": resultado["batch_id"],
+        "omitido": resultado["omitido"],
+        "quiebres": quiebres,
+    }
+
@@ -0,0 +1,314 @@
+import argparse
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa            # El espejo Parquet es opcional: sin pyarrow no se escribe
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+NOMBRE_ESPEJO = "espejo_movimientos"  # Carpeta junto a la base de datos
+CHUNK_SIZE = 100_000                  # Filas por vuelta al reconstruir el espejo
+
+# ==============================
+# ESPEJO PARQUET DE MOVIMIENTOS
+# ==============================
+# Copia columnar de movimientos_bancarios para análisis, particionada como
+# dataset Hive:
+#   espejo_movimientos/banco=BBVA/mes=2025-12/part-00000042.parquet
+# Cada lote de carga (batch_id) escribe un archivo por partición que toca,
+# así que volver a espejar o revertir un lote solo toca sus archivos.
+#
+# Columnas compactas:
+# - banco_origen, tipo_documento, moneda, cuenta: diccionario (categorías)
+# - abonos / cargos / saldo / neto: centavos int64 (sufijo _centavos)
+# - fecha: date32
+# banco y mes no se guardan dentro del archivo: salen de la ruta.
+
+COLUMNAS_CATEGORIA = ["cuenta", "banco_origen", "tipo_documento", "moneda"]
+COLUMNAS_MONTO = ["abonos", "cargos", "saldo", "neto"]
+COLUMNAS_TEXTO = [
+    "cuenta_origen",
+    "rut_pagador",
+    "nombre_contraparte",
+    "descripcion",
+    "comentario_movimiento",
+    "referencia_movimiento",
+]
+
+COLUMNAS_SQL = ["id", "fecha", "banco"] + COLUMNAS_CATEGORIA + COLUMNAS_TEXTO + COLUMNAS_MONTO + ["batch_id"]
+
+
+def directorio_espejo(db_path=DB_PATH):
+    return Path(db_path).parent / NOMBRE_ESPEJO
+
+
+def espejo_disponible():
+    return pq is not None
+
+
+def _requiere_pyarrow():
+    if pq is None:
+        raise ImportError("El espejo Parquet necesita pyarrow (pip install pyarrow)")
+
+# ==============================
+# ESCRITURA
+# ==============================
+def _a_centavos(serie):
+    valores = pd.to_numeric(serie, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    centavos = np.sign(valores) * np.floor(np.abs(valores) * 100 + 0.5)
+    return pa.array(centavos, type=pa.int64(), mask=np.isnan(centavos))
+
+
+def _tabla(df):
+    """DataFrame de movimientos_bancarios -> tabla Arrow compacta (sin banco ni mes)."""
+    columnas = {
+        "id": pa.array(df["id"].to_numpy(dtype=np.int64)),
+        "fecha": pa.array(pd.to_datetime(df["fecha"]).dt.date, type=pa.date32()),
+    }
+    for col in COLUMNAS_CATEGORIA:
+        columnas[col] = pa.array(df[col].astype(object), type=pa.string(), from_pandas=True).dictionary_encode()
+    for col in COLUMNAS_TEXTO:
+        columnas[col] = pa.array(df[col].astype(object), type=pa.string(), from_pandas=True)
+    for col in COLUMNAS_MONTO:
+        columnas[f"{col}_centavos"] = _a_centavos(df[col])
+    columnas["batch_id"] = pa.array(df["batch_id"].astype("Int64"), type=pa.int64(), from_pandas=True)
+    return pa.table(columnas)
+
+
+def _escribir_particiones(df, espejo_dir, nombre_parte):
+    """Escribe df partido por banco / mes; un archivo `nombre_parte` por partición. Devuelve cuántos archivos."""
+    if df.empty:
+        return 0
+    df = df.assign(
+        _banco=df["banco"].fillna("SIN_BANCO").astype(str),
+        _mes=pd.to_datetime(df["fecha"]).dt.strftime("%Y-%m"),
+    )
+    archivos = 0
+    for (banco, mes), grupo in df.groupby(["_banco", "_mes"], sort=True):
+        carpeta = Path(espejo_dir) / f"banco={banco}" / f"mes={mes}"
+        carpeta.mkdir(parents=True, exist_ok=True)
+        destino = carpeta / nombre_parte
+        temporal = destino.with_suffix(".tmp")
+        pq.write_table(_tabla(grupo.sort_values("id")), temporal, compression="zstd")
+        temporal.replace(destino)
+        archivos += 1
+    return archivos
+
+
+def _nombre_parte(batch_id):
+    return f"part-{batch_id:08d}.parquet"
+
+
+def espejar_lote(db_path, batch_id, espejo_dir=None):
+    """
+    Copia al espejo los movimientos de un lote (leídos de SQLite por
+    batch_id, así el espejo queda igual a lo que realmente se insertó).
+    Sin pyarrow no hace nada y devuelve None; si no, cuántos archivos escribió.
+    """
+    if pq is None:
+        return None
+    espejo_dir = espejo_dir or directorio_espejo(db_path)
+    borrar_lote(batch_id, espejo_dir)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        df = pd.read_sql(
+            f"SELECT {', '.join(COLUMNAS_SQL)} FROM movimientos_bancarios WHERE batch_id = ?",
+            conn, params=(batch_id,),
+        )
+    finally:
+        conn.close()
+    return _escribir_particiones(df, espejo_dir, _nombre_parte(batch_id))
+
+
+def borrar_lote(batch_id, espejo_dir):
+    """Quita del espejo los archivos de un lote (al revertirlo o volver a espejarlo)."""
+    borrados = 0
+    for archivo in Path(espejo_dir).glob(f"banco=*/mes=*/{_nombre_parte(batch_id)}"):
+        archivo.unlink()
+        borrados += 1
+    return borrados
+
+
+def reconstruir_espejo(db_path=DB_PATH, espejo_dir=None, chunksize=CHUNK_SIZE):
+    """
+    Rehace el espejo completo desde movimientos_bancarios (por bloques).
+    Las filas de cada lote van a sus archivos part-<batch_id>; las cargadas
+    antes del manifiesto (sin batch_id) a part-sin-lote-<n>.
+    Devuelve cuántas filas se escribieron.
+    """
+    _requiere_pyarrow()
+    espejo_dir = Path(espejo_dir or directorio_espejo(db_path))
+    if espejo_dir.exists():
+        shutil.rmtree(espejo_dir)
+
+    conn = sqlite3.connect(db_path)
+    filas = 0
+    try:
+        lotes = [fila[0] for fila in conn.execute(
+            "SELECT DISTINCT batch_id FROM movimientos_bancarios WHERE batch_id IS NOT NULL ORDER BY batch_id"
+        )]
+        for batch_id in lotes:
+            df = pd.read_sql(
+                f"SELECT {', '.join(COLUMNAS_SQL)} FROM movimientos_bancarios WHERE batch_id = ?",
+                conn, params=(batch_id,),
+            )
+            _escribir_particiones(df, espejo_dir, _nombre_parte(batch_id))
+            filas += len(df)
+
+        for n, df in enumerate(pd.read_sql(
+            f"SELECT {', '.join(COLUMNAS_SQL)} FROM movimientos_bancarios WHERE batch_id IS NULL ORDER BY id",
+            conn, chunksize=chunksize,
+        )):
+            _escribir_particiones(df, espejo_dir, f"part-sin-lote-{n:04d}.parquet")
+            filas += len(df)
+    finally:
+        conn.close()
+    return filas
+
+# ==============================
+# LECTURA
+# ==============================
+def _particiones(espejo_dir, bancos=None, mes_desde=None, mes_hasta=None):
+    """Archivos de las particiones que pasan el filtro, sin abrir ninguno."""
+    archivos = []
+    for carpeta_banco in sorted(Path(espejo_dir).glob("banco=*")):
+        banco = carpeta_banco.name.split("=", 1)[1]
+        if bancos is not None and banco not in bancos:
+            continue
+        for carpeta_mes in sorted(carpeta_banco.glob("mes=*")):
+            mes = carpeta_mes.name.split("=", 1)[1]
+            if (mes_desde and mes < mes_desde) or (mes_hasta and mes > mes_hasta):
+                continue
+            archivos.extend((banco, mes, a) for a in sorted(carpeta_mes.glob("*.parquet")))
+    return archivos
+
+
+def _leer_particiones(bancos, fecha_desde, fecha_hasta, columnas, espejo_dir):
+    """
+    (banco, mes, tabla Arrow) de cada archivo de las particiones que tocan el
+    rango. El filtro por fecha solo se aplica en los meses de los extremos:
+    los del medio entran completos.
+    """
+    if isinstance(bancos, str):
+        bancos = [bancos]
+    mes_desde = fecha_desde[:7] if fecha_desde else None
+    mes_hasta = fecha_hasta[:7] if fecha_hasta else None
+
+    leer = columnas
+    if columnas is not None and (fecha_desde or fecha_hasta):
+        leer = list(dict.fromkeys(list(columnas) + ["fecha"]))
+
+    for banco, mes, archivo in _particiones(espejo_dir, bancos, mes_desde, mes_hasta):
+        filtro = []
+        if fecha_desde and mes == mes_desde:
+            filtro.append(("fecha", ">=", pd.Timestamp(fecha_desde).date()))
+        if fecha_hasta and mes == mes_hasta:
+            filtro.append(("fecha", "<=", pd.Timestamp(fecha_hasta).date()))
+        if filtro:
+            tabla = pq.read_table(archivo, columns=leer, filters=filtro)
+        else:
+            tabla = pq.ParquetFile(archivo).read(columns=leer)  # Sin la capa de datasets: más liviano por archivo
+        if columnas is not None:
+            tabla = tabla.select(columnas)
+        yield banco, mes, tabla
+
+
+def leer_espejo(bancos=None, fecha_desde=None, fecha_hasta=None, columnas=None, db_path=DB_PATH, espejo_dir=None):
+    """
+    Lee movimientos del espejo abriendo solo las particiones (banco / mes)
+    del filtro y solo las columnas pedidas. fecha_desde / fecha_hasta
+    (YYYY-MM-DD) recortan además dentro del mes. banco y mes vienen como
+    categorías; los montos en centavos (abonos_centavos, ...).
+    """
+    _requiere_pyarrow()
+    espejo_dir = espejo_dir or directorio_espejo(db_path)
+    leer = None if columnas is None else [c for c in columnas if c not in ("banco", "mes")]
+
+    tablas, claves, largos = [], [], []
+    for banco, mes, tabla in _leer_particiones(bancos, fecha_desde, fecha_hasta, leer, espejo_dir):
+        tablas.append(tabla)
+        claves.append((banco, mes))
+        largos.append(tabla.num_rows)
+
+    if not tablas:
+        return pd.DataFrame(columns=columnas or [])
+
+    df = pa.concat_tables(tablas, promote_options="permissive").to_pandas(date_as_object=False)
+
+    # banco / mes como categorías armadas desde los códigos (sin textos por fila)
+    for posicion, nombre in enumerate(("banco", "mes")):
+        categorias = sorted({clave[posicion] for clave in claves})
+        codigo = {valor: i for i, valor in enumerate(categorias)}
+        codigos = np.repeat([codigo[clave[posicion]] for clave in claves], largos)
+        df.insert(posicion, nombre, pd.Categorical.from_codes(codigos, categorias))
+
+    return df if columnas is None else df[columnas]
+
+
+def resumen_mensual(bancos=None, fecha_desde=None, fecha_hasta=None, db_path=DB_PATH, espejo_dir=None):
+    """
+    Abonos, cargos y cantidad de movimientos por banco y mes (montos en pesos).
+    Cada archivo es de un solo banco y mes, así que se suma archivo por
+    archivo en Arrow y en pandas solo se juntan los totales.
+    """
+    _requiere_pyarrow()
+    espejo_dir = espejo_dir or directorio_espejo(db_path)
+
+    parciales = []
+    for banco, mes, tabla in _leer_particiones(
+        bancos, fecha_desde, fecha_hasta, ["abonos_centavos", "cargos_centavos"], espejo_dir,
+    ):
+        parciales.append((
+            banco, mes, tabla.num_rows,
+            pc.sum(tabla["abonos_centavos"]).as_py() or 0,
+            pc.sum(tabla["cargos_centavos"]).as_py() or 0,
+        ))
+
+    resumen = (
+        pd.DataFrame(parciales, columns=["banco", "mes", "movimientos", "abonos_centavos", "cargos_centavos"])
+        .groupby(["banco", "mes"], as_index=False)
+        .sum()
+    )
+    resumen["abonos"] = resumen["abonos_centavos"] / 100
+    resumen["cargos"] = resumen["cargos_centavos"] / 100
+    return resumen[["banco", "mes", "movimientos", "abonos", "cargos"]]
+
+# ==============================
+# MAIN
+# ==============================
+def main():
+    ap = argparse.ArgumentParser(description="Espejo Parquet de movimientos_bancarios")
+    ap.add_argument("--db", default=str(DB_PATH), help="Ruta de la base SQLite")
+    ap.add_argument("--reconstruir", action="store_true", help="Rehacer el espejo completo desde SQLite")
+    ap.add_argument("--banco", action="append", help="Filtrar el resumen por banco (se puede repetir)")
+    args = ap.parse_args()
+
+    if args.reconstruir:
+        inicio = time.perf_counter()
+        filas = reconstruir_espejo(args.db)
+        print(f"🪞 Espejo reconstruido: {filas} movimientos en {time.perf_counter() - inicio:.2f} s")
+
+    inicio = time.perf_counter()
+    resumen = resumen_mensual(args.banco, db_path=args.db)
+    for fila in resumen.itertuples():
+        print(f"{fila.banco:<10} {fila.mes}  {fila.movimientos:>8}  abonos {fila.abonos:>16,.2f}  cargos {fila.cargos:>16,.2f}")
+    print(f"⏱️ Resumen mensual en {time.perf_counter() - inicio:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+# ==============================
+# ESQUEMA DEL MOVIMIENTO NORMALIZADO
+# ==============================
+# Lo que entregan los parsers de cartolas (parse_bbva_mexico,
+# parse_banregio_mexico) y consumen bulk_loader y empalme:
+# - categorías para los campos con pocos valores distintos
+# - centavos int64 para los montos (sufijo _centavos): sin sorpresas de
+#   redondeo al comparar o sumar
+# - textos como string nullable, con un solo objeto por valor distinto
+#   (los conceptos repetidos no se guardan una vez por fila). El
+#   almacenamiento se fija en "python": con pyarrow instalado, "string" pasa
+#   a ArrowStringArray, que copia cada texto a su buffer y pierde lo compartido
+#
+# En SQLite (movimientos_bancarios) los montos siguen en pesos: la
+# conversión se hace al escribir (columnas_db).
+
+TEXTO = pd.StringDtype("python")
+
+ESQUEMA_MOVIMIENTOS = {
+    "fecha": "datetime64[us]",
+    "banco": "category",
+    "cuenta": "category",
+    "banco_origen": "category",
+    "cuenta_origen": TEXTO,
+    "rut_pagador": TEXTO,
+    "nombre_contraparte": TEXTO,
+    "tipo_documento": "category",
+    "moneda": "category",
+    "descripcion": TEXTO,
+    "comentario_movimiento": TEXTO,
+    "referencia_movimiento": TEXTO,
+    "abonos_centavos": "int64",
+    "cargos_centavos": "int64",
+    "saldo_centavos": "int64",
+    "neto_centavos": "int64",
+}
+
+MONTOS = ["abonos", "cargos", "saldo", "neto"]  # Columnas en pesos en la base
+
+# ==============================
+# CONSTRUCCIÓN
+# ==============================
+def _internar(serie):
+    """Texto nullable donde cada valor distinto es un único objeto compartido por sus filas."""
+    codigos, valores = pd.factorize(serie)
+    valores = np.asarray(valores, dtype=object)
+    datos = np.empty(len(codigos), dtype=object)
+    datos[:] = None
+    presentes = codigos >= 0
+    datos[presentes] = valores[codigos[presentes]]
+    return pd.Series(datos, index=serie.index, dtype=TEXTO)
+
+
+def aplicar_esquema(df):
+    """
+    Devuelve df con las columnas de ESQUEMA_MOVIMIENTOS, en ese orden y con
+    esos tipos. Los montos deben venir ya en centavos.
+    """
+    columnas = {}
+    for col, tipo in ESQUEMA_MOVIMIENTOS.items():
+        serie = df[col] if col in df else pd.Series(None, index=df.index, dtype=object)
+        if tipo is TEXTO:
+            columnas[col] = _internar(serie)
+        elif tipo == "category":
+            columnas[col] = serie.astype(object).where(serie.notna(), None).astype("category")
+        elif tipo == "int64":
+            columnas[col] = serie.astype("Int64").fillna(0).astype(np.int64)
+        else:
+            columnas[col] = pd.to_datetime(serie).astype(tipo)
+    return pd.DataFrame(columnas, index=df.index)
+
+# ==============================
+# CONVERSIONES
+# ==============================
+def centavos(df, columna):
+    """
+    Monto en centavos (int64) y máscara de faltantes, tanto para un
+    DataFrame del esquema (columna_centavos) como para filas leídas de la
+    base (columna en pesos).
+    """
+    if f"{columna}_centavos" in df:
+        serie = df[f"{columna}_centavos"].astype("Int64")
+        return serie.fillna(0).to_numpy(dtype=np.int64), serie.isna().to_numpy()
+
+    montos = pd.to_numeric(df[columna], errors="coerce").to_numpy(dtype=float)
+    faltante = np.isnan(montos)
+    return np.round(np.where(faltante, 0.0, montos) * 100).astype(np.int64), faltante
+
+
+def columnas_db(df):
+    """Copia de df con los montos en pesos (abonos, cargos, saldo, neto) como en movimientos_bancarios."""
+    pesos = {
+        col: df[f"{col}_centavos"].astype("Int64").astype("Float64") / 100
+        for col in MONTOS
+        if f"{col}_centavos" in df
+    }
+    if not pesos:
+        return df
+    return df.drop(columns=[f"{col}_centavos" for col in pesos]).assign(**pesos)
+
+# ==============================
+# MEDICIÓN
+# ==============================
+def bytes_por_fila(df):
+    """
+    Memoria real del DataFrame por fila: arreglos de cada columna más los
+    objetos str distintos (un texto compartido por varias filas cuenta una vez).
+    """
+    if not len(df):
+        return 0.0
+    total = 0
+    vistos = set()
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            total += serie.cat.codes.nbytes
+            valores = serie.cat.categories
+        elif serie.dtype == object:
+            total += serie.to_numpy().nbytes  # Un puntero por fila
+            valores = serie.to_numpy()
+        else:
+            total += serie.array.nbytes
+            valores = serie.to_numpy(dtype=object) if serie.dtype == TEXTO else ()
+        for v in valores:
+            if isinstance(v, str) and id(v) not in vistos:
+                vistos.add(id(v))
+                total += v.__sizeof__()
+    return total / len(df)
+
+
+def main():
+    """Mide la memoria por fila del esquema en una cartola sintética (por defecto 1M filas)."""
+    import parse_bbva_mexico  # Solo para la medición (parse_bbva_mexico importa este módulo)
+
+    ap = argparse.ArgumentParser(description="Memoria por fila del movimiento normalizado")
+    ap.add_argument("--filas", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    muestra = pd.concat(parse_bbva_mexico.leer_cartola(parse_bbva_mexico.INPUT_FILE), ignore_index=True)
+    repeticiones = -(-args.filas // len(muestra))
+    sintetica = pd.concat([muestra] * repeticiones, ignore_index=True).iloc[:args.filas]
+
+    inicio = time.perf_counter()
+    compacta = aplicar_esquema(sintetica)
+    segundos = time.perf_counter() - inicio
+
+    # Como se armaba antes: todo object, los textos extraídos con un str por
+    # fila (str.extract no reutiliza objetos) y los montos float en pesos
+    anterior = columnas_db(compacta)
+    for col, tipo in ESQUEMA_MOVIMIENTOS.items():
+        if tipo is TEXTO:
+            anterior[col] = pd.Series(
+                [None if pd.isna(v) else "".join(v) for v in anterior[col]], index=anterior.index, dtype=object,
+            )
+        elif tipo == "category":
+            anterior[col] = anterior[col].astype(object)
+    anterior[MONTOS] = anterior[MONTOS].astype(float)
+
+    print(f"📏 {len(compacta):,} filas")
+    print(f"   antes (object + float): {bytes_por_fila(anterior):>8.1f} bytes/fila")
+    print(f"   esquema compacto:       {bytes_por_fila(compacta):>8.1f} bytes/fila ({segundos:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import csv
+import sqlite3
+from operator import itemgetter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from consultas import COLUMNAS_MOVIMIENTOS_EXPORT
+
+try:
+    import pyarrow as pa            # Solo para exportar a Parquet
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# ==============================
+# EXPORTACIÓN EN STREAMING
+# ==============================
+# Las exportaciones leen SQLite con un cursor por bloques (fetchmany) y
+# escriben cada bloque apenas llega, así que la memoria no crece con el
+# tamaño de la consulta:
+# - xlsx: openpyxl en modo write_only (cada hoja se va escribiendo a disco)
+# - csv:  un archivo por hoja
+# - parquet: un archivo por hoja, un row group por bloque (requiere pyarrow).
+#   El esquema sale de los tipos declarados en SQLite (ver tipos_sqlite), no
+#   del primer bloque: una columna REAL vacía al principio sigue siendo
+#   double y un entero no trunca los decimales que vengan después
+#
+# Varias hojas salen de UNA sola lectura: cada hoja es un dict con
+# - nombre:   nombre de la hoja (o sufijo del archivo en csv/parquet)
+# - columnas: columnas a escribir (None = todas las de la consulta)
+# - filtro:   función(DataFrame del bloque) -> máscara de filas (None = todas)
+
+CHUNK_SIZE = 20_000  # Filas por fetchmany
+
+FORMATOS = {".xlsx": "xlsx", ".csv": "csv", ".parquet": "parquet"}
+
+# Hojas de la cartola: completa, solo abonos y solo cargos
+COLUMNAS_ABONOS = [
+    "fecha",
+    "banco",
+    "banco_origen",
+    "descripcion",
+    "cuenta_origen",
+    "nombre_contraparte",
+    "comentario_movimiento",
+    "abonos",
+    "referencia_movimiento",
+]
+
+COLUMNAS_CARGOS = [c if c != "abonos" else "cargos" for c in COLUMNAS_ABONOS]
+
+HOJAS_CARTOLA = [
+    {"nombre": "cartola_completa", "columnas": COLUMNAS_MOVIMIENTOS_EXPORT, "filtro": None},
+    {"nombre": "abonos", "columnas": COLUMNAS_ABONOS, "filtro": lambda df: df["abonos"] > 0},
+    {"nombre": "cargos", "columnas": COLUMNAS_CARGOS, "filtro": lambda df: df["cargos"] > 0},
+]
+
+# Afinidad de SQLite (en este orden) -> tipo Parquet; NUMERIC, BLOB o sin
+# tipo no fijan uno y se deducen de los datos
+AFINIDADES = [
+    ("INT", "int64"),
+    ("CHAR", "string"),
+    ("CLOB", "string"),
+    ("TEXT", "string"),
+    ("BLOB", None),
+    ("REAL", "float64"),
+    ("FLOA", "float64"),
+    ("DOUB", "float64"),
+]
+
+# ==============================
+# LECTURA POR BLOQUES
+# ==============================
+def leer_bloques(conn, query, params=(), chunksize=CHUNK_SIZE):
+    """
+    Ejecuta la consulta y entrega (columnas, filas) bloque a bloque; las
+    filas son las tuplas del cursor (NULL queda como None).
+    """
+    cur = conn.execute(query, params)
+    columnas = [d[0] for d in cur.description]
+    while True:
+        filas = cur.fetchmany(chunksize)
+        if not filas:
+            break
+        yield columnas, filas
+
+
+def _filas_hoja(hoja, columnas, filas, df):
+    """Filas del bloque (tuplas) que van a la hoja, solo con sus columnas."""
+    if hoja["filtro"] is not None:
+        mascara = np.asarray(hoja["filtro"](df), dtype=bool)
+        filas = [filas[i] for i in np.flatnonzero(mascara)]
+
+    if hoja["columnas"] is None:
+        return filas
+    posiciones = [columnas.index(c) for c in hoja["columnas"]]
+    tomar = itemgetter(*posiciones)
+    if len(posiciones) == 1:
+        return [(tomar(f),) for f in filas]
+    return [tomar(f) for f in filas]
+
+# ==============================
+# ESCRITORES
+# ==============================
+# Cada escritor expone abrir(hoja, columnas), escribir(hoja, filas) y cerrar().
+
+def _archivo_hoja(destino, hoja, hojas):
+    """En csv/parquet una sola hoja usa el destino tal cual; varias, un archivo por hoja."""
+    if len(hojas) == 1:
+        return destino
+    return destino.with_name(f"{destino.stem}_{hoja['nombre']}{destino.suffix}")
+
+
+class EscritorXlsx:
+    def __init__(self, destino, hojas):
+        self.destino = destino
+        self.libro = Workbook(write_only=True)
+        self.hojas = {}
+
+    def abrir(self, hoja, columnas):
+        ws = self.libro.create_sheet(hoja["nombre"])
+        ws.append(columnas)
+        self.hojas[hoja["nombre"]] = ws
+
+    def escribir(self, hoja, filas):
+        ws = self.hojas[hoja["nombre"]]
+        for fila in filas:
+            ws.append(fila)
+
+    def cerrar(self):
+        self.libro.save(self.destino)
+
+
+class EscritorCsv:
+    def __init__(self, destino, hojas):
+        self.destino = destino
+        self.todas = hojas
+        self.archivos = {}
+        self.writers = {}
+
+    def abrir(self, hoja, columnas):
+        archivo = open(_archivo_hoja(self.destino, hoja, self.todas), "w", newline="", encoding="utf-8")
+        self.archivos[hoja["nombre"]] = archivo
+        self.writers[hoja["nombre"]] = csv.writer(archivo)
+        self.writers[hoja["nombre"]].writerow(columnas)
+
+    def escribir(self, hoja, filas):
+        self.writers[hoja["nombre"]].writerows(filas)
+
+    def cerrar(self):
+        for archivo in self.archivos.values():
+            archivo.close()
+
+
+def tipo_parquet(declarado):
+    """Tipo Parquet (nombre pyarrow) para un tipo declarado en SQLite, o None si no fija uno."""
+    declarado = (declarado or "").upper()
+    for patron, tipo in AFINIDADES:
+        if patron in declarado:
+            return tipo
+    return None
+
+
+def tipos_sqlite(conn):
+    """
+    Columna -> tipo declarado en las tablas de la base. Las consultas de
+    exportación leen columnas de tabla por su nombre; si dos tablas declaran
+    la misma columna con tipos distintos, queda fuera (se deduce de los datos).
+    """
+    tipos = {}
+    ambiguas = set()
+    tablas = [fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    for tabla in tablas:
+        for _, columna, declarado, *_ in conn.execute(f'PRAGMA table_info("{tabla}")'):
+            if tipos.setdefault(columna, declarado) != declarado:
+                ambiguas.add(columna)
+    return {c: t for c, t in tipos.items() if c not in ambiguas}
+
+
+# typeof() de SQLite -> tipo declarado equivalente (los enteros como REAL:
+# una columna calculada puede traer enteros y decimales)
+TIPOS_TYPEOF = {"integer": "REAL", "real": "REAL", "text": "TEXT"}
+
+
+def tipos_calculados(conn, query, params, columnas, tipos):
+    """
+    Tipo de las columnas sin tipo declarado (expresiones, alias) según el
+    primer valor no nulo que devuelve la consulta; TEXT si no tienen ninguno.
+    """
+    calculados = {}
+    for col in columnas:
+        if tipo_parquet(tipos.get(col)) is not None:
+            continue
+        try:
+            fila = conn.execute(
+                f'SELECT typeof("{col}") FROM ({query}) WHERE "{col}" IS NOT NULL LIMIT 1', params,
+            ).fetchone()
+        except sqlite3.Error:  # Nombre repetido o que no se puede referenciar: se deduce del primer bloque
+            continue
+        if fila is None:
+            calculados[col] = "TEXT"
+        elif fila[0] in TIPOS_TYPEOF:
+            calculados[col] = TIPOS_TYPEOF[fila[0]]
+    return calculados
+
+
+def _deducir_tipo(valores):
+    """Tipo de una columna sin tipo declarado: números siempre double (un entero no fija int64)."""
+    presentes = [v for v in valores if v is not None]
+    if not presentes:
+        return pa.string()
+    if all(isinstance(v, (int, float)) for v in presentes):
+        return pa.float64()
+    if all(isinstance(v, bytes) for v in presentes):
+        return pa.binary()
+    return pa.string()
+
+
+class EscritorParquet:
+    def __init__(self, destino, hojas, tipos=None):
+        if pq is None:
+            raise ImportError("Para exportar a Parquet se necesita pyarrow (pip install pyarrow)")
+        self.destino = destino
+        self.todas = hojas
+        self.tipos = tipos or {}  # Columna -> tipo declarado en SQLite
+        self.columnas = {}
+        self.writers = {}
+
+    def abrir(self, hoja, columnas):
+        self.columnas[hoja["nombre"]] = columnas
+
+    def _esquema(self, columnas, datos):
+        campos = []
+        for col in columnas:
+            tipo = tipo_parquet(self.tipos.get(col))
+            campos.append(pa.field(col, pa.type_for_alias(tipo) if tipo else _deducir_tipo(datos[col])))
+        return pa.schema(campos)
+
+    def escribir(self, hoja, filas):
+        nombre = hoja["nombre"]
+        columnas = self.columnas[nombre]
+        datos = {c: list(v) for c, v in zip(columnas, zip(*filas))}
+        if nombre not in self.writers:
+            archivo = _archivo_hoja(self.destino, hoja, self.todas)
+            self.writers[nombre] = pq.ParquetWriter(archivo, self._esquema(columnas, datos))
+        writer = self.writers[nombre]
+        # Conversión con cast seguro: un valor que no entra en el tipo (2.7 en
+        # una columna INTEGER) es un error, no se trunca en silencio
+        arreglos = [pa.array(datos[campo.name]).cast(campo.type) for campo in writer.schema]
+        writer.write_table(pa.Table.from_arrays(arreglos, schema=writer.schema))
+
+    def cerrar(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+ESCRITORES = {"xlsx": EscritorXlsx, "csv": EscritorCsv, "parquet": EscritorParquet}
+
+# ==============================
+# EXPORTACIÓN
+# ==============================
+def exportar_consulta(db_path, query, destino, params=(), hojas=None, formato=None, chunksize=CHUNK_SIZE,
+                      tipos=None):
+    """
+    Exporta el resultado de la consulta a `destino` en una sola pasada.
+
+    - formato: "xlsx", "csv" o "parquet" (por defecto según la extensión)
+    - hojas: ver encabezado del módulo (por defecto una hoja con todo)
+    - tipos: en parquet, columna -> tipo SQLite ("REAL", "TEXT"...) que
+      reemplaza al declarado (ver tipos_sqlite y tipos_calculados)
+
+    Devuelve {hoja: filas escritas}. Si la consulta no trae filas no se
+    escribe ningún archivo y devuelve {}.
+    """
+    destino = Path(destino)
+    hojas = hojas or [{"nombre": destino.stem, "columnas": None, "filtro": None}]
+    formato = formato or FORMATOS.get(destino.suffix.lower())
+    if formato not in ESCRITORES:
+        raise ValueError(f"Formato de exportación no soportado: {destino.suffix or formato}")
+
+    conn = sqlite3.connect(db_path)
+    try:
+        bloques = leer_bloques(conn, query, params, chunksize)
+        primero = next(bloques, None)
+        if primero is None:
+            return {}
+
+        columnas = primero[0]
+        if formato == "parquet":
+            tipos = {**tipos_sqlite(conn), **(tipos or {})}
+            tipos.update(tipos_calculados(conn, query, params, columnas, tipos))
+            escritor = EscritorParquet(destino, hojas, tipos)
+        else:
+            escritor = ESCRITORES[formato](destino, hojas)
+        for hoja in hojas:
+            escritor.abrir(hoja, hoja["columnas"] or columnas)
+
+        conteo = {hoja["nombre"]: 0 for hoja in hojas}
+        filtra = any(hoja["filtro"] is not None for hoja in hojas)
+        try:
+            for columnas, filas in _con_primero(primero, bloques):
+                # Un solo DataFrame por bloque para los filtros de todas las hojas
+                df = pd.DataFrame.from_records(filas, columns=columnas) if filtra else None
+                for hoja in hojas:
+                    filas_hoja = _filas_hoja(hoja, columnas, filas, df)
+                    if filas_hoja:
+                        escritor.escribir(hoja, filas_hoja)
+                    conteo[hoja["nombre"]] += len(filas_hoja)
+        finally:
+            escritor.cerrar()
+    finally:
+        conn.close()
+
+    return conteo
+
+
+def _con_primero(primero, bloques):
+    yield primero
+    yield from bloques
+
@@ -0,0 +1,234 @@
+import re
+import sqlite3
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+N_GRAMA = 3             # Largo de los n-gramas de caracteres
+TOP_K = 5               # Candidatos devueltos por búsqueda
+UMBRAL_SIMILITUD = 0.8  # Similitud mínima para asignar un RFC a un nombre
+MARGEN_SIMILITUD = 0.1  # Ventaja mínima del 1.º sobre el 2.º si son RFC distintos
+MIN_NGRAMAS = 5         # N-gramas mínimos de un nombre para asignarle RFC
+
+# ==============================
+# HELPERS
+# ==============================
+def normalizar_nombre(nombres):
+    """Mayúsculas, sin acentos y solo letras/números (los bancos cortan y parten los nombres)."""
+    return (
+        nombres.fillna("").astype(str)
+        .str.normalize("NFKD")
+        .str.encode("ascii", "ignore")
+        .str.decode("ascii")
+        .str.upper()
+        .str.replace(r"[^A-Z0-9]", "", regex=True)
+    )
+
+
+def normalizar_clave(texto):
+    """Igual que normalizar_nombre, para un solo texto."""
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^A-Z0-9]", "", texto.upper())
+
+
+def ngramas(clave, n=N_GRAMA):
+    """Conjunto de n-gramas de caracteres de una clave ya normalizada."""
+    if len(clave) < n:
+        return {clave} if clave else set()
+    return {clave[i:i + n] for i in range(len(clave) - n + 1)}
+
+# ==============================
+# ÍNDICE PERSISTIDO EN SQLITE
+# ==============================
+def actualizar_indice(conn):
+    """
+    Agrega al índice las contrapartes (rfc_receptor, razon_receptor) de
+    facturas_emitidas_mx que todavía no están indexadas. Es incremental:
+    solo procesa los pares nuevos, así que se puede llamar después de cada carga.
+
+    Devuelve cuántas contrapartes nuevas se indexaron.
+    """
+    nuevas = pd.read_sql("""
+        SELECT DISTINCT f.rfc_receptor, f.razon_receptor
+        FROM facturas_emitidas_mx f
+        LEFT JOIN contrapartes c
+          ON c.rfc_receptor = f.rfc_receptor
+         AND c.razon_receptor = f.razon_receptor
+        WHERE f.rfc_receptor IS NOT NULL
+          AND f.razon_receptor IS NOT NULL
+          AND c.id IS NULL
+    """, conn)
+
+    if nuevas.empty:
+        return 0
+
+    nuevas["clave"] = normalizar_nombre(nuevas["razon_receptor"])
+
+    with conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO contrapartes (rfc_receptor, razon_receptor, clave)
+            VALUES (?, ?, ?)
+        """, nuevas[["rfc_receptor", "razon_receptor", "clave"]].itertuples(index=False, name=None))
+
+        ids = pd.read_sql("""
+            SELECT c.id, c.clave
+            FROM contrapartes c
+            LEFT JOIN contrapartes_ngramas g ON g.contraparte_id = c.id
+            WHERE g.contraparte_id IS NULL
+        """, conn)
+
+        conn.executemany("""
+            INSERT OR IGNORE INTO contrapartes_ngramas (ngrama, contraparte_id)
+            VALUES (?, ?)
+        """, (
+            (grama, contraparte_id)
+            for contraparte_id, clave in zip(ids["id"].tolist(), ids["clave"].tolist())
+            for grama in ngramas(clave)
+        ))
+
+    return len(nuevas)
+
+
+def cargar_indice(conn):
+    """
+    Carga el índice invertido en memoria:
+    - listas: n-grama -> array de posiciones de contraparte
+    - rfc, razon, n_gramas: arrays por posición
+
+    Devuelve un dict listo para buscar_contrapartes.
+    """
+    contrapartes = pd.read_sql("""
+        SELECT id, rfc_receptor, razon_receptor, clave
+        FROM contrapartes
+        ORDER BY id
+    """, conn)
+    posiciones = pd.Series(np.arange(len(contrapartes)), index=contrapartes["id"])
+
+    gramas = pd.read_sql("""
+        SELECT ngrama, contraparte_id
+        FROM contrapartes_ngramas
+    """, conn)
+    gramas["pos"] = gramas["contraparte_id"].map(posiciones)
+
+    listas = {
+        grama: grupo.to_numpy(dtype=np.int64)
+        for grama, grupo in gramas.groupby("ngrama", sort=False)["pos"]
+    }
+
+    return {
+        "listas": listas,
+        "rfc": contrapartes["rfc_receptor"].to_numpy(dtype=object),
+        "razon": contrapartes["razon_receptor"].to_numpy(dtype=object),
+        "n_gramas": gramas.groupby("pos").size().reindex(range(len(contrapartes)), fill_value=0).to_numpy(),
+    }
+
+# ==============================
+# BÚSQUEDA
+# ==============================
+def buscar_contrapartes(indice, nombre, k=TOP_K):
+    """
+    Devuelve las k contrapartes más parecidas a `nombre` como lista de dicts
+    (rfc_receptor, razon_receptor, similitud), de mayor a menor similitud.
+
+    La similitud es la fracción de n-gramas del nombre que aparecen en la
+    razón social (los bancos truncan el nombre, así que un prefijo completo
+    da 1.0); a igual similitud se prefiere el coeficiente de Dice más alto.
+    """
+    gramas = ngramas(normalizar_clave(nombre))
+    listas = [indice["listas"][g] for g in gramas if g in indice["listas"]]
+    if not listas:
+        return []
+
+    # Conteo de n-gramas compartidos por contraparte (una pasada sobre las listas)
+    conteo = np.bincount(np.concatenate(listas), minlength=len(indice["rfc"]))
+    posiciones = np.flatnonzero(conteo)
+    if len(posiciones) > k:
+        # Solo las que empatan o superan el k-ésimo conteo pueden quedar en el top k
+        corte = np.partition(conteo[posiciones], -k)[-k]
+        posiciones = posiciones[conteo[posiciones] >= corte]
+
+    compartidos = conteo[posiciones]
+    similitud = compartidos / len(gramas)
+    dice = 2 * compartidos / (len(gramas) + indice["n_gramas"][posiciones])
+
+    mejores = np.lexsort((-dice, -similitud))[:k]
+    return [
+        {
+            "rfc_receptor": indice["rfc"][posiciones[i]],
+            "razon_receptor": indice["razon"][posiciones[i]],
+            "similitud": float(similitud[i]),
+        }
+        for i in mejores
+    ]
+
+
+def resolver_rfc_por_nombre(indice, nombres, umbral=UMBRAL_SIMILITUD, margen=MARGEN_SIMILITUD,
+                            min_ngramas=MIN_NGRAMAS):
+    """
+    Asigna un RFC a cada nombre de contraparte bancaria cuando el mejor
+    candidato supera el umbral y no hay otro RFC casi igual de parecido.
+    Cada nombre distinto se busca una sola vez. Los nombres con menos de
+    min_ngramas n-gramas no se resuelven: "SA DE CV" está completo dentro de
+    cualquier razón social y daría similitud 1.0.
+
+    Devuelve una Series (mismo índice que nombres) con el RFC o None.
+    """
+    resultado = {}
+
+    for nombre in nombres.dropna().unique():
+        if len(ngramas(normalizar_clave(nombre))) < min_ngramas:
+            continue
+        candidatos = buscar_contrapartes(indice, nombre, k=TOP_K)
+        if not candidatos or candidatos[0]["similitud"] < umbral:
+            continue
+
+        mejor = candidatos[0]
+        rival = next((c for c in candidatos[1:] if c["rfc_receptor"] != mejor["rfc_receptor"]), None)
+        if rival is not None and mejor["similitud"] - rival["similitud"] < margen:
+            continue
+
+        resultado[nombre] = mejor["rfc_receptor"]
+
+    rfc = nombres.map(resultado)
+    return rfc.astype(object).where(rfc.notna(), None)
+
+# ==============================
+# MAIN
+# ==============================
+def main():
+    conn = sqlite3.connect(DB_PATH)
+
+    nuevas = actualizar_indice(conn)
+    print(f"🟢 Contrapartes nuevas indexadas: {nuevas}")
+
+    inicio = time.perf_counter()
+    indice = cargar_indice(conn)
+    print(f"📚 Índice cargado: {len(indice['rfc'])} contrapartes en {time.perf_counter() - inicio:.2f} s")
+
+    conn.close()
+
+    while True:
+        nombre = input("Nombre a buscar (vacío para salir): ").strip()
+        if not nombre:
+            break
+
+        inicio = time.perf_counter()
+        candidatos = buscar_contrapartes(indice, nombre)
+        ms = (time.perf_counter() - inicio) * 1000
+
+        for c in candidatos:
+            print(f"  {c['similitud']:.2f}  {c['rfc_receptor']}  {c['razon_receptor']}")
+        print(f"⏱️ {ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,541 @@
+import argparse                                       # Argumentos de línea de comandos
+import multiprocessing as mp                          # Cola y proceso escritor
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import pandas as pd
+
+import esquema
+import parse_banregio_mexico
+import parse_bbva_mexico
+import normalizacion
+import parse_cfdi_xml
+import parse_facturas_emitidas
+import reglas
+import tipo_cambio
+from bulk_loader import guardar_movimientos
+from cache_parseo import cache_disponible, huella_modulos, parsear_con_cache
+from empalme import empalmar
+from espejo_parquet import espejo_disponible
+from esquema import aplicar_esquema
+from indice_contrapartes import actualizar_indice
+from manifiesto import hash_archivo, preparar_manifiesto, verificar_archivo
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+MAX_WORKERS = os.cpu_count() or 1  # Procesos parseando en paralelo
+MAX_EN_COLA = 4                    # Lotes parseados esperando al escritor (limita la memoria)
+ESPERA_ESCRITOR = 1.0              # Segundos entre revisiones de que el escritor sigue vivo
+
+DESTINO_MOVIMIENTOS = "movimientos_bancarios"
+DESTINO_FACTURAS = "facturas_emitidas_mx"
+
+# ==============================
+# PARSERS (REGISTRO)
+# ==============================
+def parsear_bbva(path):
+    """
+    Cartola BBVA completa, de la más antigua a la más reciente. Solo para
+    --empalmar (necesita la cartola entera); la carga normal va por bloques
+    (parsear_bbva_bloques).
+    """
+    # concat pierde las categorías si los bloques traen valores distintos: se vuelve a aplicar el esquema
+    df = pd.concat(parse_bbva_mexico.leer_cartola(path), ignore_index=True)
+    return aplicar_esquema(df.iloc[::-1].reset_index(drop=True))
+
+
+def parsear_bbva_bloques(path):
+    """Bloques normalizados en el orden del archivo (el más reciente primero)."""
+    return parse_bbva_mexico.leer_cartola(path)
+
+
+def parsear_banregio(path):
+    return parse_banregio_mexico.normalizar_registros(parse_banregio_mexico.iter_registros(path))
+
+
+def parsear_cfdi(path):
+    return parse_facturas_emitidas.preparar_facturas(parse_facturas_emitidas.leer_facturas(path))
+
+
+def parsear_cfdi_xml(path):
+    return parse_cfdi_xml.parsear_archivo(path)
+
+
+# nombre -> extensiones, texto que debe aparecer en el nombre del archivo,
+# función que lo parsea (DataFrame normalizado), tabla destino, versión del
+# parser (si tiene versión, la carga queda en el manifiesto ingest_batches),
+# módulos cuyo código define el parseo, también los que solo aportan
+# constantes como tipo_cambio.MONEDA_EMPRESA (su huella invalida la caché),
+# para facturas si la fuente solo completa las ya guardadas (ver
+# parse_facturas_emitidas.guardar_facturas) y, para cartolas que se pueden
+# leer por bloques, la función que los entrega en el orden del archivo
+# (ver ENVÍO POR BLOQUES)
+PARSERS = {}
+
+
+def registrar_parser(nombre, extensiones, patron_nombre, parsear, destino, version=None, modulos=(),
+                     solo_completar=False, parsear_bloques=None):
+    """Agrega un parser al registro. `parsear` debe ser una función de nivel de módulo (se envía a otros procesos)."""
+    PARSERS[nombre] = {
+        "extensiones": tuple(e.lower() for e in extensiones),
+        "patron_nombre": patron_nombre.upper(),
+        "parsear": parsear,
+        "destino": destino,
+        "version": version,
+        "version_cache": f"{version or '-'}+{huella_modulos(*modulos)}",
+        "solo_completar": solo_completar,
+        "parsear_bloques": parsear_bloques,
+    }
+
+
+registrar_parser("bbva", [".txt"], "BBVA", parsear_bbva, DESTINO_MOVIMIENTOS, parse_bbva_mexico.PARSER_VERSION,
+                 modulos=(parse_bbva_mexico, reglas, normalizacion, esquema, tipo_cambio),
+                 parsear_bloques=parsear_bbva_bloques)
+registrar_parser("banregio", [".xlsx"], "BANREGIO", parsear_banregio, DESTINO_MOVIMIENTOS,
+                 parse_banregio_mexico.PARSER_VERSION,
+                 modulos=(parse_banregio_mexico, reglas, normalizacion, esquema, tipo_cambio))
+registrar_parser("cfdi", [".xlsx"], "EMITIDOS", parsear_cfdi, DESTINO_FACTURAS,
+                 modulos=(parse_facturas_emitidas, normalizacion, tipo_cambio))
+# XML sueltos o zips de XML, con cualquier nombre. Para carpetas con miles de
+# XML sueltos, parse_cfdi_xml.load_xml los agrupa por lotes y es más rápido
+registrar_parser("cfdi_xml", [".xml", ".zip"], "", parsear_cfdi_xml, DESTINO_FACTURAS,
+                 modulos=(parse_cfdi_xml, parse_facturas_emitidas, tipo_cambio), solo_completar=True)
+
+
+def detectar_parser(path):
+    """Devuelve el nombre del parser que corresponde al archivo, o None."""
+    path = Path(path)
+    for nombre, parser in PARSERS.items():
+        if path.suffix.lower() in parser["extensiones"] and parser["patron_nombre"] in path.name.upper():
+            return nombre
+    return None
+
+
+def listar_archivos(rutas):
+    """Expande carpetas (recursivo) y devuelve los archivos con extensión conocida."""
+    extensiones = {e for parser in PARSERS.values() for e in parser["extensiones"]}
+    archivos = []
+    for ruta in map(Path, rutas):
+        if ruta.is_dir():
+            archivos.extend(
+                p for p in sorted(ruta.rglob("*"))
+                if p.is_file() and p.suffix.lower() in extensiones and not p.name.startswith("~$")
+            )
+        else:
+            archivos.append(ruta)
+    return archivos
+
+# ==============================
+# WORKERS Y ESCRITOR
+# ==============================
+_cola = None            # Cola hacia el escritor (se asigna en cada worker)
+_escritor_caido = None  # Evento que _vigilar_escritor marca si el escritor terminó con error
+_turno = None           # Lock: un solo archivo a la vez en la cola (ver ENVÍO POR BLOQUES)
+
+# Si el escritor muere fuera de su try por mensaje (memoria, un error al
+# abrir la base, kill...) nadie vacía la cola: los put y get bloqueantes
+# colgarían la corrida. Todos esperan de a ESPERA_ESCRITOR segundos y
+# revisan entre medio si el escritor sigue vivo. Cuando muere, un hilo del
+# proceso principal (_vigilar_escritor) además descarta lo que queda en la
+# cola: un lote ya aceptado por put sigue escribiéndose al pipe en un hilo
+# del worker, y el worker no termina hasta que alguien lo lee.
+
+
+def _iniciar_worker(cola, escritor_caido, turno):
+    global _cola, _escritor_caido, _turno
+    _cola = cola
+    _escritor_caido = escritor_caido
+    _turno = turno
+
+
+def _poner(cola, mensaje, caido):
+    """Pone mensaje en la cola; False si caido() indica que el escritor terminó antes."""
+    while True:
+        try:
+            cola.put(mensaje, timeout=ESPERA_ESCRITOR)
+            return True
+        except queue.Full:
+            if caido():
+                return False
+
+
+def _vigilar_escritor(escritor, cola, escritor_caido, fin):
+    """
+    Hilo del proceso principal: si el escritor termina con error, avisa a los
+    workers con escritor_caido y descarta los lotes de la cola hasta `fin`.
+    """
+    escritor.join()  # Da igual si el proceso principal lo recoge primero: el código queda en el Process
+    if escritor.exitcode == 0:  # Terminó normal, después del None final
+        return
+    escritor_caido.set()
+    while not fin.is_set():
+        try:
+            cola.get(timeout=ESPERA_ESCRITOR)
+        except queue.Empty:
+            pass
+
+
+# ==============================
+# ENVÍO POR BLOQUES
+# ==============================
+# Una cartola con parsear_bloques no se arma completa en el worker: cada
+# bloque pasa por la cola apenas se parsea y el escritor se los entrega a
+# guardar_movimientos como iterable (orden_inverso=True la deja de la más
+# antigua a la más reciente). La memoria queda acotada por MAX_EN_COLA
+# bloques, sin importar el largo del archivo. Mensajes:
+#   (path, parser, BLOQUES, segundos, manifiesto)   encabezado
+#   DataFrame, DataFrame, ...                       bloques
+#   FIN_BLOQUES o (ERROR_BLOQUES, texto)            cierre
+# Para que los mensajes de dos archivos no se intercalen, cada worker toma
+# _turno antes de mandar un archivo (por bloques o entero) y lo suelta el
+# escritor al leer el último mensaje de ese archivo: put vuelve antes de que
+# el hilo de la cola escriba en el pipe, así que soltarlo en el worker no
+# alcanza. Estos envíos no usan la caché de parseo (guardarla exigiría el
+# DataFrame completo); las cartolas ya cargadas igual se omiten por el
+# manifiesto sin parsear.
+
+BLOQUES = "bloques"
+FIN_BLOQUES = "fin_bloques"
+ERROR_BLOQUES = "error_bloques"
+
+
+class _EnvioInterrumpido(Exception):
+    """El worker no terminó de mandar los bloques (el error lo informa el worker)."""
+
+
+def _enviar(mensaje):
+    if not _poner(_cola, mensaje, _escritor_caido.is_set):
+        raise RuntimeError("el escritor terminó antes de recibir el archivo")
+
+
+def _tomar_turno():
+    """Espera el turno de la cola; error si el escritor terminó antes (nadie lo soltaría)."""
+    while not _turno.acquire(timeout=ESPERA_ESCRITOR):
+        if _escritor_caido.is_set():
+            raise RuntimeError("el escritor terminó antes de recibir el archivo")
+
+
+def _enviar_bloques(path, nombre_parser, bloques, segundos, manifiesto):
+    """Manda encabezado, bloques y cierre; si el parseo falla a la mitad, avisa al escritor y relanza."""
+    _tomar_turno()
+    _enviar((path, nombre_parser, BLOQUES, segundos, manifiesto))
+    try:
+        for bloque in bloques:
+            _enviar(bloque)
+    except Exception as e:
+        _poner(_cola, (ERROR_BLOQUES, f"{type(e).__name__}: {e}"), _escritor_caido.is_set)
+        raise
+    _enviar(FIN_BLOQUES)
+
+
+def _recibir_bloques(cola, turno, estado):
+    """
+    En el escritor: los bloques de un envío hasta su cierre, que suelta el
+    turno. Si el envío se corta lanza _EnvioInterrumpido (guardar_movimientos
+    hace rollback); si llega el None de fin de corrida (el worker murió) lo
+    anota en estado.
+    """
+    while True:
+        mensaje = cola.get()
+        if isinstance(mensaje, pd.DataFrame):
+            yield mensaje
+            continue
+        if mensaje is None:
+            estado["fin_corrida"] = True
+            raise _EnvioInterrumpido("envío incompleto")
+        turno.release()
+        if mensaje == FIN_BLOQUES:
+            return
+        raise _EnvioInterrumpido(mensaje[1])
+
+
+def _parsear_archivo(nombre_parser, path, db_path, usar_cache=True, modo_empalme=False):
+    """
+    Corre en un worker: si el contenido ya está en el manifiesto lo omite sin
+    parsear; si no, parsea el archivo (o lo toma de la caché de parseo, ver
+    cache_parseo.py) y manda el lote normalizado al escritor. Las cartolas
+    con parsear_bloques se mandan por bloques (ver ENVÍO POR BLOQUES), salvo
+    con modo_empalme, que necesita la cartola entera.
+
+    Devuelve None si se envió al escritor, o el resumen del archivo omitido.
+    """
+    inicio = time.perf_counter()
+    parser = PARSERS[nombre_parser]
+
+    manifiesto = None
+    if parser["version"] is not None:
+        manifiesto = preparar_manifiesto(path, nombre_parser, parser["version"])
+        estado = verificar_archivo(db_path, manifiesto)
+        if estado["batch_id"] is not None:
+            return {
+                "archivo": path, "parser": nombre_parser, "filas": 0, "insertados": 0, "duplicados": 0,
+                "segundos": time.perf_counter() - inicio, "batch_id": estado["batch_id"],
+                "omitido": True, "error": None,
+            }
+
+    if parser["parsear_bloques"] is not None and not modo_empalme:
+        _enviar_bloques(path, nombre_parser, parser["parsear_bloques"](path), time.perf_counter() - inicio,
+                        manifiesto)
+        return None
+
+    if usar_cache:
+        sha256 = manifiesto["sha256"] if manifiesto is not None else hash_archivo(path)
+        df, _ = parsear_con_cache(path, nombre_parser, parser["version_cache"], parser["parsear"], sha256)
+    else:
+        df = parser["parsear"](path)
+    segundos = time.perf_counter() - inicio
+
+    _tomar_turno()
+    _enviar((path, nombre_parser, df, segundos, manifiesto))
+    return None
+
+
+def _escritor(cola, resultados, turno, db_path, modo_empalme=False):
+    """
+    Único proceso que escribe en SQLite: toma los lotes de la cola en el orden
+    en que llegan y los inserta (una transacción por archivo). Con
+    modo_empalme las cartolas se empalman con lo guardado (ver empalme.py).
+    Termina al recibir None y avisa con None en `resultados`.
+    """
+    con_facturas = sqlite3.connect(db_path)
+    con_facturas.execute("PRAGMA foreign_keys = ON;")
+    hubo_facturas = False
+    estado = {"fin_corrida": False}
+
+    while not estado["fin_corrida"]:
+        mensaje = cola.get()
+        if mensaje is None:
+            break
+
+        path, nombre_parser, df, segundos_parseo, manifiesto = mensaje
+        por_bloques = isinstance(df, str)  # BLOQUES: los bloques vienen en los mensajes siguientes
+        if not por_bloques:
+            turno.release()
+        resumen = {
+            "archivo": path, "parser": nombre_parser, "filas": None if por_bloques else len(df),
+            "batch_id": None, "omitido": False, "error": None,
+        }
+        inicio = time.perf_counter()
+
+        try:
+            if por_bloques:
+                bloques = _recibir_bloques(cola, turno, estado)
+                try:
+                    resultado = guardar_movimientos(bloques, db_path, orden_inverso=True, manifiesto=manifiesto)
+                finally:
+                    for _ in bloques:  # Lo que no se leyó (p. ej. lote ya cargado en esta corrida)
+                        pass
+                insertados = resultado["insertados"]
+                resumen["filas"] = resultado["filas"]
+                resumen["batch_id"] = resultado["batch_id"]
+                resumen["omitido"] = resultado["omitido"]
+            elif PARSERS[nombre_parser]["destino"] == DESTINO_FACTURAS:
+                conteo = parse_facturas_emitidas.guardar_facturas(
+                    con_facturas, df, solo_completar=PARSERS[nombre_parser]["solo_completar"],
+                )
+                insertados = conteo["nuevas"]
+                # Ya cargadas pero con otro contenido (estado, cancelación...)
+                resumen["actualizadas"] = conteo["cambiadas"]
+                hubo_facturas = True
+            elif modo_empalme:
+                resultado = empalmar(df, db_path, manifiesto=manifiesto)
+                insertados = resultado["insertados"]
+                resumen["batch_id"] = resultado["batch_id"]
+                resumen["omitido"] = resultado["omitido"]
+                resumen["solape"] = resultado["solape"]
+                resumen["modo"] = resultado["modo"]
+                resumen["quiebres"] = len(resultado["quiebres"])
+            else:
+                resultado = guardar_movimientos(df, db_path, manifiesto=manifiesto)
+                insertados = resultado["insertados"]
+                resumen["batch_id"] = resultado["batch_id"]
+                # Otro archivo con el mismo contenido se cargó en esta misma corrida
+                resumen["omitido"] = resultado["omitido"]
+            resumen["insertados"] = insertados
+            resumen["duplicados"] = 0 if resumen["omitido"] else resumen["filas"] - insertados
+        except _EnvioInterrumpido:
+            continue  # Sin resumen: el error ya lo informa el worker
+        except Exception as e:
+            resumen["error"] = f"{type(e).__name__}: {e}"
+
+        resumen["segundos"] = segundos_parseo + time.perf_counter() - inicio
+        resultados.put(resumen)
+
+    if hubo_facturas:
+        # Índice de contrapartes (n-gramas de razon_receptor) para la conciliación
+        actualizar_indice(con_facturas)
+    con_facturas.close()
+
+    resultados.put(None)
+
+# ==============================
+# INGESTA
+# ==============================
+def ingestar(rutas, db_path=DB_PATH, parser=None, max_workers=MAX_WORKERS, modo_empalme=False, usar_cache=True):
+    """
+    Carga todos los archivos de `rutas` (archivos o carpetas):
+    - cada archivo se asocia a un parser del registro (o al indicado en `parser`)
+    - los archivos se parsean en paralelo en un pool de procesos
+    - un único proceso escritor inserta en la base, así SQLite no compite por el lock
+    - las cartolas cuyo contenido ya está en ingest_batches se omiten sin parsear
+    - con modo_empalme cada cartola se empalma con lo guardado por la cadena de saldos
+    - con usar_cache un archivo ya parseado con el mismo código se lee de la caché
+    - si el escritor termina antes de tiempo, los archivos que no alcanzó a
+      guardar vuelven con error (con su código de salida) y la corrida no se cuelga
+
+    Devuelve una lista de dicts por archivo: archivo, parser, filas,
+    insertados, duplicados, segundos, batch_id, omitido, error.
+    """
+    resumen = []
+    tareas = []
+    for path in listar_archivos(rutas):
+        nombre_parser = parser or detectar_parser(path)
+        if nombre_parser is None:
+            resumen.append({"archivo": str(path), "parser": None, "error": "sin parser para este archivo"})
+        else:
+            tareas.append((nombre_parser, str(path)))
+
+    if not tareas:
+        return resumen
+
+    cola = mp.Queue(maxsize=MAX_EN_COLA)
+    resultados = mp.Queue()
+    escritor_caido = mp.Event()
+    turno = mp.Lock()
+    escritor = mp.Process(target=_escritor, args=(cola, resultados, turno, str(db_path), modo_empalme))
+    escritor.start()
+    fin = threading.Event()
+    vigilante = threading.Thread(target=_vigilar_escritor, args=(escritor, cola, escritor_caido, fin), daemon=True)
+    vigilante.start()
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers, len(tareas)),
+            initializer=_iniciar_worker,
+            initargs=(cola, escritor_caido, turno),
+        ) as pool:
+            futuros = {
+                pool.submit(_parsear_archivo, *tarea, str(db_path), usar_cache, modo_empalme): tarea
+                for tarea in tareas
+            }
+            pendientes = set(futuros)
+            while pendientes:
+                listos, pendientes = wait(pendientes, timeout=ESPERA_ESCRITOR, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    if futuro.cancelled():
+                        continue
+                    nombre_parser, path = futuros[futuro]
+                    error = futuro.exception()
+                    if error is not None:
+                        resumen.append({
+                            "archivo": path,
+                            "parser": nombre_parser,
+                            "error": f"{type(error).__name__}: {error}",
+                        })
+                    elif futuro.result() is not None:
+                        resumen.append(futuro.result())
+                if escritor_caido.is_set():
+                    # Los que no empezaron no se parsean (quedan sin guardar)
+                    for futuro in pendientes:
+                        futuro.cancel()
+    finally:
+        _poner(cola, None, escritor_caido.is_set)
+
+    while True:
+        vivo = escritor.is_alive()  # Antes del get: si ya había muerto, lo que dejó en la cola ya se leyó
+        try:
+            r = resultados.get(timeout=ESPERA_ESCRITOR)
+        except queue.Empty:
+            if vivo:
+                continue
+            break
+        if r is None:
+            break
+        resumen.append(r)
+    escritor.join()
+    fin.set()
+    vigilante.join()
+
+    if escritor.exitcode != 0:
+        cola.cancel_join_thread()  # El None final puede no tener quién lo lea
+        error = f"el escritor terminó con código {escritor.exitcode}"
+        informados = {r["archivo"] for r in resumen}
+        sin_guardar = [(nombre_parser, path) for nombre_parser, path in tareas if path not in informados]
+        for nombre_parser, path in sin_guardar:
+            resumen.append({"archivo": path, "parser": nombre_parser, "error": f"{error} sin guardarlo"})
+        if not sin_guardar:
+            resumen.append({"archivo": "(escritor)", "parser": None, "error": error})
+
+    orden = {path: i for i, (_, path) in enumerate(tareas)}
+    return sorted(resumen, key=lambda r: orden.get(r["archivo"], -1))
+
+
+def imprimir_resumen(resumen, usar_cache=True):
+    print(f"{'archivo':<50} {'parser':<9} {'filas':>8} {'nuevos':>8} {'duplic.':>8} {'seg':>7} {'lote':>6}")
+    for r in resumen:
+        nombre = Path(r["archivo"]).name[:50]
+        if r.get("error"):
+            print(f"❌ {nombre:<48} {r['parser'] or '-':<9} {r['error']}")
+            continue
+        if r["omitido"]:
+            print(f"⏭️ {nombre:<48} {r['parser']:<9} ya cargado (lote {r['batch_id']}) {r['segundos']:>7.2f}")
+            continue
+        print(
+            f"{nombre:<50} {r['parser']:<9} {r['filas']:>8} {r['insertados']:>8} "
+            f"{r['duplicados']:>8} {r['segundos']:>7.2f} {r['batch_id'] or '-':>6}"
+        )
+        if r.get("modo") == "SIN_SOLAPE":
+            print("   ⚠️ fechas cruzadas con lo guardado sin solape reconocible (carga normal por dedup_key)")
+        elif r.get("modo") == "CONTENIDO":
+            print("   ⏭️ todo el archivo ya estaba dentro de lo guardado")
+        elif "solape" in r:
+            print(f"   🔗 solape con lo guardado: {r['solape']} filas")
+        if r.get("actualizadas"):
+            print(f"   🔄 {r['actualizadas']} facturas actualizadas")
+        if r.get("quiebres"):
+            print(f"   ❌ {r['quiebres']} quiebres en la cadena de saldos")
+
+    ok = [r for r in resumen if not r.get("error")]
+    omitidos = sum(1 for r in ok if r["omitido"])
+    print(
+        f"✅ {len(ok) - omitidos} archivos cargados, {omitidos} omitidos, {len(resumen) - len(ok)} con error | "
+        f"{sum(r['insertados'] for r in ok)} filas nuevas, "
+        f"{sum(r['duplicados'] for r in ok)} duplicadas"
+    )
+    if usar_cache and not cache_disponible():
+        print("⚠️ caché de parseo desactivada: falta pyarrow (pip install pyarrow)")
+    if not espejo_disponible():
+        print("⚠️ espejo Parquet desactivado: falta pyarrow (pip install pyarrow)")
+
+# ==============================
+# MAIN
+# ==============================
+def main():
+    ap = argparse.ArgumentParser(description="Carga masiva de cartolas BBVA / Banregio y CFDI emitidos (Excel o XML)")
+    ap.add_argument("rutas", nargs="+", help="Archivos o carpetas a cargar")
+    ap.add_argument("--parser", choices=sorted(PARSERS), help="Forzar un parser para todos los archivos")
+    ap.add_argument("--workers", type=int, default=MAX_WORKERS, help="Procesos parseando en paralelo")
+    ap.add_argument("--db", default=str(DB_PATH), help="Ruta de la base SQLite")
+    ap.add_argument("--empalmar", action="store_true",
+                    help="Empalmar cada cartola con lo guardado usando la cadena de saldos")
+    ap.add_argument("--sin-cache", action="store_true", help="Parsear siempre, sin usar la caché de parseo")
+    args = ap.parse_args()
+
+    inicio = time.perf_counter()
+    resumen = ingestar(args.rutas, db_path=args.db, parser=args.parser, max_workers=args.workers,
+                       modo_empalme=args.empalmar, usar_cache=not args.sin_cache)
+    imprimir_resumen(resumen, usar_cache=not args.sin_cache)
+    print(f"⏱️ Total: {time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import hashlib
+import sqlite3
+from pathlib import Path
+
+from espejo_parquet import borrar_lote, directorio_espejo
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+BLOQUE_HASH = 1 << 20  # Bytes leídos por vuelta al calcular el hash (1 MiB)
+
+# ==============================
+# HASH Y CONSULTAS
+# ==============================
+def hash_archivo(path):
+    """SHA-256 del contenido del archivo, leído por bloques (no depende del nombre)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while bloque := f.read(BLOQUE_HASH):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def preparar_manifiesto(path, parser, parser_version):
+    """Dict con lo que identifica una carga: archivo, sha256, parser y versión del parser."""
+    return {
+        "archivo": Path(path).name,
+        "sha256": hash_archivo(path),
+        "parser": parser,
+        "parser_version": parser_version,
+    }
+
+
+def buscar_batch(conn, manifiesto):
+    """id del lote que ya cargó este mismo contenido con esta versión del parser, o None."""
+    fila = conn.execute("""
+        SELECT id FROM ingest_batches
+        WHERE sha256 = ? AND parser = ? AND parser_version = ?
+    """, (manifiesto["sha256"], manifiesto["parser"], manifiesto["parser_version"])).fetchone()
+    return fila[0] if fila else None
+
+
+def verificar_archivo(db_path, manifiesto):
+    """
+    Revisa el manifiesto antes de parsear un archivo.
+
+    Devuelve un dict con:
+    - batch_id: lote que ya cargó este contenido (None si hay que cargarlo)
+    - cambiado: lotes anteriores con el mismo nombre de archivo pero otro contenido
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        batch_id = buscar_batch(conn, manifiesto)
+        cambiado = [
+            fila[0] for fila in conn.execute("""
+                SELECT id FROM ingest_batches
+                WHERE archivo = ? AND parser = ? AND sha256 <> ?
+                ORDER BY id
+            """, (manifiesto["archivo"], manifiesto["parser"], manifiesto["sha256"]))
+        ]
+    finally:
+        conn.close()
+
+    return {"batch_id": batch_id, "cambiado": cambiado}
+
+
+def registrar_batch(cursor, manifiesto):
+    """Crea el registro del lote (dentro de la transacción de la carga) y devuelve su id."""
+    cursor.execute("""
+        INSERT INTO ingest_batches (archivo, sha256, parser, parser_version)
+        VALUES (?, ?, ?, ?)
+    """, (manifiesto["archivo"], manifiesto["sha256"], manifiesto["parser"], manifiesto["parser_version"]))
+    return cursor.lastrowid
+
+
+def cerrar_batch(cursor, batch_id, filas, insertados):
+    cursor.execute("""
+        UPDATE ingest_batches SET filas = ?, insertados = ? WHERE id = ?
+    """, (filas, insertados, batch_id))
+
+# ==============================
+# REVERTIR UNA CARGA
+# ==============================
+def revertir_batch(db_path, batch_id):
+    """
+    Borra todo lo que insertó un lote: sus movimientos (DELETE por batch_id,
+    indexado), las conciliaciones de esos movimientos, el registro del
+    manifiesto y sus archivos del espejo Parquet, para que el archivo se
+    pueda volver a cargar.
+
+    Devuelve cuántos movimientos se borraron.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute("""
+                DELETE FROM conciliaciones
+                WHERE movimiento_id IN (SELECT id FROM movimientos_bancarios WHERE batch_id = ?)
+            """, (batch_id,))
+            borrados = conn.execute(
+                "DELETE FROM movimientos_bancarios WHERE batch_id = ?", (batch_id,)
+            ).rowcount
+            conn.execute("DELETE FROM ingest_batches WHERE id = ?", (batch_id,))
+    finally:
+        conn.close()
+
+    borrar_lote(batch_id, directorio_espejo(db_path))
+    return borrados
+
+# ==============================
+# MAIN
+# ==============================
+def main():
+    ap = argparse.ArgumentParser(description="Lotes cargados (ingest_batches)")
+    ap.add_argument("--revertir", type=int, metavar="BATCH_ID", help="Borrar todo lo que cargó el lote")
+    ap.add_argument("--db", default=str(DB_PATH), help="Ruta de la base SQLite")
+    args = ap.parse_args()
+
+    if args.revertir is not None:
+        borrados = revertir_batch(args.db, args.revertir)
+        print(f"🟡 Lote {args.revertir} revertido: {borrados} movimientos borrados")
+        return
+
+    conn = sqlite3.connect(args.db)
+    for fila in conn.execute("""
+        SELECT id, created_at, parser, parser_version, filas, insertados, archivo
+        FROM ingest_batches
+        ORDER BY id
+    """):
+        print("{:>5}  {}  {:<9} v{:<3} {:>8} {:>8}  {}".format(*fila))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+from bulk_loader import clave_dedup
+from busqueda import crear_indice
+from parse_facturas_emitidas import COLUMNAS_HASH, hash_factura
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+CHUNK_SIZE = 50_000  # Filas leídas por vuelta al recalcular claves
+
+# ==============================
+# HELPERS
+# ==============================
+def columnas_tabla(conn, tabla):
+    return {fila[1] for fila in conn.execute(f"PRAGMA table_info({tabla})")}
+
+# ==============================
+# MIGRACIONES
+# ==============================
+def migrar_batch_id(conn):
+    """Columna batch_id (manifiesto ingest_batches) en movimientos_bancarios."""
+    if "batch_id" in columnas_tabla(conn, "movimientos_bancarios"):
+        return None
+
+    with conn:
+        conn.execute("ALTER TABLE movimientos_bancarios ADD COLUMN batch_id INTEGER REFERENCES ingest_batches (id);")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_batch ON movimientos_bancarios (batch_id);")
+    return "columna batch_id agregada"
+
+
+def migrar_dedup_key(conn):
+    """
+    Reemplaza el UNIQUE de 10 columnas de movimientos_bancarios por dedup_key
+    (hash de 64 bits, ver bulk_loader.clave_dedup).
+
+    SQLite no permite quitar un UNIQUE con ALTER TABLE, así que la tabla se
+    reconstruye en el mismo archivo:
+    1) se calcula la clave de cada fila existente (por bloques)
+    2) se copia a una tabla nueva conservando los id; si varias filas dan la
+       misma clave se queda la de menor id
+    3) las conciliaciones de las filas descartadas pasan a la fila conservada
+    4) se reemplaza la tabla y se recupera el espacio con VACUUM
+    """
+    if "dedup_key" in columnas_tabla(conn, "movimientos_bancarios"):
+        return None
+
+    conn.execute("BEGIN")
+    try:
+        conn.execute("CREATE TEMP TABLE claves_dedup (id INTEGER PRIMARY KEY, dedup_key INTEGER NOT NULL)")
+
+        for bloque in pd.read_sql("""
+            SELECT id, fecha, banco, cuenta, descripcion, referencia_movimiento, abonos, cargos, saldo
+            FROM movimientos_bancarios
+            ORDER BY id
+        """, conn, chunksize=CHUNK_SIZE):
+            conn.executemany(
+                "INSERT INTO claves_dedup (id, dedup_key) VALUES (?, ?)",
+                zip(bloque["id"].tolist(), clave_dedup(bloque).tolist()),
+            )
+
+        conn.execute("""
+            CREATE TEMP TABLE remapeo_dedup AS
+            SELECT c.id AS viejo, k.id AS nuevo
+            FROM claves_dedup c
+            JOIN (SELECT dedup_key, MIN(id) AS id FROM claves_dedup GROUP BY dedup_key) k
+              ON k.dedup_key = c.dedup_key
+            WHERE c.id <> k.id
+        """)
+
+        conn.execute("""
+            CREATE TABLE movimientos_bancarios_nueva (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+                fecha TEXT NOT NULL,
+
+                banco TEXT,
+                cuenta TEXT,
+
+                banco_origen TEXT,
+                cuenta_origen TEXT,
+
+                rut_pagador TEXT,
+                nombre_contraparte TEXT,
+
+                tipo_documento TEXT,
+                moneda TEXT,
+
+                descripcion TEXT,
+                comentario_movimiento TEXT,
+                referencia_movimiento TEXT,
+
+                abonos REAL DEFAULT 0,
+                cargos REAL DEFAULT 0,
+                saldo REAL,
+                neto REAL,
+
+                batch_id INTEGER REFERENCES ingest_batches (id),
+
+                dedup_key INTEGER NOT NULL UNIQUE,
+
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        columnas = """
+            id, fecha, banco, cuenta, banco_origen, cuenta_origen, rut_pagador,
+            nombre_contraparte, tipo_documento, moneda, descripcion,
+            comentario_movimiento, referencia_movimiento, abonos, cargos, saldo,
+            neto, batch_id, created_at
+        """
+        conn.execute(f"""
+            INSERT INTO movimientos_bancarios_nueva ({columnas}, dedup_key)
+            SELECT {", ".join("m." + c.strip() for c in columnas.split(","))}, c.dedup_key
+            FROM movimientos_bancarios m
+            JOIN claves_dedup c ON c.id = m.id
+            WHERE m.id NOT IN (SELECT viejo FROM remapeo_dedup)
+            ORDER BY m.id
+        """)
+
+        # Conciliaciones de filas repetidas -> fila conservada
+        conn.execute("""
+            UPDATE OR IGNORE conciliaciones
+            SET movimiento_id = (SELECT nuevo FROM remapeo_dedup WHERE viejo = conciliaciones.movimiento_id)
+            WHERE movimiento_id IN (SELECT viejo FROM remapeo_dedup)
+        """)
+        conn.execute("DELETE FROM conciliaciones WHERE movimiento_id IN (SELECT viejo FROM remapeo_dedup)")
+
+        total = conn.execute("SELECT COUNT(*) FROM claves_dedup").fetchone()[0]
+        repetidas = conn.execute("SELECT COUNT(*) FROM remapeo_dedup").fetchone()[0]
+
+        conn.execute("DROP TABLE movimientos_bancarios")
+        conn.execute("ALTER TABLE movimientos_bancarios_nueva RENAME TO movimientos_bancarios")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_batch ON movimientos_bancarios (batch_id)")
+
+        conn.execute("DROP TABLE claves_dedup")
+        conn.execute("DROP TABLE remapeo_dedup")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    conn.execute("VACUUM")
+    return f"{total} movimientos con dedup_key, {repetidas} repetidos eliminados"
+
+
+# Índices de las consultas por rango (ver consultas.py)
+INDICES_CONSULTA = {
+    "idx_movimientos_banco_fecha": "movimientos_bancarios (banco, fecha)",
+    "idx_movimientos_fecha": "movimientos_bancarios (fecha)",
+    "idx_movimientos_referencia": "movimientos_bancarios (referencia_movimiento)",
+    "idx_facturas_fecha": "facturas_emitidas_mx (fecha_emision)",
+    "idx_facturas_rfc_fecha": "facturas_emitidas_mx (rfc_receptor, fecha_emision)",
+}
+
+
+def migrar_indices_consulta(conn):
+    """
+    Índices para exportar por rango de fechas, buscar el último mes
+    registrado, cruzar referencias y listar facturas abiertas por RFC sin
+    recorrer las tablas completas. ANALYZE deja estadísticas para que el
+    planificador elija entre (banco, fecha) y (fecha).
+    """
+    existentes = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    nuevos = [nombre for nombre in INDICES_CONSULTA if nombre not in existentes]
+    if not nuevos:
+        return None
+
+    with conn:
+        for nombre in nuevos:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON {INDICES_CONSULTA[nombre]}")
+    conn.execute("ANALYZE")
+    return f"{len(nuevos)} índices creados ({', '.join(nuevos)})"
+
+
+def migrar_tipos_cambio(conn):
+    """Tabla tipos_cambio: un tipo por día y par de monedas (ver tipo_cambio.py)."""
+    if columnas_tabla(conn, "tipos_cambio"):
+        return None
+
+    with conn:
+        conn.execute("""
+            CREATE TABLE tipos_cambio (
+                moneda TEXT NOT NULL,
+                moneda_destino TEXT NOT NULL,
+                fecha TEXT NOT NULL,
+
+                tipo_cambio REAL NOT NULL,  -- Unidades de moneda_destino por una de moneda
+                fuente TEXT,
+
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+
+                PRIMARY KEY (moneda, moneda_destino, fecha)
+            ) WITHOUT ROWID
+        """)
+    return "tabla tipos_cambio creada"
+
+
+def migrar_hash_facturas(conn):
+    """
+    Columna contenido_hash en facturas_emitidas_mx (ver
+    parse_facturas_emitidas.guardar_facturas), calculada para las facturas
+    ya cargadas para que una recarga sin cambios no las reescriba.
+    """
+    if "contenido_hash" not in columnas_tabla(conn, "facturas_emitidas_mx"):
+        with conn:
+            conn.execute("ALTER TABLE facturas_emitidas_mx ADD COLUMN contenido_hash TEXT")
+
+    total = 0
+    with conn:
+        for bloque in pd.read_sql(f"""
+            SELECT uuid, {", ".join(COLUMNAS_HASH)}
+            FROM facturas_emitidas_mx
+            WHERE contenido_hash IS NULL
+        """, conn, chunksize=CHUNK_SIZE):
+            bloque = bloque.astype(object).where(bloque.notna(), None)
+            conn.executemany(
+                "UPDATE facturas_emitidas_mx SET contenido_hash = ? WHERE uuid = ?",
+                (
+                    (hash_factura(valores), uuid)
+                    for uuid, valores in zip(
+                        bloque["uuid"].tolist(),
+                        bloque[COLUMNAS_HASH].itertuples(index=False, name=None),
+                    )
+                ),
+            )
+            total += len(bloque)
+    return f"{total} facturas con contenido_hash" if total else None
+
+
+def migrar_busqueda_texto(conn):
+    """Índice de texto completo de los movimientos y sus triggers (ver busqueda.py)."""
+    existentes = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "movimientos_fts" in existentes:
+        return None
+    return f"índice de texto con {crear_indice(conn)} movimientos"
+
+
+def migrar_version_facturas(conn):
+    """
+    Columna version en facturas_emitidas_mx (ver
+    parse_facturas_emitidas.UPSERT_SQL) con su índice único. Las facturas
+    ya cargadas se numeran en el orden en que cambiaron (updated_at, id).
+    """
+    if "version" not in columnas_tabla(conn, "facturas_emitidas_mx"):
+        with conn:
+            conn.execute("ALTER TABLE facturas_emitidas_mx ADD COLUMN version INTEGER")
+
+    with conn:
+        base = conn.execute("SELECT COALESCE(MAX(version), 0) FROM facturas_emitidas_mx").fetchone()[0]
+        ids = [fila[0] for fila in conn.execute(
+            "SELECT id FROM facturas_emitidas_mx WHERE version IS NULL ORDER BY updated_at, id"
+        )]
+        conn.executemany(
+            "UPDATE facturas_emitidas_mx SET version = ? WHERE id = ?",
+            ((base + i, id_) for i, id_ in enumerate(ids, start=1)),
+        )
+        conn.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_facturas_version
+            ON facturas_emitidas_mx (version)
+        """)
+    return f"{len(ids)} facturas con version" if ids else None
+
+
+# Orden en que se aplican (el nombre queda registrado en schema_migrations)
+MIGRACIONES = [
+    ("001_batch_id", migrar_batch_id),
+    ("002_dedup_key", migrar_dedup_key),
+    ("003_indices_consulta", migrar_indices_consulta),
+    ("004_tipos_cambio", migrar_tipos_cambio),
+    ("005_hash_facturas", migrar_hash_facturas),
+    ("006_busqueda_texto", migrar_busqueda_texto),
+    ("007_version_facturas", migrar_version_facturas),
+]
+
+# ==============================
+# APLICAR
+# ==============================
+def aplicar_migraciones(db_path=DB_PATH):
+    """
+    Aplica, en orden, las migraciones que todavía no figuran en
+    schema_migrations. En una base nueva (ya creada con el esquema actual)
+    las de columnas solo se registran; los índices y tablas nuevas sí se crean.
+
+    Devuelve una lista (nombre, detalle) de las migraciones que cambiaron algo.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    nombre TEXT PRIMARY KEY,
+                    aplicada_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        aplicadas = {fila[0] for fila in conn.execute("SELECT nombre FROM schema_migrations")}
+
+        cambios = []
+        for nombre, migrar in MIGRACIONES:
+            if nombre in aplicadas:
+                continue
+            detalle = migrar(conn)
+            with conn:
+                conn.execute("INSERT INTO schema_migrations (nombre) VALUES (?)", (nombre,))
+            if detalle:
+                cambios.append((nombre, detalle))
+    finally:
+        conn.close()
+
+    return cambios
+
+
+def main():
+    cambios = aplicar_migraciones(DB_PATH)
+    for nombre, detalle in cambios:
+        print(f"🔧 {nombre}: {detalle}")
+    print(f"✅ Base al día ({len(cambios)} migraciones aplicadas)")
+
+
+if __name__ == "__main__":
+    main()
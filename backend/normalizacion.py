@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+# ==============================
+# NORMALIZACIÓN DE MONTOS Y FECHAS
+# ==============================
+# Conversión de columnas completas (nunca valor por valor) usada por los
+# tres parsers. Cada función devuelve (valores, no_parseadas):
+# - valores: la columna convertida, con el mismo índice
+# - no_parseadas: Serie con el valor ORIGINAL de las filas que traían algo
+#   pero no se pudieron convertir (los vacíos no cuentan como error)
+#
+# Primero va un camino rápido (to_numeric directo / formatos explícitos) y
+# solo lo que no calza pasa por la limpieza o el parseo flexible.
+
+MAX_EJEMPLOS = 5  # Valores mostrados al avisar filas no parseadas
+
+# ==============================
+# HELPERS
+# ==============================
+def _texto(serie):
+    """
+    Texto sin espacios extremos y máscara (numpy) de las filas que traen
+    algo: NaN, None y "" cuentan como vacíos.
+    """
+    texto = serie.astype(str).str.strip()
+    presente = texto.notna().to_numpy() & (texto != "").to_numpy(dtype=bool, na_value=False)
+    return texto, presente
+
+
+def avisar_no_parseadas(columna, no_parseadas):
+    """Imprime cuántas filas de la columna no se pudieron convertir y algunos ejemplos."""
+    if no_parseadas.empty:
+        return
+    ejemplos = ", ".join(f"fila {i}: {v!r}" for i, v in no_parseadas.head(MAX_EJEMPLOS).items())
+    print(f"⚠️ {len(no_parseadas)} valores no reconocidos en '{columna}' ({ejemplos})")
+
+# ==============================
+# MONTOS
+# ==============================
+def _a_float(texto, presente):
+    """Textos a float; vacíos y los que no son número quedan como NaN."""
+    valores = texto.to_numpy(dtype=object, na_value="nan", copy=True)
+    valores[~presente] = "nan"
+    try:
+        # Camino rápido: todo el bloque es numérico (conversión en C)
+        return np.asarray(valores, dtype=float)
+    except ValueError:
+        return pd.to_numeric(pd.Series(valores), errors="coerce").to_numpy(dtype=float, na_value=np.nan, copy=True)
+
+
+def montos_a_centavos(serie, coma_decimal=False):
+    """
+    Convierte una columna de montos a centavos enteros exactos (Int64,
+    vacíos y no parseados como <NA>).
+
+    - Columnas numéricas (float/int del Excel) se convierten directo
+    - En texto la coma es separador de miles ("5,728,389.60"), salvo con
+      coma_decimal="auto": un texto con coma y sin punto usa la coma como
+      decimal ("1234,5" -> 1234.50)
+    - Solo lo que no calza en la primera pasada se limpia de "$" y espacios
+    """
+    serie = pd.Series(serie)
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        valores = serie.to_numpy(dtype=float, na_value=np.nan, copy=True)
+        presente = ~np.isnan(valores)
+    else:
+        texto, presente = _texto(serie)
+        if coma_decimal == "auto":
+            valores = _a_float(texto, presente)
+        else:
+            valores = _a_float(texto.str.replace(",", "", regex=False), presente)
+
+        pendientes = np.isnan(valores) & presente
+        if pendientes.any():
+            limpio = texto[pendientes].str.replace("$", "", regex=False).str.replace(" ", "", regex=False)
+            if coma_decimal == "auto":
+                decimal = limpio.str.contains(",", regex=False) & ~limpio.str.contains(".", regex=False)
+                limpio = limpio.where(
+                    ~decimal,
+                    limpio.str.replace(".", "", regex=False).str.replace(",", ".", regex=False),
+                )
+                limpio = limpio.where(decimal, limpio.str.replace(",", "", regex=False))
+            else:
+                limpio = limpio.str.replace(",", "", regex=False)
+            valores[pendientes] = _a_float(limpio, np.ones(len(limpio), dtype=bool))
+
+    validos = np.isfinite(valores)
+    centavos = pd.Series(pd.NA, index=serie.index, dtype="Int64")
+    # Redondeo comercial (0.125 -> 0.13), no el "al par" de np.round
+    centavos[validos] = (np.sign(valores[validos]) * np.floor(np.abs(valores[validos]) * 100 + 0.5)).astype(np.int64)
+
+    # Traían algo (no vacío) pero no quedó un monto
+    no_parseadas = serie[presente & ~validos]
+    return centavos, no_parseadas
+
+
+def centavos_a_monto(centavos, vacio=None):
+    """Centavos (Int64) a monto con 2 decimales; los <NA> quedan como `vacio`."""
+    montos = centavos.astype("Float64") / 100
+    if vacio is None:
+        return montos.astype(object).where(montos.notna(), None)
+    return montos.fillna(vacio).astype(float)
+
+# ==============================
+# FECHAS
+# ==============================
+def _fecha_sin_zona(valor, **opciones):
+    fecha = pd.to_datetime(valor, errors="coerce", **opciones)
+    if pd.notna(fecha) and fecha.tzinfo is not None:
+        fecha = fecha.tz_localize(None)
+    return fecha
+
+
+def _a_fechas(texto, **opciones):
+    """pd.to_datetime con errors="coerce"; las fechas con zona horaria quedan en su hora local."""
+    try:
+        fechas = pd.to_datetime(texto, errors="coerce", **opciones)
+    except (ValueError, TypeError):
+        # Zonas horarias mezcladas u otros casos raros: valor por valor
+        return texto.map(lambda v: _fecha_sin_zona(v, **opciones))
+    if fechas.dt.tz is not None:
+        fechas = fechas.dt.tz_localize(None)
+    return fechas
+
+
+def normalizar_fechas(serie, formatos=(), dayfirst=False):
+    """
+    Convierte una columna de fechas a datetime64.
+
+    - Si la columna ya es datetime se usa tal cual
+    - Los textos se prueban con cada formato explícito de `formatos`, en
+      orden, solo sobre lo que todavía no calzó
+    - Después ISO 8601 (también cubre los datetime sueltos del Excel)
+    - Lo que queda pasa por el parseo flexible (format="mixed", dayfirst)
+    """
+    serie = pd.Series(serie)
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie, serie[:0]
+
+    texto, presente = _texto(serie)
+    fechas = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[us]")
+
+    pasadas = [{"format": formato} for formato in formatos]
+    pasadas += [{"format": "ISO8601"}, {"format": "mixed", "dayfirst": dayfirst}]
+    for opciones in pasadas:
+        pendientes = fechas.isna().to_numpy() & presente
+        if not pendientes.any():
+            break
+        fechas[pendientes] = _a_fechas(texto[pendientes], **opciones)
+
+    no_parseadas = serie[fechas.isna().to_numpy() & presente]
+    return fechas, no_parseadas
@@ -2,6 +2,16 @@ import pandas as pd
 import re
 from pathlib import Path
 import sqlite3
+from openpyxl import load_workbook
+
+from bulk_loader import guardar_movimientos
+from consultas import COLUMNAS_MOVIMIENTOS_EXPORT, sql_movimientos, ultimo_mes_movimientos
+from esquema import aplicar_esquema
+from exportador import HOJAS_CARTOLA, exportar_consulta
+from manifiesto import preparar_manifiesto, verificar_archivo
+from normalizacion import avisar_no_parseadas, montos_a_centavos, normalizar_fechas
+from reglas import aplicar_reglas, construir_motor, imprimir_estadisticas
+from tipo_cambio import MONEDA_EMPRESA
 
 # ==============================
 # CONFIGURACIÓN
@@ -10,235 +20,305 @@ BASE_DIR = Path(__file__).parent
 DB_PATH = BASE_DIR / "db" / "conciliador.db"
 
 BANCO = "BANREGIO"
-MONEDA_DEFAULT = "MXN"
+PARSER = "banregio"
+PARSER_VERSION = "1"  # Subir al cambiar cómo se parsea (fuerza recargar)
+MONEDA_DEFAULT = MONEDA_EMPRESA
 
 INPUT_FILE = BASE_DIR / "Archivos ejemplos" / "MOV BANREGIO 19122025.xlsx"
 OUTPUT_FILE = BASE_DIR / "cartola_banregio_normalizada.xlsx"
 
+FORMATOS_FECHA = ("%d/%m/%Y",)  # Formato de la columna fecha (01/12/2025)
+
 # ==============================
-# FUNCIONES AUXILIARES
+# SPEI
 # ==============================
-def clean_amount(value):
-    if pd.isna(value) or value == "":
-        return 0.0
-    return float(str(value).replace(",", "").replace("$", "").strip())
-
-def parse_concepto(texto):
-    banco_origen = None
-    cuenta_origen = None
-    referencia = None
-    comentario = None
-    nombre_contraparte = None
-
-    descripcion = texto.strip()
-
-    # 🔹 Por defecto TODO es ABONO
-    tipo_documento = "ABONO BANCARIO"
-
-    # ----------------------------------
-    # SPEI
-    # ----------------------------------
-    if texto and "." in texto:
-        partes = [p.strip() for p in texto.split(".") if p.strip()]
-
-        # Validar SPEI exactamente como el código antiguo
-        if partes and partes[0][-4:] == "SPEI":
-
-            tipo_documento = "ABONO BANCARIO"
-
-            banco_origen = partes[1] if len(partes) > 1 else None
-            cuenta_origen = partes[2] if len(partes) > 2 else None
-
-            def es_referencia(p: str) -> bool:
-                p = p.strip()
-                # referencias típicas: BNET..., MBAN..., 036APPM..., 2025..., UUID, etc.
-                if re.fullmatch(r"\d{10,}", p):  # solo números largos
-                    return True
-                if len(p) >= 10 and re.search(r"[A-Z]", p) and re.search(r"\d", p):  # alfanum largo
-                    return True
-                if re.fullmatch(r"[A-F0-9]{8}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{12}", p, re.I):
-                    return True
-                return False
-
-            # Buscar índice donde comienza la referencia (después del nombre)
-            ref_idx = None
-            for i in range(3, len(partes)):
-                if es_referencia(partes[i]):
-                    ref_idx = i
-                    break
-
-            # Nombre = todo lo que está entre cuenta y referencia
-            if ref_idx is not None and ref_idx > 3:
-                nombre_contraparte = " ".join(partes[3:ref_idx]).strip()
-            else:
-                nombre_contraparte = partes[3] if len(partes) > 3 else None
-
-            # Referencia = primer bloque "tipo referencia" detectado
-            referencia = partes[ref_idx] if ref_idx is not None else None
-
-            # Comentario = último fragmento
-            comentario = partes[-1]
-
-
-
-    # ----------------------------------
-    # (NB) RECEPCION DE CUENTA
-    # ----------------------------------
-    elif texto.startswith("(NB)"):
-        banco_origen = "BANREGIO"
-
-        cuenta_match = re.search(r"cuenta:\s*(\d+)", texto, re.IGNORECASE)
-        if cuenta_match:
-            cuenta_origen = cuenta_match.group(1)
-
-        partes = texto.split(".", 1)
-        if len(partes) > 1:
-            comentario = partes[1].strip()
-
-    # ----------------------------------
-    # DEPOSITO EFECTIVO
-    # ----------------------------------
-    elif texto.startswith("DEPOSITO EFECTIVO"):
-        tipo_documento = "DEPOSITO"
-        banco_origen = "EFECTIVO"
-
-        ref = re.search(r"FOLIO:(\d+)", texto)
-        if ref:
-            referencia = ref.group(1)
-
-        comentario = re.sub(
-            r"DEPOSITO EFECTIVO PRACTIC/\*+\d+|\s*FOLIO:\d+",
-            "",
-            texto
-        ).strip()
-
-    # ----------------------------------
-    # DEPOSITO DE TERCERO
-    # ----------------------------------
-    elif texto.startswith("DEPOSITO DE TERCERO"):
-        tipo_documento = "DEPOSITO DE TERCERO"
-        banco_origen = "TERCERO"
-
-        ref = re.search(r"REFBNTC(\d+)", texto)
-        if ref:
-            referencia = ref.group(1)
-
-        comentario = re.sub(
-            r"DEPOSITO DE TERCERO/REFBNTC\d+|BMRCASH",
-            "",
-            texto
-        ).strip()
-
-    # ----------------------------------
-    # CARGO BANCARIO (ÚNICA REGLA)
-    # ----------------------------------
-    elif texto.startswith("(BE)"):
-        tipo_documento = "CARGO BANCARIO"
-
-        # Extraer texto después del primer punto
-        partes = texto.split(".", 1)
-        if len(partes) > 1:
-            comentario = partes[1].strip()
-        else:
-            comentario = descripcion
-
-
-    # ----------------------------------
-    # ABONO SIMPLE (CASOS GENÉRICOS)
-    # ----------------------------------
-    else:
-        comentario = descripcion
-
-    return {
-        "banco_origen": banco_origen,
-        "cuenta_origen": cuenta_origen,
-        "nombre_contraparte": nombre_contraparte,
-        "referencia_movimiento": referencia,
-        "comentario_movimiento": comentario,
-        "tipo_documento": tipo_documento,
-        "descripcion": descripcion,
-    }
-
-def extraer_cuenta_nb_be(texto):
+def _parse_spei_segmentos(texto):
     """
-    Extrae el número de cuenta solo para movimientos que comienzan con:
-    - (NB)
-    - (BE)
+    Parte toda la columna en segmentos por "." de una sola vez (formato largo:
+    un segmento por fila, con el índice de la fila original) y aplica la
+    heurística de es_referencia sobre todos los segmentos a la vez.
 
-    Ejemplos:
-    (NB) Recepcion de cuenta: 019027210018. FACTURA...
-    (BE) Traspaso a cuenta: 957979110017. ANTICIPO...
+    Devuelve un DataFrame indexado por fila SPEI con:
+    banco_origen, cuenta_origen, nombre_contraparte,
+    referencia_movimiento, comentario_movimiento
     """
-    if not isinstance(texto, str):
-        return None
+    seg = texto.str.split(".", regex=False).explode().str.strip()
+    seg = seg[seg != ""]
+    pos = seg.groupby(level=0).cumcount()
+
+    # Validar SPEI exactamente como el código antiguo: partes[0][-4:] == "SPEI"
+    primero = seg[pos == 0]
+    filas_spei = primero.index[primero.str[-4:] == "SPEI"]
+
+    en_spei = seg.index.isin(filas_spei)
+    seg = seg[en_spei]
+    pos = pos[en_spei]
+
+    out = pd.DataFrame(index=filas_spei, columns=[
+        "banco_origen",
+        "cuenta_origen",
+        "nombre_contraparte",
+        "referencia_movimiento",
+        "comentario_movimiento",
+    ], dtype=object)
+
+    if seg.empty:
+        return out
+
+    # es_referencia: números largos, alfanumérico largo o UUID
+    es_ref = (
+        seg.str.fullmatch(r"\d{10,}")
+        | ((seg.str.len() >= 10) & seg.str.contains(r"[A-Z]") & seg.str.contains(r"\d"))
+        | seg.str.fullmatch(r"[A-F0-9]{8}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{4}-[A-F0-9]{12}", case=False)
+    )
+
+    # Índice del primer segmento tipo referencia después del nombre (>= 3)
+    ref_idx = pos[es_ref & (pos >= 3)].groupby(level=0).min()
+    ref_idx_seg = pd.Series(seg.index.map(ref_idx), index=seg.index)
 
-    texto = texto.strip()
+    out["banco_origen"] = seg[pos == 1]
+    out["cuenta_origen"] = seg[pos == 2]
 
-    if texto.startswith("(NB)") or texto.startswith("(BE)"):
-        match = re.search(r"cuenta:\s*(\d+)", texto, re.IGNORECASE)
-        if match:
-            return match.group(1)
+    # Nombre = todo lo que está entre cuenta y referencia; si no hay
+    # referencia (o es el segmento 3) se toma solo partes[3]
+    en_nombre = (pos == 3) | ((pos > 3) & (pos < ref_idx_seg))
+    out["nombre_contraparte"] = seg[en_nombre].groupby(level=0).agg(" ".join)
 
-    return None
+    out["referencia_movimiento"] = seg[pos == ref_idx_seg]
+
+    # Comentario = último fragmento
+    out["comentario_movimiento"] = seg.groupby(level=0).last()
+
+    return out
+
+
+# ==============================
+# REGLAS DE CONCEPTOS
+# ==============================
+# Reglas de clasificación del concepto (formato en reglas.py). Los textos
+# con "." solo pueden ser SPEI; si no lo son quedan sin campos. El resto
+# queda como ABONO BANCARIO.
+CUENTA_NB_BE = re.compile(r"(?i)cuenta:\s*(?P<cuenta_origen>\d+)")
+
+REGLAS_BANREGIO = [
+    {
+        "nombre": "SPEI",
+        "prefijos": ("",),
+        "contiene": ".",
+        "funcion": _parse_spei_segmentos,
+    },
+    {
+        # (NB) Recepcion de cuenta: 019027210018 FACTURA...
+        "nombre": "(NB) RECEPCION DE CUENTA",
+        "prefijos": ("(NB)",),
+        "no_contiene": ".",
+        "fijos": {"banco_origen": "BANREGIO"},
+        "extraer": (CUENTA_NB_BE,),
+    },
+    {
+        "nombre": "DEPOSITO EFECTIVO",
+        "prefijos": ("DEPOSITO EFECTIVO",),
+        "no_contiene": ".",
+        "tipo_documento": "DEPOSITO",
+        "fijos": {"banco_origen": "EFECTIVO"},
+        "extraer": (re.compile(r"FOLIO:(?P<referencia_movimiento>\d+)"),),
+        "limpiar": {"comentario_movimiento": (re.compile(r"DEPOSITO EFECTIVO PRACTIC/\*+\d+|\s*FOLIO:\d+"),)},
+    },
+    {
+        "nombre": "DEPOSITO DE TERCERO",
+        "prefijos": ("DEPOSITO DE TERCERO",),
+        "no_contiene": ".",
+        "tipo_documento": "DEPOSITO DE TERCERO",
+        "fijos": {"banco_origen": "TERCERO"},
+        "extraer": (re.compile(r"REFBNTC(?P<referencia_movimiento>\d+)"),),
+        "limpiar": {"comentario_movimiento": (re.compile(r"DEPOSITO DE TERCERO/REFBNTC\d+|BMRCASH"),)},
+    },
+    {
+        # CARGO BANCARIO (ÚNICA REGLA)
+        "nombre": "(BE) CARGO BANCARIO",
+        "prefijos": ("(BE)",),
+        "no_contiene": ".",
+        "tipo_documento": "CARGO BANCARIO",
+        "copiar": ("comentario_movimiento",),
+    },
+    {
+        "nombre": "ABONO SIMPLE",
+        "prefijos": ("",),
+        "no_contiene": ".",
+        "copiar": ("comentario_movimiento",),
+    },
+]
+
+# Se aplican después de las reglas, con o sin punto en el texto
+AJUSTES_BANREGIO = [
+    {
+        # SPEI: tipo según venga como cargo o abono
+        "nombre": "SPEI (tipo por cargo)",
+        "prefijos": ("",),
+        "contiene": " SPEI.",
+        "tipo_documento": "ABONO BANCARIO",
+        "tipo_si_cargo": "CARGO BANCARIO",
+    },
+    {
+        # La cuenta de "cuenta: ####" tiene prioridad sobre la del parser
+        "nombre": "(NB) tipo y cuenta",
+        "prefijos": ("(NB)",),
+        "tipo_documento": "ABONO BANCARIO",
+        "extraer": (CUENTA_NB_BE,),
+    },
+    {
+        "nombre": "(BE) tipo y cuenta",
+        "prefijos": ("(BE)",),
+        "tipo_documento": "CARGO BANCARIO",
+        "extraer": (CUENTA_NB_BE,),
+    },
+]
+
+MOTOR_BANREGIO = construir_motor(BANCO, REGLAS_BANREGIO, AJUSTES_BANREGIO, tipo_default="ABONO BANCARIO")
+
+def parse_conceptos(conceptos, cargos):
+    """
+    Clasifica toda la columna 'concepto' con REGLAS_BANREGIO y aplica
+    AJUSTES_BANREGIO (tipo según cargo para SPEI, tipo y cuenta de (NB)/(BE)).
+
+    Devuelve un DataFrame con el mismo índice y las columnas:
+    banco_origen, cuenta_origen, nombre_contraparte, referencia_movimiento,
+    comentario_movimiento, tipo_documento, descripcion (faltantes como None).
+    """
+    return aplicar_reglas(MOTOR_BANREGIO, conceptos, cargos=cargos)
 
 # ==============================
 # BASE DE DATOS
 # ==============================
-def save_to_db(df):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    inserted = 0
-    ignored = 0
-
-    for _, row in df.iterrows():
-        cursor.execute("""
-            INSERT OR IGNORE INTO movimientos_bancarios (
-                fecha, banco, cuenta, banco_origen, cuenta_origen,
-                rut_pagador, nombre_contraparte, tipo_documento, moneda,
-                descripcion, comentario_movimiento, referencia_movimiento,
-                abonos, cargos, saldo, neto
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            row["fecha"].strftime("%Y-%m-%d"),
-            row["banco"],
-            row["cuenta"],
-            row["banco_origen"],
-            row["cuenta_origen"],
-            row["rut_pagador"],          # o None si no lo usas
-            row["nombre_contraparte"],   # ✅ ahora sí guarda el nombre
-            row["tipo_documento"],
-            row["moneda"],
-            row["descripcion"],
-            row["comentario_movimiento"],
-            row["referencia_movimiento"],
-            row["abonos"],
-            row["cargos"],
-            row["saldo"],
-            row["neto"]
-        ))
-
-        if cursor.rowcount == 1:
-            inserted += 1
-        else:
-            ignored += 1
-
-    conn.commit()
-    conn.close()
-
-    print(f"🟢 Insertados: {inserted}")
-    print(f"🟡 Duplicados ignorados: {ignored}")
-
-def export_db_to_excel():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql("""
-        SELECT *
-        FROM movimientos_bancarios
-        ORDER BY fecha ASC, id ASC
-    """, conn)
-    conn.close()
-
-    df.to_excel(OUTPUT_FILE, index=False)
+def save_to_db(df, manifiesto=None):
+    resultado = guardar_movimientos(df, DB_PATH, manifiesto=manifiesto)
+
+    print(f"📦 Lote: {resultado['batch_id']}")
+    print(f"🟢 Insertados: {resultado['insertados']}")
+    print(f"🟡 Duplicados ignorados: {resultado['ignorados']}")
+    print(f"⏱️ {resultado['filas_por_segundo']:,.0f} filas/seg")
+
+def export_db_to_excel(fecha_desde=None, fecha_hasta=None, output_file=OUTPUT_FILE):
+    """
+    Exporta los movimientos de BANREGIO del rango (por defecto el último mes
+    registrado) en las 3 hojas de la cartola, leyendo la base por bloques.
+    """
+    if fecha_desde is None or fecha_hasta is None:
+        conn = sqlite3.connect(DB_PATH)
+        rango = ultimo_mes_movimientos(conn, banco=BANCO)
+        conn.close()
+        if rango is None:
+            print("⚠️ No hay movimientos de BANREGIO para exportar.")
+            return
+        fecha_desde, fecha_hasta = rango
+
+    query, params = sql_movimientos(BANCO, fecha_desde, fecha_hasta, COLUMNAS_MOVIMIENTOS_EXPORT)
+    conteo = exportar_consulta(DB_PATH, query, output_file, params=params, hojas=HOJAS_CARTOLA)
+
+    if conteo:
+        print(f"📁 Exportado: {output_file} ({fecha_desde} a {fecha_hasta}, {conteo['cartola_completa']} movimientos)")
+
+# ==============================
+# LECTURA DEL EXCEL (UNA SOLA PASADA)
+# ==============================
+COLUMNAS_EXCEL = {
+    "fecha": "fecha",
+    "descripción": "concepto",
+    "cargo": "cargos",
+    "abonos": "abonos",
+    "saldo": "saldo",
+}
+
+def es_fila_encabezado(fila):
+    """La fila de encabezados es la que tiene una celda con 'Fecha' y otra con 'Descripción'."""
+    textos = [str(v) for v in fila if v is not None]
+    return any("Fecha" in t for t in textos) and any("Descripción" in t for t in textos)
+
+def iter_registros(input_file):
+    """
+    Recorre la primera hoja del Excel una sola vez (openpyxl en modo
+    read_only) y entrega un dict por movimiento con fecha, concepto,
+    cargos, abonos y saldo.
+    - Las filas anteriores al encabezado (datos de la cuenta) se saltan
+    - El encabezado se detecta al pasar por él
+    - Se descartan la fila "Saldo Inicial" y las filas sin fecha
+    - Los montos y la fecha salen tal cual vienen (se convierten por
+      columna en normalizar_registros)
+    """
+    wb = load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # El archivo del banco trae mal la dimensión de la hoja (A1): se recalcula al leer
+        ws.reset_dimensions()
+
+        posiciones = None
+        for fila in ws.iter_rows(values_only=True):
+            if posiciones is None:
+                if es_fila_encabezado(fila):
+                    encabezados = [str(v).strip().lower() if v is not None else "" for v in fila]
+                    posiciones = {
+                        destino: encabezados.index(origen)
+                        for origen, destino in COLUMNAS_EXCEL.items()
+                    }
+                continue
+
+            registro = {
+                campo: (fila[i] if i < len(fila) and fila[i] != "" else None)
+                for campo, i in posiciones.items()
+            }
+
+            if "saldo inicial" in str(registro["concepto"]).lower():
+                continue
+            if registro["fecha"] is None:
+                continue
+
+            yield registro
+    finally:
+        wb.close()
+
+    if posiciones is None:
+        raise ValueError(f"No se encontró la fila de encabezados en {input_file}")
+
+def normalizar_registros(registros):
+    """Arma el DataFrame de movimientos (esquema.ESQUEMA_MOVIMIENTOS) a partir de los registros del Excel."""
+    df = pd.DataFrame.from_records(
+        registros, columns=["fecha", "concepto", "cargos", "abonos", "saldo"]
+    )
+
+    # Fechas: las que no se reconocen se avisan y la fila se descarta
+    fechas, no_parseadas = normalizar_fechas(df["fecha"], FORMATOS_FECHA, dayfirst=True)
+    avisar_no_parseadas("fecha", no_parseadas)
+    df = df[fechas.notna()]
+    fechas = fechas[fechas.notna()]
+
+    # Montos a centavos exactos (vacíos = 0; los no reconocidos se avisan y quedan en 0)
+    centavos = {}
+    for col in ["cargos", "abonos", "saldo"]:
+        centavos[col], no_parseadas = montos_a_centavos(df[col])
+        avisar_no_parseadas(col, no_parseadas)
+        centavos[col] = centavos[col].fillna(0)
+
+    # Parsear todos los conceptos de una vez (incluye reglas SPEI y NB / BE)
+    parsed = parse_conceptos(df["concepto"], centavos["cargos"])
+
+    return aplicar_esquema(pd.DataFrame({
+        "fecha": fechas,
+        "banco": BANCO,
+        "cuenta": None,
+        "banco_origen": parsed["banco_origen"],
+        "cuenta_origen": parsed["cuenta_origen"],
+        "rut_pagador": None,
+        "nombre_contraparte": parsed["nombre_contraparte"],
+        "tipo_documento": parsed["tipo_documento"],
+        "moneda": MONEDA_DEFAULT,
+        "descripcion": parsed["descripcion"],
+        "comentario_movimiento": parsed["comentario_movimiento"],
+        "referencia_movimiento": parsed["referencia_movimiento"],
+        "abonos_centavos": centavos["abonos"],
+        "cargos_centavos": centavos["cargos"],
+        "saldo_centavos": centavos["saldo"],
+        "neto_centavos": centavos["abonos"] - centavos["cargos"],
+    }))
 
 # ==============================
 # MAIN
@@ -246,78 +326,19 @@ def export_db_to_excel():
 def main():
     print("📄 Leyendo archivo:", INPUT_FILE)
 
-    raw = pd.read_excel(INPUT_FILE, header=None)
-
-    header_row = raw[
-        raw.apply(
-            lambda r: r.astype(str).str.contains("Fecha").any()
-            and r.astype(str).str.contains("Descripción").any(),
-            axis=1
-        )
-    ].index[0]
+    # Si este mismo contenido ya se cargó con esta versión del parser, no se vuelve a parsear
+    manifiesto = preparar_manifiesto(INPUT_FILE, PARSER, PARSER_VERSION)
+    estado = verificar_archivo(DB_PATH, manifiesto)
 
-    df = pd.read_excel(INPUT_FILE, header=header_row)
-    df.columns = [c.strip().lower() for c in df.columns]
-
-    df = df.rename(columns={
-        "fecha": "fecha",
-        "descripción": "concepto",
-        "cargo": "cargos",
-        "abonos": "abonos",
-        "saldo": "saldo"
-    })
-
-    df = df[~df["concepto"].astype(str).str.contains("saldo inicial", case=False)]
-    df = df.dropna(subset=["fecha"])
+    if estado["batch_id"] is not None:
+        print(f"⏭️ Archivo ya cargado (lote {estado['batch_id']}), se omite")
+    else:
+        if estado["cambiado"]:
+            print(f"⚠️ Un archivo con el mismo nombre se cargó antes con otro contenido (lotes {estado['cambiado']})")
 
-    for col in ["cargos", "abonos", "saldo"]:
-        df[col] = df[col].apply(clean_amount)
-
-    rows = []
-
-    for _, row in df.iterrows():
-        concepto_texto = str(row["concepto"]).strip()
-        parsed = parse_concepto(concepto_texto)
-        cuenta_nb_be = extraer_cuenta_nb_be(concepto_texto)
-
-        # Mantener lógica original
-        tipo_documento = parsed["tipo_documento"]
-
-        # SPEI: se deja exactamente como estaba
-        if " SPEI." in parsed["descripcion"]:
-            if row["cargos"] > 0:
-                tipo_documento = "CARGO BANCARIO"
-            else:
-                tipo_documento = "ABONO BANCARIO"
-
-        # Regla específica adicional para NB / BE
-        if concepto_texto.startswith("(NB)"):
-            tipo_documento = "ABONO BANCARIO"
-        elif concepto_texto.startswith("(BE)"):
-            tipo_documento = "CARGO BANCARIO"
-
-        rows.append({
-            "fecha": pd.to_datetime(row["fecha"], dayfirst=True),
-            "banco": BANCO,
-            "cuenta": None,
-            "banco_origen": parsed["banco_origen"],
-            "cuenta_origen": cuenta_nb_be if cuenta_nb_be else parsed["cuenta_origen"],
-            "rut_pagador": None,
-            "nombre_contraparte": parsed["nombre_contraparte"],
-            "tipo_documento": tipo_documento,
-            "moneda": MONEDA_DEFAULT,
-            "descripcion": parsed["descripcion"],
-            "comentario_movimiento": parsed["comentario_movimiento"],
-            "referencia_movimiento": parsed["referencia_movimiento"],
-            "abonos": row["abonos"],
-            "cargos": row["cargos"],
-            "saldo": row["saldo"],
-            "neto": row["abonos"] - row["cargos"]
-        })
-
-    final_df = pd.DataFrame(rows)
-
-    save_to_db(final_df)
+        final_df = normalizar_registros(iter_registros(INPUT_FILE))
+        save_to_db(final_df, manifiesto=manifiesto)
+        imprimir_estadisticas()  # Filas y tiempo por regla de conceptos
     export_db_to_excel()
 
     print("✅ BANREGIO cargado y normalizado correctamente")
@@ -3,6 +3,15 @@ import re                    # Librería para expresiones regulares
 from pathlib import Path     # Para manejar rutas de archivos de forma portable
 import sqlite3               # Para conectarse a bases de datos SQLite
 
+from bulk_loader import guardar_movimientos  # Carga masiva en movimientos_bancarios
+from consultas import COLUMNAS_MOVIMIENTOS_EXPORT, sql_movimientos, ultimo_mes_movimientos  # Consultas por rango (con índice)
+from esquema import aplicar_esquema  # Esquema del movimiento normalizado (categorías, centavos)
+from exportador import HOJAS_CARTOLA, exportar_consulta  # Exportación por bloques
+from manifiesto import preparar_manifiesto, verificar_archivo  # Lotes ya cargados
+from normalizacion import avisar_no_parseadas, montos_a_centavos, normalizar_fechas
+from reglas import aplicar_reglas, construir_motor, imprimir_estadisticas  # Clasificación de conceptos por reglas
+from tipo_cambio import MONEDA_EMPRESA  # Moneda de la empresa
+
 # ==============================
 # CONFIGURACIÓN DE ARCHIVOS Y CONSTANTES
 # ==============================
@@ -10,254 +19,149 @@ BASE_DIR = Path(__file__).parent  # Carpeta base donde está este script
 DB_PATH = BASE_DIR / "db" / "conciliador.db"  # Ruta de la base de datos
 
 BANCO = "BBVA"                   # Nombre del banco
-MONEDA_DEFAULT = "MXN"            # Moneda por defecto
+PARSER = "bbva"                  # Nombre del parser en ingest_batches
+PARSER_VERSION = "1"              # Subir al cambiar cómo se parsea (fuerza recargar)
+MONEDA_DEFAULT = MONEDA_EMPRESA   # Moneda por defecto
 
 INPUT_FILE = BASE_DIR / "Archivos ejemplos" / "MOV BBVA 19122025.txt"  # Archivo de entrada
 OUTPUT_FILE = BASE_DIR / "cartola_bbva_normalizada.xlsx"               # Archivo Excel de salida
 
+CHUNK_SIZE = 50_000  # Filas por bloque al leer la cartola (None = todo de una vez)
+FORMATOS_FECHA = ("%d-%m-%Y",)  # Formato de la columna fecha (19-12-2025)
+
 # ==============================
-# FUNCIONES AUXILIARES
+# REGLAS DE CONCEPTOS
 # ==============================
-def clean_amount(value):
-    """
-    Convierte un valor en número float. 
-    Si es NaN o vacío, devuelve 0.0
+# Reglas de clasificación del concepto (formato en reglas.py). Cada fila la
+# toma la regla de prefijo más largo; el resto queda como CARGO BANCARIO.
+
+# Números o espacios al inicio del comentario
+SIN_NUMEROS_INICIALES = {"comentario_movimiento": (re.compile(r"^[\d\s]+"),)}
+
+REGLAS_BBVA = [
+    {
+        "nombre": "PAGO CUENTA DE TERCERO",
+        "prefijos": ("PAGO CUENTA DE TERCERO",),
+        "tipo_documento": "PAGO CUENTA DE TERCERO",
+        "fijos": {"banco_origen": "BBVA"},
+        "extraer": (
+            # Referencia numérica después de "/"
+            re.compile(r"/\s*(?P<referencia_movimiento>\d+)"),
+            # Cuenta después de "BNET " y comentario = lo que sigue a la
+            # primera aparición de esa cuenta en el texto
+            re.compile(r"(?s)^(?=.*?BNET\s+(?P<cuenta_origen>\d+)).*?(?P=cuenta_origen)(?P<comentario_movimiento>.*)"),
+        ),
+        "depurar": SIN_NUMEROS_INICIALES,
+    },
+    {
+        "nombre": "SPEI / TEF RECIBIDO",
+        "prefijos": ("SPEI RECIBIDO", "TEF RECIBIDO"),
+        "extraer": (
+            # Tipo y banco de origen pegado al tipo (antes de "/")
+            re.compile(r"^(?P<tipo_documento>SPEI RECIBIDO|TEF RECIBIDO)(?P<banco_origen>[A-Z]+)?"),
+            # Referencia después de "/" y comentario = lo que sigue a la referencia
+            re.compile(r"(?s)^(?=.*?/(?P<referencia_movimiento>\d+)).*?(?P=referencia_movimiento)(?P<comentario_movimiento>.*)"),
+        ),
+        "depurar": SIN_NUMEROS_INICIALES,
+    },
+    {
+        # TRANSFER BBVA 00696250  L/NC 0118507546 IPV1804098C1 TRANSF MISMO BANCO
+        # Queda como CARGO salvo que venga como abono
+        "nombre": "TRANSFER BBVA",
+        "prefijos": ("TRANSFER BBVA",),
+        "tipo_si_abono": "ABONO BANCARIO",
+        "extraer": (re.compile(r"(?i)L/NC\s+(?P<cuenta_origen>\d+)"),),
+        "copiar": ("comentario_movimiento",),
+        "depurar": SIN_NUMEROS_INICIALES,
+    },
+    {
+        "nombre": "DEPOSITO EFECTIVO",
+        "prefijos": ("DEPOSITO EFECTIVO",),
+        "tipo_documento": "DEPOSITO",
+        "fijos": {"banco_origen": "DEPOSITO"},
+        "extraer": (re.compile(r"FOLIO:(?P<referencia_movimiento>\d+)"),),
+        # Comentario entre PRACTIC/... y FOLIO
+        "limpiar": {"comentario_movimiento": (
+            re.compile(r"DEPOSITO EFECTIVO PRACTIC/\*+\d+\s*"),
+            re.compile(r"FOLIO:\d+"),
+        )},
+        "depurar": SIN_NUMEROS_INICIALES,
+    },
+    {
+        "nombre": "DEPOSITO DE TERCERO",
+        "prefijos": ("DEPOSITO DE TERCERO",),
+        "tipo_documento": "DEPOSITO DE TERCERO",
+        "fijos": {"banco_origen": "DEPOSITO"},
+        "extraer": (re.compile(r"REFBNTC(?P<referencia_movimiento>\d+)"),),
+        # Comentario entre la referencia y "BMRCASH"
+        "limpiar": {"comentario_movimiento": (
+            re.compile(r"DEPOSITO DE TERCERO/REFBNTC\d+\s*"),
+            re.compile(r"BMRCASH"),
+        )},
+        "depurar": SIN_NUMEROS_INICIALES,
+    },
+]
+
+MOTOR_BBVA = construir_motor(BANCO, REGLAS_BBVA, tipo_default="CARGO BANCARIO")
+
+def parse_conceptos(conceptos, abonos):
     """
-    if pd.isna(value) or value == "":
-        return 0.0
-    return float(str(value).replace(",", "").strip())
-
-def extraer_cuenta_transfer_bbva(texto):
-    """
-    Extrae la cuenta para textos tipo:
-    TRANSFER BBVA 00696250  L/NC 0118507546 IPV1804098C1 TRANSF MISMO BANCO
-
-    Devuelve:
-    0118507546
-    """
-    if not isinstance(texto, str):
-        return None
-
-    texto = texto.strip()
-
-    if texto.startswith("TRANSFER BBVA"):
-        match = re.search(r"L/NC\s+(\d+)", texto, re.IGNORECASE)
-        if match:
-            return match.group(1)
-
-    return None
+    Clasifica toda la columna 'concepto' con REGLAS_BBVA (incluida la regla
+    TRANSFER BBVA + abono -> ABONO BANCARIO).
 
-def parse_concepto(texto):
-    """
-    Analiza la columna 'concepto' y devuelve un diccionario con:
+    Devuelve un DataFrame con el mismo índice y las columnas:
     - banco_origen
     - cuenta_origen
     - referencia_movimiento
     - comentario_movimiento
     - tipo_documento
-    - descripcion original
+    - descripcion
+    Los valores faltantes se devuelven como None.
     """
-    banco_origen = None
-    cuenta_origen = None
-    referencia = None
-    comentario = None
-    tipo_documento = "CARGO BANCARIO"
-
-    descripcion = texto.strip()  # Limpiar espacios al inicio y fin
-
-    if texto.startswith("PAGO CUENTA DE TERCERO"):
-        tipo_documento = "PAGO CUENTA DE TERCERO"
-        banco_origen = "BBVA"
-
-        # Buscar referencia numérica después de "/"
-        ref = re.search(r"/\s*(\d+)", texto)
-        # Buscar cuenta después de "BNET "
-        cuenta = re.search(r"BNET\s+(\d+)", texto)
-
-        if ref:
-            referencia = ref.group(1)
-        if cuenta:
-            cuenta_origen = cuenta.group(1)
-            # Tomar comentario como lo que queda después de la cuenta
-            comentario = texto.split(cuenta_origen, 1)[-1]
-
-    elif texto.startswith(("SPEI RECIBIDO", "TEF RECIBIDO")):
-        tipo_documento = texto.split()[0] + " RECIBIDO"
-
-        # Extraer banco de origen que está después de SPEI RECIBIDO y antes de "/"
-        banco_match = re.match(r'(SPEI RECIBIDO|TEF RECIBIDO)([A-Z]+)', texto)
-        if banco_match:
-            banco_origen = banco_match.group(2)
-
-        # Extraer referencia numérica después de "/"
-        ref = re.search(r"/(\d+)", texto)
-        if ref:
-            referencia = ref.group(1)
-            comentario = texto.split(referencia, 1)[-1]
-
-    elif texto.startswith("TRANSFER BBVA"):
-        # Por defecto el parser viejo parte en CARGO, pero este caso
-        # se corregirá en main solo si realmente viene como abono.
-        cuenta_match = re.search(r"L/NC\s+(\d+)", texto, re.IGNORECASE)
-        if cuenta_match:
-            cuenta_origen = cuenta_match.group(1)
-
-        comentario = texto
-
-
-    elif texto.startswith("DEPOSITO EFECTIVO"):
-        tipo_documento = "DEPOSITO"
-        banco_origen = "DEPOSITO"
-        # Extraer referencia después de "FOLIO:"
-        ref_match = re.search(r'FOLIO:(\d+)', texto)
-        if ref_match:
-            referencia = ref_match.group(1)
-        # Extraer comentario entre PRACTIC/... y FOLIO
-        comentario_part = re.sub(r'DEPOSITO EFECTIVO PRACTIC/\*+\d+\s*', '', texto)
-        comentario_part = re.sub(r'FOLIO:\d+', '', comentario_part).strip()
-        comentario = comentario_part
-
-    elif texto.startswith("DEPOSITO DE TERCERO"):
-        tipo_documento = "DEPOSITO DE TERCERO"
-        banco_origen = "DEPOSITO"
-        # Extraer referencia después de "REFBNTC"
-        ref_match = re.search(r'REFBNTC(\d+)', texto)
-        if ref_match:
-            referencia = ref_match.group(1)
-        # Extraer comentario entre referencia y "BMRCASH"
-        comentario_part = re.sub(r'DEPOSITO DE TERCERO/REFBNTC\d+\s*', '', texto)
-        comentario_part = re.sub(r'BMRCASH', '', comentario_part).strip()
-        comentario = comentario_part
-
-    # Limpiar posibles números o espacios al inicio del comentario
-    if comentario:
-        comentario = re.sub(r"^[\d\s]+", "", comentario).strip()
-
-    return {
-        "banco_origen": banco_origen,
-        "cuenta_origen": cuenta_origen,
-        "referencia_movimiento": referencia,
-        "comentario_movimiento": comentario,
-        "tipo_documento": tipo_documento,
-        "descripcion": descripcion,
-    }
+    parsed = aplicar_reglas(MOTOR_BBVA, conceptos, abonos=abonos)
+    return parsed.drop(columns="nombre_contraparte")
 
 # ==============================
 # FUNCIONES PARA BASE DE DATOS
 # ==============================
-def save_to_db(df):
+def save_to_db(df, orden_inverso=False, manifiesto=None):
     """
     Inserta los movimientos en la base de datos SQLite.
+    - df puede ser un DataFrame o un iterable de bloques (ver leer_cartola)
+    - orden_inverso=True los inserta del último al primero
+    - manifiesto registra la carga en ingest_batches (ver manifiesto.py)
     - Ignora duplicados
     - Imprime cuántos registros se insertaron y cuántos se ignoraron
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    inserted = 0
-    ignored = 0
-
-    for _, row in df.iterrows():
-        cursor.execute("""
-            INSERT OR IGNORE INTO movimientos_bancarios (
-                fecha, banco, cuenta, banco_origen, cuenta_origen,
-                rut_pagador, nombre_contraparte, tipo_documento, moneda,
-                descripcion, comentario_movimiento, referencia_movimiento,
-                abonos, cargos, saldo, neto
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            row["fecha"].strftime("%Y-%m-%d"),
-            row["banco"],
-            row["cuenta"],
-            row["banco_origen"],
-            row["cuenta_origen"],
-            row["rut_pagador"],
-            row["nombre_contraparte"],
-            row["tipo_documento"],
-            row["moneda"],
-            row["descripcion"],
-            row["comentario_movimiento"],
-            row["referencia_movimiento"],
-            row["abonos"],
-            row["cargos"],
-            row["saldo"],
-            row["neto"]
-        ))
-
-        if cursor.rowcount == 1:
-            inserted += 1
-        else:
-            ignored += 1
-
-    conn.commit()
-    conn.close()
+    resultado = guardar_movimientos(df, DB_PATH, orden_inverso=orden_inverso, manifiesto=manifiesto)
 
-    print(f"🟢 Movimientos nuevos insertados: {inserted}")
-    print(f"🟡 Movimientos duplicados ignorados: {ignored}")
+    print(f"📦 Lote: {resultado['batch_id']}")
+    print(f"🟢 Movimientos nuevos insertados: {resultado['insertados']}")
+    print(f"🟡 Movimientos duplicados ignorados: {resultado['ignorados']}")
+    print(f"⏱️ {resultado['filas_por_segundo']:,.0f} filas/seg")
 
-def export_db_to_excel(fecha_desde, fecha_hasta):
+def export_db_to_excel(fecha_desde, fecha_hasta, output_file=OUTPUT_FILE):
     """
-    Exporta 3 hojas filtradas por rango de fechas:
+    Exporta 3 hojas filtradas por rango de fechas, en una sola lectura por bloques:
     1) Cartola completa
     2) Abonos
     3) Cargos
-    """
-    conn = sqlite3.connect(DB_PATH)
 
-    # Hoja 1: cartola completa filtrada por rango
-    df_full = pd.read_sql("""
-        SELECT *
-        FROM movimientos_bancarios
-        WHERE fecha BETWEEN ? AND ?
-        ORDER BY fecha ASC, id ASC
-    """, conn, params=(fecha_desde, fecha_hasta))
-
-    conn.close()
+    El formato sale de la extensión de output_file (.xlsx, .csv o .parquet).
+    """
+    query, params = sql_movimientos(
+        fecha_desde=fecha_desde, fecha_hasta=fecha_hasta, columnas=COLUMNAS_MOVIMIENTOS_EXPORT
+    )
+    conteo = exportar_consulta(DB_PATH, query, output_file, params=params, hojas=HOJAS_CARTOLA)
 
-    if df_full.empty:
+    if not conteo:
         print(f"⚠️ No hay movimientos entre {fecha_desde} y {fecha_hasta}. No se generó el Excel.")
         return
 
-    # Hoja 2: solo abonos
-    df_abonos = df_full[df_full["abonos"] > 0].copy()
-
-    # Hoja 3: solo cargos
-    df_cargos = df_full[df_full["cargos"] > 0].copy()
-
-    columnas_abonos = [
-        "fecha",
-        "banco",
-        "banco_origen",
-        "descripcion",
-        "cuenta_origen",
-        "nombre_contraparte",
-        "comentario_movimiento",
-        "abonos",
-        "referencia_movimiento",
-    ]
-
-    columnas_cargos = [
-        "fecha",
-        "banco",
-        "banco_origen",
-        "descripcion",
-        "cuenta_origen",
-        "nombre_contraparte",
-        "comentario_movimiento",
-        "cargos",
-        "referencia_movimiento",
-    ]
-
-    df_abonos = df_abonos[columnas_abonos]
-    df_cargos = df_cargos[columnas_cargos]
-
-    with pd.ExcelWriter(OUTPUT_FILE, engine="openpyxl") as writer:
-        df_full.to_excel(writer, sheet_name="cartola_completa", index=False)
-        df_abonos.to_excel(writer, sheet_name="abonos", index=False)
-        df_cargos.to_excel(writer, sheet_name="cargos", index=False)
-
-    print(f"📁 Excel exportado correctamente: {OUTPUT_FILE}")
+    print(f"📁 Excel exportado correctamente: {output_file}")
     print(f"📅 Rango exportado: {fecha_desde} a {fecha_hasta}")
+    print(f"   {conteo['cartola_completa']} movimientos, {conteo['abonos']} abonos, {conteo['cargos']} cargos")
+
 def obtener_rango_fechas_exportacion():
     """
     Pide al usuario si desea:
@@ -268,22 +172,12 @@ def obtener_rango_fechas_exportacion():
     fecha_desde, fecha_hasta  (strings formato YYYY-MM-DD)
     """
     conn = sqlite3.connect(DB_PATH)
-
-    df_max = pd.read_sql("""
-        SELECT MAX(fecha) AS max_fecha
-        FROM movimientos_bancarios
-    """, conn)
-
+    rango = ultimo_mes_movimientos(conn)
     conn.close()
 
-    max_fecha = df_max.loc[0, "max_fecha"]
-
-    if not max_fecha:
+    if rango is None:
         raise ValueError("No hay movimientos en la base de datos para exportar.")
 
-    max_fecha = pd.to_datetime(max_fecha)
-    inicio_mes = max_fecha.replace(day=1)
-
     print("\n¿Cómo deseas exportar la cartola?")
     print("1. Último mes registrado")
     print("2. Rango manual (desde / hasta)")
@@ -301,8 +195,7 @@ def obtener_rango_fechas_exportacion():
         return fecha_desde, fecha_hasta
 
     # Por defecto: último mes registrado
-    fecha_desde = inicio_mes.strftime("%Y-%m-%d")
-    fecha_hasta = max_fecha.strftime("%Y-%m-%d")
+    fecha_desde, fecha_hasta = rango
 
     print(f"\n📅 Exportando último mes registrado: {fecha_desde} a {fecha_hasta}")
     return fecha_desde, fecha_hasta
@@ -310,20 +203,18 @@ def obtener_rango_fechas_exportacion():
 # ==============================
 # MAIN
 # ==============================
-def main():
-    print("Leyendo archivo:", INPUT_FILE)
-
-    # Leer CSV de BBVA
-    df = pd.read_csv(INPUT_FILE, sep="\t", encoding="latin1")
-    # Limpiar nombres de columnas
-    df.columns = [c.strip().lower() for c in df.columns]
-
-    # Detectar columna fecha automáticamente
-    fecha_col = next(
+def detectar_columna_fecha(df):
+    """Devuelve la columna cuyos primeros valores tienen formato DD-MM-YYYY."""
+    return next(
         col for col in df.columns
         if df[col].astype(str).head(5).str.match(r"\d{2}-\d{2}-\d{4}").all()
     )
 
+def normalizar_bloque(df, fecha_col):
+    """
+    Limpia y clasifica un bloque de la cartola y lo devuelve con las
+    columnas de esquema.ESQUEMA_MOVIMIENTOS (en el mismo orden del archivo).
+    """
     # Renombrar columnas
     df = df.rename(columns={
         fecha_col: "fecha",
@@ -333,54 +224,83 @@ def main():
         "saldo": "saldo"
     })
 
-    # Limpiar valores numéricos
+    # Fechas: las que no se reconocen se avisan y la fila se descarta
+    fechas, no_parseadas = normalizar_fechas(df["fecha"], FORMATOS_FECHA, dayfirst=True)
+    avisar_no_parseadas("fecha", no_parseadas)
+    df = df[fechas.notna()]
+    fechas = fechas[fechas.notna()]
+
+    # Montos a centavos exactos (vacíos = 0; los no reconocidos se avisan y quedan en 0)
+    centavos = {}
     for col in ["cargos", "abonos", "saldo"]:
-        df[col] = df[col].apply(clean_amount)
-
-    rows = []
-
-    # Procesar cada fila y parsear el concepto
-    for _, row in df.iterrows():
-        concepto_texto = str(row["concepto"]).strip()
-        parsed = parse_concepto(concepto_texto)
-
-        tipo_documento = parsed["tipo_documento"]
-        cuenta_origen_final = parsed["cuenta_origen"]
-
-        # Regla nueva:
-        # Si empieza por TRANSFER BBVA y es abono, clasificar como ABONO BANCARIO
-        # y extraer cuenta desde "L/NC ##########"
-        if concepto_texto.startswith("TRANSFER BBVA") and float(row["abonos"]) > 0:
-            tipo_documento = "ABONO BANCARIO"
-            cuenta_extraida = extraer_cuenta_transfer_bbva(concepto_texto)
-            if cuenta_extraida:
-                cuenta_origen_final = cuenta_extraida
-
-        rows.append({
-            "fecha": pd.to_datetime(row["fecha"], dayfirst=True),
-            "banco": BANCO,
-            "cuenta": None,
-            "banco_origen": parsed["banco_origen"],
-            "cuenta_origen": cuenta_origen_final,
-            "rut_pagador": None,
-            "nombre_contraparte": None,
-            "tipo_documento": tipo_documento,
-            "moneda": MONEDA_DEFAULT,
-            "descripcion": parsed["descripcion"],
-            "comentario_movimiento": parsed["comentario_movimiento"],
-            "referencia_movimiento": parsed["referencia_movimiento"],
-            "abonos": row["abonos"],
-            "cargos": row["cargos"],
-            "saldo": row["saldo"],
-            "neto": row["abonos"] - row["cargos"]
-        })
-
-    final_df = pd.DataFrame(rows)
-    # Invertir filas para tener la más antigua primero
-    final_df = final_df.iloc[::-1].reset_index(drop=True)
-
-    # Guardar en DB
-    save_to_db(final_df)
+        centavos[col], no_parseadas = montos_a_centavos(df[col])
+        avisar_no_parseadas(col, no_parseadas)
+        centavos[col] = centavos[col].fillna(0)
+
+    # Parsear todos los conceptos de una vez (incluye la regla TRANSFER BBVA + abono)
+    parsed = parse_conceptos(df["concepto"], centavos["abonos"])
+
+    return aplicar_esquema(pd.DataFrame({
+        "fecha": fechas,
+        "banco": BANCO,
+        "cuenta": None,
+        "banco_origen": parsed["banco_origen"],
+        "cuenta_origen": parsed["cuenta_origen"],
+        "rut_pagador": None,
+        "nombre_contraparte": None,
+        "tipo_documento": parsed["tipo_documento"],
+        "moneda": MONEDA_DEFAULT,
+        "descripcion": parsed["descripcion"],
+        "comentario_movimiento": parsed["comentario_movimiento"],
+        "referencia_movimiento": parsed["referencia_movimiento"],
+        "abonos_centavos": centavos["abonos"],
+        "cargos_centavos": centavos["cargos"],
+        "saldo_centavos": centavos["saldo"],
+        "neto_centavos": centavos["abonos"] - centavos["cargos"],
+    }))
+
+def leer_cartola(input_file, chunksize=CHUNK_SIZE):
+    """
+    Lee la cartola BBVA por bloques de `chunksize` filas y va entregando cada
+    bloque ya normalizado, sin tener el archivo completo en memoria.
+    - La columna fecha se detecta en el primer bloque y se reutiliza
+    - Los bloques salen en el orden del archivo (el más reciente primero);
+      el orden cronológico se arma al insertar (save_to_db con orden_inverso)
+    """
+    if chunksize is None:
+        bloques = [pd.read_csv(input_file, sep="\t", encoding="latin1")]
+    else:
+        bloques = pd.read_csv(input_file, sep="\t", encoding="latin1", chunksize=chunksize)
+
+    fecha_col = None
+    for df in bloques:
+        # Limpiar nombres de columnas
+        df.columns = [c.strip().lower() for c in df.columns]
+
+        # Detectar columna fecha automáticamente (solo en el primer bloque)
+        if fecha_col is None:
+            fecha_col = detectar_columna_fecha(df)
+
+        yield normalizar_bloque(df, fecha_col)
+
+def main():
+    print("Leyendo archivo:", INPUT_FILE)
+
+    # Si este mismo contenido ya se cargó con esta versión del parser, no se vuelve a parsear
+    manifiesto = preparar_manifiesto(INPUT_FILE, PARSER, PARSER_VERSION)
+    estado = verificar_archivo(DB_PATH, manifiesto)
+
+    if estado["batch_id"] is not None:
+        print(f"⏭️ Archivo ya cargado (lote {estado['batch_id']}), se omite")
+    else:
+        if estado["cambiado"]:
+            print(f"⚠️ Un archivo con el mismo nombre se cargó antes con otro contenido (lotes {estado['cambiado']})")
+
+        # Leer, limpiar, clasificar e insertar bloque a bloque.
+        # El archivo viene del más reciente al más antiguo: se inserta invertido
+        # para que la más antigua quede primero.
+        save_to_db(leer_cartola(INPUT_FILE), orden_inverso=True, manifiesto=manifiesto)
+        imprimir_estadisticas()  # Filas y tiempo por regla de conceptos
 
     # Pedir rango de exportación y generar Excel
     fecha_desde, fecha_hasta = obtener_rango_fechas_exportacion()
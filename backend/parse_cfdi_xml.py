@@ -0,0 +1,353 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from pathlib import Path
+
+import pandas as pd
+
+from bulk_loader import iter_lotes
+from indice_contrapartes import actualizar_indice
+from parse_facturas_emitidas import COLUMNAS_TABLA, MONEDA_DEFAULT, guardar_facturas
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+MAX_WORKERS = os.cpu_count() or 1  # Procesos parseando en paralelo
+LOTE_ARCHIVOS = 500                # XML por tarea (y por transacción al insertar)
+MAX_LOTES_EN_VUELO = 2             # Lotes pendientes por proceso (limita la memoria)
+
+TIPO_INGRESO = "I"
+
+# c_TipoDeComprobante y c_UsoCFDI del SAT, con el texto que trae el Excel de emitidos
+TIPOS_COMPROBANTE = {
+    "I": "I - Ingreso",
+    "E": "E - Egreso",
+    "T": "T - Traslado",
+    "N": "N - Nómina",
+    "P": "P - Pago",
+}
+
+USOS_CFDI = {
+    "G01": "G01 - Adquisición de mercancías",
+    "G02": "G02 - Devoluciones, descuentos o bonificaciones",
+    "G03": "G03 - Gastos en general",
+    "I01": "I01 - Construcciones",
+    "I02": "I02 - Mobiliario y equipo de oficina por inversiones",
+    "I03": "I03 - Equipo de transporte",
+    "I04": "I04 - Equipo de computo y accesorios",
+    "I05": "I05 - Dados, troqueles, moldes, matrices y herramental",
+    "I06": "I06 - Comunicaciones telefónicas",
+    "I07": "I07 - Comunicaciones satelitales",
+    "I08": "I08 - Otra maquinaria y equipo",
+    "D01": "D01 - Honorarios médicos, dentales y gastos hospitalarios",
+    "D02": "D02 - Gastos médicos por incapacidad o discapacidad",
+    "D03": "D03 - Gastos funerales",
+    "D04": "D04 - Donativos",
+    "D05": "D05 - Intereses reales efectivamente pagados por créditos hipotecarios (casa habitación)",
+    "D06": "D06 - Aportaciones voluntarias al SAR",
+    "D07": "D07 - Primas por seguros de gastos médicos",
+    "D08": "D08 - Gastos de transportación escolar obligatoria",
+    "D09": "D09 - Depósitos en cuentas para el ahorro, primas que tengan como base planes de pensiones",
+    "D10": "D10 - Pagos por servicios educativos (colegiaturas)",
+    "S01": "S01 - Sin efectos fiscales",
+    "CP01": "CP01 - Pagos",
+    "CN01": "CN01 - Nómina",
+}
+
+IVA = "002"  # c_Impuesto
+
+# ==============================
+# CFDI XML
+# ==============================
+# Alternativa al Excel de emitidos: carpetas o zips con los XML timbrados
+# (CFDI 3.3 o 4.0). Cada XML se lee con iterparse (sin armar el árbol
+# completo) y da una fila de facturas_emitidas_mx con las mismas columnas
+# que preparar_facturas; en extras quedan los datos del comprobante que no
+# tienen columna y el detalle de cada concepto (Partidas), que el Excel no trae.
+#
+# Lo que el XML no sabe (estado ante el SAT, cancelación) queda vacío.
+# Los archivos se reparten en lotes entre procesos; cada lote vuelve como
+# filas y se inserta en una transacción. Solo hay MAX_LOTES_EN_VUELO lotes
+# por proceso a la vez, así que la memoria no crece con la cantidad de XML.
+
+
+def _local(tag):
+    """Nombre sin namespace: '{http://www.sat.gob.mx/cfd/4}Comprobante' -> 'Comprobante'."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _monto(valor):
+    try:
+        return Decimal(valor) if valor not in (None, "") else None
+    except InvalidOperation:
+        return None
+
+
+def _fecha(valor):
+    """'2025-11-02T22:01:00' -> '2025-11-02 22:01:00' (como el Excel)."""
+    return valor.replace("T", " ")[:19] if valor else None
+
+
+def _float(monto):
+    return None if monto is None else float(monto.quantize(Decimal("0.01"), ROUND_HALF_UP))
+
+
+def leer_cfdi(archivo):
+    """
+    Lee un CFDI (archivo o file-like) con iterparse y devuelve un dict con
+    los atributos de Comprobante, Emisor, Receptor y TimbreFiscalDigital,
+    los conceptos, los traslados del comprobante y los UUID relacionados.
+    """
+    cfdi = {"conceptos": [], "traslados": [], "relacionados": [], "tipo_relacion": None}
+    ruta = []
+    for evento, elem in ET.iterparse(archivo, events=("start", "end")):
+        nombre = _local(elem.tag)
+        if evento == "end":
+            ruta.pop()
+            elem.clear()
+            continue
+
+        padre = ruta[-1] if ruta else None
+        ruta.append(nombre)
+        if nombre == "Comprobante" and padre is None:
+            cfdi["comprobante"] = dict(elem.attrib)
+        elif nombre in ("Emisor", "Receptor") and padre == "Comprobante":
+            cfdi[nombre.lower()] = dict(elem.attrib)
+        elif nombre == "Concepto":
+            cfdi["conceptos"].append(dict(elem.attrib))
+        elif nombre == "Traslado" and ruta[:-2] == ["Comprobante", "Impuestos"]:
+            cfdi["traslados"].append(dict(elem.attrib))  # Solo los del comprobante, no los de cada concepto
+        elif nombre == "CfdiRelacionados":
+            cfdi["tipo_relacion"] = elem.get("TipoRelacion")
+        elif nombre == "CfdiRelacionado":
+            cfdi["relacionados"].append(elem.get("UUID"))
+        elif nombre == "TimbreFiscalDigital":
+            cfdi["timbre"] = dict(elem.attrib)
+
+    if "comprobante" not in cfdi:
+        raise ValueError("no es un CFDI (falta Comprobante)")
+    return cfdi
+
+
+def fila_factura(cfdi):
+    """
+    Fila de facturas_emitidas_mx (dict con COLUMNAS_TABLA) a partir de
+    leer_cfdi. None si no es de ingreso o no está timbrado (sin UUID).
+    """
+    comprobante = cfdi["comprobante"]
+    emisor = cfdi.get("emisor", {})
+    receptor = cfdi.get("receptor", {})
+    timbre = cfdi.get("timbre", {})
+
+    tipo = comprobante.get("TipoDeComprobante")
+    uuid = (timbre.get("UUID") or "").strip().upper()
+    if tipo != TIPO_INGRESO or not uuid:
+        return None
+
+    iva = [_monto(t.get("Importe")) for t in cfdi["traslados"] if t.get("Impuesto") == IVA]
+    iva = [m for m in iva if m is not None]
+    uso = receptor.get("UsoCFDI")
+    claves = " | ".join(c["ClaveProdServ"] for c in cfdi["conceptos"] if c.get("ClaveProdServ"))
+
+    extras = {
+        "Version": comprobante.get("Version"),
+        "Serie": comprobante.get("Serie"),
+        "CP Expedicion": comprobante.get("LugarExpedicion"),
+        "RFC emisor": emisor.get("Rfc"),
+        "Razon emisor": emisor.get("Nombre"),
+        "Regimen emisor": emisor.get("RegimenFiscal"),
+        "Regimen receptor": receptor.get("RegimenFiscalReceptor"),
+        "Domicilio receptor": receptor.get("DomicilioFiscalReceptor"),
+        "UUIDs relacionados": " | ".join(cfdi["relacionados"]) or None,
+        "Tipo relacion": cfdi["tipo_relacion"],
+        "Conceptos": " | ".join(c.get("Descripcion", "") for c in cfdi["conceptos"]) or None,
+        "Condiciones de pago": comprobante.get("CondicionesDePago"),
+        "Tipo de cambio": comprobante.get("TipoCambio"),
+        "Exportacion": comprobante.get("Exportacion"),
+        "Metodo pago": comprobante.get("MetodoPago"),
+        "Forma pago": comprobante.get("FormaPago"),
+        "Descuento": _float(_monto(comprobante.get("Descuento"))),
+        "pacCertifico": timbre.get("RfcProvCertif"),
+        "Partidas": cfdi["conceptos"],
+    }
+
+    return {
+        "uuid": uuid,
+        "folio": comprobante.get("Folio"),
+        "tipo": TIPOS_COMPROBANTE.get(tipo, tipo),
+        "fecha_emision": _fecha(comprobante.get("Fecha")),
+        "fecha_certificacion": _fecha(timbre.get("FechaTimbrado")),
+        "rfc_receptor": receptor.get("Rfc"),
+        "razon_receptor": receptor.get("Nombre"),
+        "claves_de_productos": claves or None,
+        "uso_cfdi": USOS_CFDI.get(uso, uso),
+        "estado": None,
+        "fecha_proceso_cancelacion": None,
+        "estado_cancelacion": None,
+        "moneda": comprobante.get("Moneda") or MONEDA_DEFAULT,
+        "subtotal": _float(_monto(comprobante.get("SubTotal"))),
+        "iva_trasladado": _float(sum(iva)) if iva else 0.0,
+        "total": _float(_monto(comprobante.get("Total"))),
+        "extras": json.dumps(extras, ensure_ascii=False),
+    }
+
+# ==============================
+# ARCHIVOS (CARPETAS Y ZIPS)
+# ==============================
+def iter_fuentes(rutas):
+    """
+    Recorre carpetas (recursivo), zips y XML sueltos y entrega (archivo,
+    miembro): miembro es el nombre dentro del zip, o None si es un XML suelto.
+    Los zips dentro de carpetas también se recorren.
+    """
+    for ruta in map(Path, rutas):
+        if ruta.is_dir():
+            for p in sorted(ruta.rglob("*")):
+                if p.is_file() and p.suffix.lower() in (".xml", ".zip"):
+                    yield from iter_fuentes([p])
+        elif ruta.suffix.lower() == ".zip":
+            with zipfile.ZipFile(ruta) as z:
+                miembros = [i.filename for i in z.infolist() if not i.is_dir() and i.filename.lower().endswith(".xml")]
+            for miembro in miembros:
+                yield str(ruta), miembro
+        else:
+            yield str(ruta), None
+
+
+def parsear_lote(fuentes):
+    """
+    Parsea un lote de (archivo, miembro) en un proceso aparte. Devuelve
+    (filas, omitidos, errores): filas de ingreso, cuántos XML no eran de
+    ingreso y una lista (origen, mensaje) de los que no se pudieron leer.
+    """
+    filas, omitidos, errores = [], 0, []
+    zips = {}
+    try:
+        for archivo, miembro in fuentes:
+            origen = archivo if miembro is None else f"{archivo}!{miembro}"
+            try:
+                if miembro is None:
+                    with open(archivo, "rb") as f:
+                        fila = fila_factura(leer_cfdi(f))
+                else:
+                    if archivo not in zips:
+                        zips[archivo] = zipfile.ZipFile(archivo)
+                    with zips[archivo].open(miembro) as f:
+                        fila = fila_factura(leer_cfdi(f))
+            except (ET.ParseError, ValueError, OSError, zipfile.BadZipFile) as e:
+                errores.append((origen, str(e)))
+                continue
+            if fila is None:
+                omitidos += 1
+            else:
+                filas.append(fila)
+    finally:
+        for z in zips.values():
+            z.close()
+    return filas, omitidos, errores
+
+
+def parsear_archivo(path):
+    """
+    Facturas de ingreso de un XML o de un zip de XML (DataFrame con
+    COLUMNAS_TABLA), para la ingesta por archivo (ingesta.py). Avisa de los
+    XML que no se pudieron leer y falla si no se pudo leer ninguno.
+    """
+    filas, _, errores = parsear_lote(list(iter_fuentes([path])))
+    if errores:
+        if not filas and len(errores) == sum(1 for _ in iter_fuentes([path])):
+            raise ValueError(errores[0][1])
+        print(f"⚠️ {path}: {len(errores)} XML con error (primero: {errores[0][0]}: {errores[0][1]})")
+    return pd.DataFrame(filas, columns=COLUMNAS_TABLA, dtype=object)
+
+# ==============================
+# CARGA
+# ==============================
+def load_xml(rutas, db_path=DB_PATH, max_workers=MAX_WORKERS, lote=LOTE_ARCHIVOS):
+    """
+    Carga en facturas_emitidas_mx los CFDI de ingreso de carpetas / zips / XML.
+    Parsea en paralelo por lotes y guarda cada lote en una transacción
+    (parse_facturas_emitidas.guardar_facturas; las facturas que ya estaban,
+    p. ej. desde el Excel del SAT, solo se completan). Al final actualiza el
+    índice de contrapartes.
+
+    Devuelve un dict con: archivos, procesadas, insertadas, actualizadas,
+    sin_cambios, omitidos, errores (lista de (origen, mensaje)) y segundos.
+    """
+    inicio = time.perf_counter()
+    resumen = {
+        "archivos": 0, "procesadas": 0, "insertadas": 0, "actualizadas": 0, "sin_cambios": 0,
+        "omitidos": 0, "errores": [],
+    }
+    lotes = iter_lotes(iter_fuentes(rutas), lote)
+
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA foreign_keys = ON;")
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            pendientes = {}
+            while True:
+                # Mantener pocos lotes en vuelo: los XML se leen a medida que se parsean
+                while len(pendientes) < max_workers * MAX_LOTES_EN_VUELO:
+                    fuentes = next(lotes, None)
+                    if fuentes is None:
+                        break
+                    pendientes[pool.submit(parsear_lote, fuentes)] = len(fuentes)
+                if not pendientes:
+                    break
+
+                listos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    resumen["archivos"] += pendientes.pop(futuro)
+                    filas, omitidos, errores = futuro.result()
+                    resumen["procesadas"] += len(filas)
+                    resumen["omitidos"] += omitidos
+                    resumen["errores"].extend(errores)
+                    if filas:
+                        df = pd.DataFrame(filas, columns=COLUMNAS_TABLA, dtype=object)
+                        conteo = guardar_facturas(con, df, solo_completar=True)
+                        resumen["insertadas"] += conteo["nuevas"]
+                        resumen["actualizadas"] += conteo["cambiadas"]
+                        resumen["sin_cambios"] += conteo["sin_cambios"]
+
+        # Índice de contrapartes (n-gramas de razon_receptor) para la conciliación
+        actualizar_indice(con)
+    finally:
+        con.close()
+
+    resumen["segundos"] = time.perf_counter() - inicio
+    return resumen
+
+# ==============================
+# MAIN
+# ==============================
+def main():
+    ap = argparse.ArgumentParser(description="Carga CFDI emitidos desde XML (carpetas o zips)")
+    ap.add_argument("rutas", nargs="+", help="Carpetas, zips o XML")
+    ap.add_argument("--db", default=str(DB_PATH))
+    ap.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = ap.parse_args()
+
+    r = load_xml(args.rutas, args.db, args.workers)
+    print(f"📄 {r['archivos']} XML leídos en {r['segundos']:.2f} s "
+          f"({r['archivos'] / max(r['segundos'], 1e-9):,.0f} archivos/seg)")
+    print(f"🟢 Ingreso: {r['procesadas']} ({r['insertadas']} nuevas, "
+          f"{r['actualizadas']} actualizadas, {r['sin_cambios']} sin cambios)")
+    print(f"🟡 Otros tipos omitidos: {r['omitidos']}")
+    if r["errores"]:
+        print(f"❌ {len(r['errores'])} XML con error:")
+        for origen, mensaje in r["errores"][:10]:
+            print(f"   {origen}: {mensaje}")
+
+
+if __name__ == "__main__":
+    main()
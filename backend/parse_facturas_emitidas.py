@@ -1,9 +1,18 @@
+import hashlib
 import json
+import math
 import sqlite3
+import sys
 from pathlib import Path
 
 import pandas as pd
 
+from consultas import sql_facturas, ultimo_mes_facturas
+from exportador import exportar_consulta
+from indice_contrapartes import actualizar_indice
+from normalizacion import avisar_no_parseadas, centavos_a_monto, montos_a_centavos, normalizar_fechas
+from tipo_cambio import MONEDA_EMPRESA
+
 # ==============================
 # CONFIGURACIÓN DE ARCHIVOS Y CONSTANTES
 # ==============================
@@ -12,7 +21,7 @@ BASE_DIR = Path(__file__).parent                          # Carpeta base del scr
 DB_PATH = BASE_DIR / "db" / "conciliador.db"              # Base de datos SQLite
 
 PAIS = "MX"
-MONEDA_DEFAULT = "MXN"
+MONEDA_DEFAULT = MONEDA_EMPRESA
 
 INPUT_FILE = (BASE_DIR / "Archivos ejemplos" / "CFS1808284P2-EMITIDOS-DEL-1-11-2025-AL-30-11-2025.xlsx")
 
@@ -64,155 +73,351 @@ MAP = {
 }
 
 # ==============================
-# HELPERS
-# ==============================
-def to_iso_text(value):
-    if pd.isna(value):
-        return None
-    try:
-        return pd.to_datetime(value).strftime("%Y-%m-%d %H:%M:%S")
-    except Exception:
-        value = str(value).strip()
-        return value if value else None
-
-
-def to_float(value):
-    if pd.isna(value):
-        return None
-    s = str(value).strip()
-    if not s:
-        return None
-    s = s.replace("$", "").replace(" ", "")
-    if "," in s and "." not in s:
-        s = s.replace(".", "").replace(",", ".")
-    else:
-        s = s.replace(",", "")
-    try:
-        return float(s)
-    except ValueError:
-        return None
-
-
-def norm_text(value):
-    if pd.isna(value):
-        return None
-    s = str(value).strip()
-    return s if s else None
-
-
-# ==============================
-# 1) LEER EXCEL
+# CONVERSIONES POR COLUMNA
 # ==============================
-df = pd.read_excel(INPUT_FILE, sheet_name=INPUT_SHEET, dtype=object)
-
-missing = [c for c in YELLOW_COLS if c not in df.columns]
-if missing:
-    raise ValueError(f"Faltan columnas en el Excel: {missing}")
+FORMATOS_FECHA = ("%Y-%m-%d %H:%M:%S",)  # Formato de las fechas del Excel del SAT
+
+
+def texto_col(serie):
+    """Texto sin espacios extremos o None."""
+    texto = serie.astype(str).str.strip()
+    return texto.astype(object).where(texto.notna() & (texto != ""), None)
+
+
+def iso_text_col(serie):
+    """
+    Fechas de la columna como 'YYYY-MM-DD HH:MM:SS'. Los textos que no son
+    fecha se avisan y se guardan tal cual; los vacíos quedan como None.
+    """
+    fechas, no_parseadas = normalizar_fechas(serie, FORMATOS_FECHA)
+    avisar_no_parseadas(serie.name, no_parseadas)
+
+    iso = fechas.dt.strftime("%Y-%m-%d %H:%M:%S").astype(object)
+    return iso.where(fechas.notna(), texto_col(serie))
+
+
+def float_col(serie):
+    """
+    Montos de la columna redondeados a centavos: acepta '$', espacios y coma
+    decimal. Los que no se reconocen se avisan y quedan como None.
+    """
+    centavos, no_parseadas = montos_a_centavos(serie, coma_decimal="auto")
+    avisar_no_parseadas(serie.name, no_parseadas)
+    return centavos_a_monto(centavos)
+
+
+def extras_col(df):
+    """
+    JSON de las columnas no amarillas, una cadena por fila.
+    Las columnas con 'Fecha' en el nombre se pasan por iso_text_col y los
+    vacíos quedan como null.
+    """
+    columnas = [c for c in df.columns if c not in YELLOW_COLS]
+    extras = pd.DataFrame(
+        {
+            col: iso_text_col(df[col]) if "Fecha" in col else df[col].astype(object).where(df[col].notna(), None)
+            for col in columnas
+        },
+        index=df.index,
+    )
+    return pd.Series(
+        [
+            json.dumps(dict(zip(columnas, valores)), ensure_ascii=False, default=str)
+            for valores in extras.itertuples(index=False, name=None)
+        ],
+        index=df.index,
+        dtype=object,
+    )
 
 # ==============================
-# 2) FILTRAR SOLO INGRESOS
+# CARGA
 # ==============================
-df["Tipo"] = df["Tipo"].astype(str).str.strip()
-df_ingreso = df[df["Tipo"] == "I - Ingreso"].copy()
+COLUMNAS_TABLA = [
+    "uuid", "folio", "tipo", "fecha_emision", "fecha_certificacion",
+    "rfc_receptor", "razon_receptor", "claves_de_productos", "uso_cfdi",
+    "estado", "fecha_proceso_cancelacion", "estado_cancelacion",
+    "moneda", "subtotal", "iva_trasladado", "total",
+    "extras",
+]
 
-if df_ingreso.empty:
-    print("No hay registros con Tipo = 'I - Ingreso'.")
-    exit(0)
+COLUMNAS_FECHA = ["Fecha emision", "Fecha certificacion", "Fecha proceso cancelacion"]
+COLUMNAS_MONTO = ["SubTotal", "IVA Trasladado", "Total"]
 
 # ==============================
-# 3) CONECTAR SQLITE
-# ==============================
-con = sqlite3.connect(DB_PATH)
-con.execute("PRAGMA foreign_keys = ON;")
-
+# UPSERT CON DETECCIÓN DE CAMBIOS
 # ==============================
-# 4) INSERTAR DATOS (UUID ÚNICO)
-# ==============================
-insert_sql = f"""
-INSERT OR IGNORE INTO {TABLE_NAME} (
-  uuid, folio, tipo, fecha_emision, fecha_certificacion,
-  rfc_receptor, razon_receptor, claves_de_productos, uso_cfdi,
-  estado, fecha_proceso_cancelacion, estado_cancelacion,
-  moneda, subtotal, iva_trasladado, total,
-  extras
-) VALUES (
-  ?, ?, ?, ?, ?,
-  ?, ?, ?, ?,
-  ?, ?, ?,
-  ?, ?, ?, ?,
-  ?
-);
+# Cada factura guarda contenido_hash: hash de lo que quedó escrito (todas
+# las columnas menos el UUID). Al volver a cargar un periodo cada fila se
+# combina primero con la guardada:
+# - el Excel del SAT manda: reemplaza lo guardado, salvo las columnas de
+#   estado, que un vacío no borra
+# - los XML (parse_cfdi_xml.py, solo_completar=True) solo llenan lo vacío:
+#   traen los catálogos como clave ("01") y no la descripción del Excel
+#   ("01 No aplica"), y no traen estado
+# - extras: se agregan las claves nuevas y las que se conservan o
+#   reemplazan siguen la misma regla (el Excel y el XML traen datos distintos)
+# Así cargar una fuente después de la otra escribe solo lo que aporta, y
+# volver a cargar cualquiera de las dos no reescribe nada. Después:
+# - UUID nuevo -> se inserta
+# - la combinación cambia el hash -> se reescribe y updated_at pasa a ahora
+#   (p. ej. el SAT la marcó cancelada)
+# - mismo hash -> no se toca
+# Las filas a escribir pasan por una tabla temporal y se aplican con un
+# único INSERT ... SELECT ... ON CONFLICT DO UPDATE.
+#
+# Cada fila insertada o reescrita recibe version = MAX(version) + n: un
+# contador que solo crece y que se asigna con la base bloqueada para
+# escritura, así que las versiones se confirman en orden. Es la marca de
+# sync_postgres.py (updated_at tiene resolución de un segundo y no sirve
+# para saber qué cambió después de la última sincronización).
+
+COLUMNAS_HASH = [c for c in COLUMNAS_TABLA if c != "uuid"]
+COLUMNAS_ESTADO = ["estado", "fecha_proceso_cancelacion", "estado_cancelacion"]
+STAGING = "stg_facturas_emitidas"
+BLOQUE_UUID = 500  # UUID por consulta al leer las facturas guardadas
+
+
+def hash_factura(valores):
+    """Hash del contenido de una factura (valores en el orden de COLUMNAS_HASH)."""
+    texto = json.dumps(list(valores), ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:32]
+
+
+def _vacio(valor):
+    return valor is None or (isinstance(valor, float) and math.isnan(valor))
+
+
+def fusionar_extras(guardado, nuevo, solo_completar=False):
+    """
+    extras (JSON) guardado + el de la carga. Las claves que no estaban se
+    agregan y las que la carga trae vacías no borran nada. En las demás
+    gana la carga, o lo guardado con solo_completar (salvo que esté vacío).
+    """
+    if guardado is None or guardado == nuevo:
+        return nuevo
+    if nuevo is None:
+        return guardado
+
+    combinado = json.loads(guardado)
+    for clave, valor in json.loads(nuevo).items():
+        if clave not in combinado or (
+            _vacio(combinado[clave]) if solo_completar else not _vacio(valor)
+        ):
+            combinado[clave] = valor
+    return json.dumps(combinado, ensure_ascii=False, default=str)
+
+
+def _guardadas(con, uuids):
+    """Columnas y hash de las facturas ya guardadas entre uuids (índice: uuid)."""
+    columnas = [*COLUMNAS_TABLA, "contenido_hash"]
+    bloques = [
+        pd.read_sql(
+            f"SELECT {', '.join(columnas)} FROM {TABLE_NAME} WHERE uuid IN ({', '.join('?' * len(bloque))})",
+            con, params=bloque,
+        )
+        for bloque in (uuids[i:i + BLOQUE_UUID] for i in range(0, len(uuids), BLOQUE_UUID))
+    ]
+    guardadas = pd.concat(bloques, ignore_index=True) if bloques else pd.DataFrame(columns=columnas)
+    guardadas = guardadas.astype(object)
+    return guardadas.where(guardadas.notna(), None).set_index("uuid")
+
+
+UPSERT_SQL = f"""
+INSERT INTO {TABLE_NAME} ({", ".join(COLUMNAS_TABLA)}, contenido_hash, version)
+SELECT {", ".join(COLUMNAS_TABLA)}, contenido_hash,
+       (SELECT COALESCE(MAX(version), 0) FROM {TABLE_NAME}) + rowid
+FROM {STAGING}
+WHERE true  -- SQLite lo exige para no confundir ON CONFLICT con un JOIN
+ORDER BY rowid
+ON CONFLICT (uuid) DO UPDATE SET
+  {", ".join(f"{c} = excluded.{c}" for c in COLUMNAS_HASH)},
+  contenido_hash = excluded.contenido_hash,
+  version = excluded.version,
+  updated_at = CURRENT_TIMESTAMP
+WHERE {TABLE_NAME}.contenido_hash IS NOT excluded.contenido_hash;
 """
 
-rows = []
-
-for _, row in df_ingreso.iterrows():
-    uuid = norm_text(row.get("UUID"))
-    if not uuid:
-        continue
-
-    extras = {
-        col: (to_iso_text(row[col]) if "Fecha" in col else None if pd.isna(row[col]) else row[col])
-        for col in df.columns
-        if col not in YELLOW_COLS
-    }
-
-    rows.append((
-        uuid,
-        norm_text(row.get("Folio")),
-        norm_text(row.get("Tipo")),
-        to_iso_text(row.get("Fecha emision")),
-        to_iso_text(row.get("Fecha certificacion")),
-        norm_text(row.get("RFC receptor")),
-        norm_text(row.get("Razon receptor")),
-        norm_text(row.get("Claves de productos")),
-        norm_text(row.get("Uso CFDI")),
-        norm_text(row.get("Estado")),
-        to_iso_text(row.get("Fecha proceso cancelacion")),
-        norm_text(row.get("Estado cancelacion")),
-        norm_text(row.get("Moneda")) or MONEDA_DEFAULT,
-        to_float(row.get("SubTotal")),
-        to_float(row.get("IVA Trasladado")),
-        to_float(row.get("Total")),
-        json.dumps(extras, ensure_ascii=False, default=str),
-    ))
-
-cur = con.cursor()
-cur.executemany(insert_sql, rows)
-con.commit()
-
-print(f"Filas procesadas (Ingreso): {len(rows)}")
-print(f"Filas insertadas nuevas: {con.total_changes}")
+
+def leer_facturas(path, sheet=INPUT_SHEET):
+    """Lee el Excel de CFDI emitidos y valida que estén las columnas amarillas."""
+    df = pd.read_excel(path, sheet_name=sheet, dtype=object)
+
+    missing = [c for c in YELLOW_COLS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Faltan columnas en el Excel {path}: {missing}")
+
+    return df
+
+
+def preparar_facturas(df):
+    """
+    Filtra solo 'I - Ingreso' y arma las columnas de facturas_emitidas_mx
+    (en el orden de COLUMNAS_TABLA) trabajando columna por columna.
+    Se descartan las filas sin UUID.
+    """
+    tipo = df["Tipo"].astype(str).str.strip()
+    df = df[tipo == "I - Ingreso"]
+
+    filas = pd.DataFrame(index=df.index)
+    for col in YELLOW_COLS:
+        if col in COLUMNAS_FECHA:
+            filas[MAP[col]] = iso_text_col(df[col])
+        elif col in COLUMNAS_MONTO:
+            filas[MAP[col]] = float_col(df[col])
+        else:
+            filas[MAP[col]] = texto_col(df[col])
+
+    filas["moneda"] = filas["moneda"].where(filas["moneda"].notna(), MONEDA_DEFAULT)
+    filas["extras"] = extras_col(df)
+
+    filas = filas[filas["uuid"].notna()]
+    return filas[COLUMNAS_TABLA].reset_index(drop=True)
+
+
+def guardar_facturas(con, filas, solo_completar=False):
+    """
+    Guarda en una transacción las filas de preparar_facturas: inserta las
+    nuevas y reescribe solo las que, combinadas con lo guardado, cambiaron
+    (ver UPSERT CON DETECCIÓN DE CAMBIOS). Con solo_completar las facturas
+    ya guardadas solo se completan (fuentes secundarias, como los XML).
+    Un UUID repetido dentro de filas cuenta una vez (la primera).
+
+    Devuelve un dict con: nuevas, cambiadas, sin_cambios.
+    """
+    conteo = {"nuevas": 0, "cambiadas": 0, "sin_cambios": 0}
+    if filas.empty:
+        return conteo
+
+    datos = filas[COLUMNAS_TABLA].astype(object).drop_duplicates("uuid").reset_index(drop=True)
+    datos = datos.where(datos.notna(), None)
+
+    with con:
+        guardadas = _guardadas(con, datos["uuid"].tolist())
+        existe = datos["uuid"].isin(guardadas.index).to_numpy()
+        previas = guardadas.reindex(datos["uuid"]).reset_index(drop=True)
+        previas = previas.where(previas.notna(), None)
+
+        for col in COLUMNAS_HASH:
+            if col == "extras":
+                continue
+            if solo_completar:
+                datos[col] = previas[col].where(previas[col].notna(), datos[col])
+            elif col in COLUMNAS_ESTADO:
+                datos[col] = datos[col].where(datos[col].notna(), previas[col])
+        datos["extras"] = [
+            fusionar_extras(guardado, nuevo, solo_completar)
+            for guardado, nuevo in zip(previas["extras"].tolist(), datos["extras"].tolist())
+        ]
+        datos = datos.where(datos.notna(), None)
+
+        hashes = pd.Series(
+            [hash_factura(valores) for valores in datos[COLUMNAS_HASH].itertuples(index=False, name=None)],
+            index=datos.index,
+        )
+        sin_cambios = existe & (hashes == previas["contenido_hash"]).to_numpy()
+        escribir = ~sin_cambios
+
+        conteo["nuevas"] = int((~existe).sum())
+        conteo["cambiadas"] = int((existe & ~sin_cambios).sum())
+        conteo["sin_cambios"] = int(sin_cambios.sum())
+        if not escribir.any():
+            return conteo
+
+        con.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {STAGING} (
+              uuid TEXT PRIMARY KEY,
+              {", ".join(COLUMNAS_HASH)},
+              contenido_hash TEXT
+            )
+        """)
+        con.execute(f"DELETE FROM {STAGING}")
+        con.executemany(
+            f"INSERT INTO {STAGING} VALUES ({', '.join('?' for _ in COLUMNAS_TABLA)}, ?)",
+            (
+                (*valores, h)
+                for valores, h in zip(
+                    datos[escribir].itertuples(index=False, name=None),
+                    hashes[escribir].tolist(),
+                )
+            ),
+        )
+        con.execute(UPSERT_SQL)
+        con.execute(f"DELETE FROM {STAGING}")
+
+    return conteo
+
+
+def load_facturas(paths, db_path=DB_PATH, sheet=INPUT_SHEET):
+    """
+    Carga uno o varios Excel de CFDI emitidos en facturas_emitidas_mx.
+    - Una sola conexión para todos los archivos
+    - Una transacción por archivo (si un archivo falla, los anteriores quedan cargados)
+    - Las facturas ya cargadas solo se reescriben si cambiaron (estado, cancelación...)
+    - Al final actualiza el índice de contrapartes
+
+    Devuelve una lista de dicts por archivo: archivo, procesadas, insertadas,
+    actualizadas, sin_cambios.
+    """
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA foreign_keys = ON;")
+
+    resumen = []
+    try:
+        for path in paths:
+            filas = preparar_facturas(leer_facturas(path, sheet))
+            conteo = guardar_facturas(con, filas)
+
+            resumen.append({
+                "archivo": str(path),
+                "procesadas": len(filas),
+                "insertadas": conteo["nuevas"],
+                "actualizadas": conteo["cambiadas"],
+                "sin_cambios": conteo["sin_cambios"],
+            })
+
+        # Índice de contrapartes (n-gramas de razon_receptor) para la conciliación
+        indexadas = actualizar_indice(con)
+    finally:
+        con.close()
+
+    print(f"Contrapartes nuevas indexadas: {indexadas}")
+    return resumen
+
+
+def exportar_facturas(db_path=DB_PATH, output_file=OUTPUT_FILE, fecha_desde=None, fecha_hasta=None):
+    """
+    Exporta las columnas amarillas de facturas_emitidas_mx (leyendo por
+    bloques). Con fecha_desde / fecha_hasta (YYYY-MM-DD) solo las emitidas
+    en ese rango; el formato sale de la extensión (.xlsx, .csv o .parquet).
+    """
+    query_export, params = sql_facturas(fecha_desde, fecha_hasta)
+    conteo = exportar_consulta(db_path, query_export, output_file, params=params)
+    print(f"Archivo exportado: {output_file} ({sum(conteo.values())} facturas)")
 
 # ==============================
-# 5) EXPORTAR COLUMNAS AMARILLAS
+# MAIN
 # ==============================
-query_export = f"""
-SELECT
-  id,
-  uuid,
-  folio,
-  tipo,
-  fecha_emision,
-  fecha_certificacion,
-  rfc_receptor,
-  razon_receptor,
-  estado,
-  estado_cancelacion,
-  claves_de_productos,
-  moneda,
-  subtotal,
-  iva_trasladado,
-  total,
-  created_at,
-  updated_at
-FROM {TABLE_NAME}
-ORDER BY fecha_emision ASC;
-"""
-
-df_out = pd.read_sql_query(query_export, con)
-df_out.to_excel(OUTPUT_FILE, index=False)
-
-print(f"Archivo exportado: {OUTPUT_FILE}")
-
-con.close()
+def main(paths=None):
+    for r in load_facturas(paths or [INPUT_FILE]):
+        if r["procesadas"] == 0:
+            print(f"{r['archivo']}: no hay registros con Tipo = 'I - Ingreso'.")
+            continue
+        print(f"{r['archivo']}")
+        print(f"  Filas procesadas (Ingreso): {r['procesadas']}")
+        print(f"  Filas insertadas nuevas: {r['insertadas']}")
+        print(f"  Filas actualizadas (cambiaron): {r['actualizadas']}")
+        print(f"  Filas sin cambios: {r['sin_cambios']}")
+
+    # Solo el último mes emitido, no todo el histórico
+    con = sqlite3.connect(DB_PATH)
+    rango = ultimo_mes_facturas(con)
+    con.close()
+    if rango is not None:
+        exportar_facturas(fecha_desde=rango[0], fecha_hasta=rango[1])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
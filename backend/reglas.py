@@ -0,0 +1,279 @@
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+# ==============================
+# MOTOR DE REGLAS POR BANCO
+# ==============================
+# Cada banco declara sus reglas como datos (ver REGLAS_BBVA en
+# parse_bbva_mexico.py y REGLAS_BANREGIO en parse_banregio_mexico.py).
+# Una regla es un dict con:
+#
+# - nombre:          identificador (aparece en las estadísticas)
+# - prefijos:        tupla de prefijos del concepto que la activan ("" = cualquiera)
+# - contiene / no_contiene: texto que el concepto debe (o no debe) contener
+# - tipo_documento:  tipo fijo para las filas de la regla
+# - tipo_si_abono / tipo_si_cargo: tipo cuando la fila trae abono / cargo
+# - fijos:           {campo: valor constante}
+# - copiar:          campos que toman el concepto completo
+# - extraer:         regex compiladas; cada grupo con nombre llena el campo
+#                    del mismo nombre
+# - limpiar:         {campo: (regex, ...)} el concepto sin esos patrones
+#                    (se quitan en orden) y sin espacios extremos
+# - depurar:         {campo: (regex, ...)} patrones que se quitan del valor ya
+#                    calculado del campo (y luego strip)
+# - funcion:         función(textos) -> DataFrame de campos, para formatos que
+#                    no caben en una regex (p. ej. SPEI de Banregio)
+#
+# Cada fila la toma UNA sola regla: la de prefijo más largo cuyo filtro
+# (contiene / no_contiene) se cumpla. El despacho es un trie de prefijos
+# recorrido carácter a carácter sobre toda la columna, así que su costo
+# depende del largo de los prefijos y no de cuántas reglas haya.
+#
+# Los "ajustes" usan el mismo formato pero no son excluyentes: se aplican
+# en orden, después de las reglas, a todas las filas que calcen, y los
+# campos extraídos solo pisan lo anterior cuando encuentran algo.
+
+CAMPOS = [
+    "banco_origen",
+    "cuenta_origen",
+    "nombre_contraparte",
+    "referencia_movimiento",
+    "comentario_movimiento",
+    "tipo_documento",
+    "descripcion",
+]
+
+# (banco, regla) -> filas y segundos acumulados (ver estadisticas_reglas)
+ESTADISTICAS = defaultdict(lambda: {"filas": 0, "segundos": 0.0})
+
+# ==============================
+# TRIE DE PREFIJOS
+# ==============================
+def construir_motor(banco, reglas, ajustes=(), tipo_default=None):
+    """
+    Compila las reglas de un banco: arma el trie de prefijos como tabla de
+    transiciones (nodo x carácter) para recorrerlo con numpy.
+    """
+    hijos = [{}]          # nodo -> {carácter: nodo}
+    reglas_nodo = [[]]    # nodo -> índices de reglas que terminan ahí (en orden)
+
+    for i, regla in enumerate(reglas):
+        for prefijo in regla["prefijos"]:
+            nodo = 0
+            for c in prefijo:
+                if c not in hijos[nodo]:
+                    hijos.append({})
+                    reglas_nodo.append([])
+                    hijos[nodo][c] = len(hijos) - 1
+                nodo = hijos[nodo][c]
+            reglas_nodo[nodo].append(i)
+
+    alfabeto = sorted({c for h in hijos for c in h})
+
+    # Código del carácter -> columna de la tabla de transiciones
+    # (0 = carácter fuera del alfabeto; el último código del arreglo también es 0)
+    columna = np.zeros(max((ord(c) for c in alfabeto), default=0) + 2, dtype=np.int32)
+    for i, c in enumerate(alfabeto):
+        columna[ord(c)] = i + 1
+
+    # Nodo extra al final = sumidero (ningún prefijo sigue por ahí)
+    sumidero = len(hijos)
+    transiciones = np.full((len(hijos) + 1, len(alfabeto) + 1), sumidero, dtype=np.int32)
+    for nodo, h in enumerate(hijos):
+        for c, hijo in h.items():
+            transiciones[nodo, columna[ord(c)]] = hijo
+
+    return {
+        "banco": banco,
+        "reglas": reglas,
+        "ajustes": list(ajustes),
+        "tipo_default": tipo_default,
+        "transiciones": transiciones,
+        "columna": columna,
+        "sumidero": sumidero,
+        "reglas_nodo": reglas_nodo + [[]],
+        "profundidad": max((len(p) for r in reglas for p in r["prefijos"]), default=0),
+    }
+
+
+def _codigos(texto, largo):
+    """Primeros `largo` caracteres de cada texto como matriz de códigos (0 = relleno)."""
+    if largo == 0:
+        return np.zeros((len(texto), 0), dtype=np.uint32)
+    recortes = np.asarray(texto.str.slice(0, largo).tolist(), dtype=f"<U{largo}")
+    return recortes.view(np.uint32).reshape(len(texto), largo)
+
+
+def _filtro(regla, texto, cache):
+    mascara = np.ones(len(texto), dtype=bool)
+    for clave, negar in (("contiene", False), ("no_contiene", True)):
+        if clave in regla:
+            if regla[clave] not in cache:
+                cache[regla[clave]] = texto.str.contains(regla[clave], regex=False).to_numpy()
+            mascara &= ~cache[regla[clave]] if negar else cache[regla[clave]]
+    return mascara
+
+
+def despachar(motor, texto):
+    """
+    Devuelve, para cada texto, el índice de la regla que lo toma (-1 si ninguna).
+
+    Recorre el trie nivel por nivel sobre toda la columna guardando el nodo
+    de cada fila en cada profundidad; después, de la más profunda a la raíz,
+    asigna la primera regla de ese nodo cuyo filtro se cumpla.
+    """
+    n = len(texto)
+    codigos = _codigos(texto, motor["profundidad"])
+    columna = motor["columna"]
+    # Una fila por profundidad (cada nivel contiguo en memoria)
+    columnas = np.ascontiguousarray(columna[np.minimum(codigos, len(columna) - 1)].T)
+
+    # Solo se avanza con las filas que siguen dentro del trie
+    nodos = np.full((motor["profundidad"] + 1, n), motor["sumidero"], dtype=np.int32)
+    nodos[0] = 0
+    activas = np.arange(n)
+    for d in range(motor["profundidad"]):
+        siguiente = motor["transiciones"][nodos[d, activas], columnas[d, activas]]
+        nodos[d + 1, activas] = siguiente
+        activas = activas[siguiente != motor["sumidero"]]
+        if not len(activas):
+            break
+
+    # Nodos donde termina algún prefijo
+    acepta = np.array([bool(r) for r in motor["reglas_nodo"]])
+
+    regla = np.full(n, -1, dtype=np.int64)
+    cache = {}
+    for d in range(motor["profundidad"], -1, -1):
+        candidatos = (regla < 0) & acepta[nodos[d]]
+        if not candidatos.any():
+            continue
+        for nodo in np.unique(nodos[d, candidatos]):
+            for i in motor["reglas_nodo"][nodo]:
+                toma = (regla < 0) & (nodos[d] == nodo) & _filtro(motor["reglas"][i], texto, cache)
+                regla[toma] = i
+    return regla
+
+# ==============================
+# APLICACIÓN DE REGLAS
+# ==============================
+def _aplicar(regla, texto, out, filas, abonos, cargos, pisar_vacios):
+    """Llena los campos de `out` en `filas` según la regla (todo vectorizado)."""
+    t = texto[filas]
+    valores = {}
+
+    for campo, valor in regla.get("fijos", {}).items():
+        valores[campo] = pd.Series(valor, index=t.index, dtype=object)
+    for campo in regla.get("copiar", ()):
+        valores[campo] = t
+    for patron in regla.get("extraer", ()):
+        extraido = t.str.extract(patron)
+        for campo in extraido.columns:
+            valores[campo] = extraido[campo]
+    for campo, patrones in regla.get("limpiar", {}).items():
+        limpio = t
+        for patron in patrones:
+            limpio = limpio.str.replace(patron, "", regex=True)
+        valores[campo] = limpio.str.strip()
+    if "funcion" in regla:
+        resultado = regla["funcion"](t)
+        for campo in resultado.columns:
+            valores[campo] = resultado[campo].reindex(t.index)
+    for campo, patrones in regla.get("depurar", {}).items():
+        if campo in valores:
+            depurado = valores[campo].astype(object)
+            presentes = depurado.notna()
+            limpio = depurado[presentes].astype(str)
+            for patron in patrones:
+                limpio = limpio.str.replace(patron, "", regex=True)
+            depurado[presentes] = limpio.str.strip()
+            valores[campo] = depurado
+
+    for campo, serie in valores.items():
+        if pisar_vacios:
+            out.loc[filas, campo] = serie
+        else:
+            serie = serie.dropna()
+            out.loc[serie.index, campo] = serie
+
+    if "tipo_documento" in regla:
+        out.loc[filas, "tipo_documento"] = regla["tipo_documento"]
+    if "tipo_si_abono" in regla:
+        out.loc[filas & (abonos > 0), "tipo_documento"] = regla["tipo_si_abono"]
+    if "tipo_si_cargo" in regla:
+        out.loc[filas & (cargos > 0), "tipo_documento"] = regla["tipo_si_cargo"]
+
+
+def _registrar(banco, nombre, filas, segundos):
+    estadistica = ESTADISTICAS[(banco, nombre)]
+    estadistica["filas"] += int(filas)
+    estadistica["segundos"] += segundos
+
+
+def aplicar_reglas(motor, conceptos, abonos=None, cargos=None):
+    """
+    Clasifica toda la columna de conceptos con las reglas del banco.
+
+    Devuelve un DataFrame con el mismo índice y las columnas de CAMPOS
+    (faltantes como None). descripcion es el concepto sin espacios extremos.
+    """
+    # Igual que str(row["concepto"]).strip() en el loop original
+    texto = conceptos.fillna("nan").astype(str).str.strip()
+    indice = texto.index
+    texto = texto.reset_index(drop=True)
+    abonos = pd.Series(0.0 if abonos is None else abonos.to_numpy(), index=texto.index).astype(float)
+    cargos = pd.Series(0.0 if cargos is None else cargos.to_numpy(), index=texto.index).astype(float)
+
+    out = pd.DataFrame(
+        {campo: None for campo in CAMPOS} | {"tipo_documento": motor["tipo_default"], "descripcion": texto},
+        index=texto.index,
+        dtype=object,
+    )
+
+    inicio = time.perf_counter()
+    regla_fila = despachar(motor, texto)
+    _registrar(motor["banco"], "(despacho)", len(texto), time.perf_counter() - inicio)
+
+    conteo = np.bincount(regla_fila + 1, minlength=len(motor["reglas"]) + 1)
+    for i, regla in enumerate(motor["reglas"]):
+        if not conteo[i + 1]:
+            continue
+        inicio = time.perf_counter()
+        _aplicar(regla, texto, out, pd.Series(regla_fila == i, index=texto.index), abonos, cargos, True)
+        _registrar(motor["banco"], regla["nombre"], conteo[i + 1], time.perf_counter() - inicio)
+
+    cache = {}
+    for ajuste in motor["ajustes"]:
+        inicio = time.perf_counter()
+        filas = texto.str.startswith(tuple(ajuste["prefijos"])) & _filtro(ajuste, texto, cache)
+        if filas.any():
+            _aplicar(ajuste, texto, out, filas, abonos, cargos, False)
+        _registrar(motor["banco"], ajuste["nombre"], filas.sum(), time.perf_counter() - inicio)
+
+    out.index = indice
+    return out.astype(object).where(out.notna(), None)
+
+# ==============================
+# ESTADÍSTICAS
+# ==============================
+def estadisticas_reglas():
+    """Filas y tiempo acumulados por regla, de la más usada a la menos usada."""
+    filas = [
+        {"banco": banco, "regla": nombre, "filas": e["filas"], "segundos": e["segundos"]}
+        for (banco, nombre), e in ESTADISTICAS.items()
+    ]
+    df = pd.DataFrame(filas, columns=["banco", "regla", "filas", "segundos"])
+    df["us_por_fila"] = (df["segundos"] / df["filas"].where(df["filas"] > 0)) * 1e6
+    return df.sort_values(["banco", "filas"], ascending=[True, False]).reset_index(drop=True)
+
+
+def reiniciar_estadisticas():
+    ESTADISTICAS.clear()
+
+
+def imprimir_estadisticas():
+    for fila in estadisticas_reglas().itertuples():
+        print(f"   📐 {fila.banco:<9} {fila.regla:<28} {fila.filas:>8} filas {fila.segundos:>7.3f} s")
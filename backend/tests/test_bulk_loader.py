@@ -0,0 +1,75 @@
+import sqlite3
+import sys
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+# Los módulos del backend se importan como hermanos (igual que db/init_db.py)
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+import parse_banregio_mexico  # noqa: E402
+import parse_bbva_mexico  # noqa: E402
+from bulk_loader import COLUMNAS_INSERT, clave_dedup, iter_tuplas_movimientos  # noqa: E402
+from esquema import aplicar_esquema  # noqa: E402
+
+EJEMPLOS = BACKEND / "Archivos ejemplos"
+
+# Tipos de movimientos_bancarios (db/init_db.py): montos REAL, fecha TEXT
+TIPOS_DB = {"abonos": "REAL", "cargos": "REAL", "saldo": "REAL", "neto": "REAL", "dedup_key": "INTEGER"}
+
+
+def _ida_y_vuelta(df):
+    """Escribe df como lo hace guardar_movimientos y lo vuelve a leer de SQLite."""
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute(f"""
+            CREATE TABLE movimientos_bancarios (
+                {", ".join(f"{c} {TIPOS_DB.get(c, 'TEXT')}" for c in COLUMNAS_INSERT)}
+            )
+        """)
+        conn.executemany(
+            f"INSERT INTO movimientos_bancarios VALUES ({', '.join('?' * len(COLUMNAS_INSERT))})",
+            iter_tuplas_movimientos(df),
+        )
+        return pd.read_sql("SELECT * FROM movimientos_bancarios ORDER BY rowid", conn)
+    finally:
+        conn.close()
+
+# ==============================
+# CLAVE_DEDUP
+# ==============================
+class ClaveDedupTest(unittest.TestCase):
+
+    def _assert_misma_clave(self, df):
+        leidas = _ida_y_vuelta(df)
+        claves = clave_dedup(df)
+        self.assertEqual(claves.tolist(), leidas["dedup_key"].tolist())
+        self.assertEqual(claves.tolist(), clave_dedup(leidas).tolist())
+
+    def test_cartola_bbva(self):
+        df = pd.concat(parse_bbva_mexico.leer_cartola(EJEMPLOS / "MOV BBVA 19122025.txt"), ignore_index=True)
+        self._assert_misma_clave(aplicar_esquema(df))
+
+    def test_cartola_banregio(self):
+        registros = parse_banregio_mexico.iter_registros(EJEMPLOS / "MOV BANREGIO 19122025.xlsx")
+        self._assert_misma_clave(parse_banregio_mexico.normalizar_registros(registros))
+
+    def test_montos_que_no_son_exactos_en_binario(self):
+        df = aplicar_esquema(pd.DataFrame({
+            "fecha": ["2025-12-01", "2025-12-01", "2025-12-02", "2025-12-31"],
+            "banco": ["BBVA", "BBVA", "BBVA", "BANREGIO"],
+            "cuenta": ["0123", "0123", "0123", "9876"],
+            "descripcion": ["SPEI RECIBIDO", "SPEI RECIBIDO", "PAGO", None],
+            "abonos_centavos": [29, 7, 0, 123456789012],
+            "cargos_centavos": [0, 0, 1005, 0],
+            "saldo_centavos": [1000029, 1000036, 999031, -115],
+            "neto_centavos": [29, 7, -1005, 123456789012],
+        }))
+        self._assert_misma_clave(df)
+        self.assertEqual(len(set(clave_dedup(df).tolist())), len(df))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import itertools
+import random
+import sys
+import unittest
+from pathlib import Path
+
+# Los módulos del backend se importan como hermanos (igual que db/init_db.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from conciliacion import buscar_combinacion  # noqa: E402
+
+
+def _combinacion_bruta(objetivo, valores, tolerancia, min_items):
+    """(diferencia, cantidad) de la mejor combinación por fuerza bruta, o None."""
+    mejor = None
+    for cantidad in range(min_items, len(valores) + 1):
+        for posiciones in itertools.combinations(range(len(valores)), cantidad):
+            diferencia = abs(objetivo - sum(valores[i] for i in posiciones))
+            if diferencia <= tolerancia and (mejor is None or (diferencia, cantidad) < mejor):
+                mejor = (diferencia, cantidad)
+    return mejor
+
+
+def _resultado(objetivo, valores, posiciones):
+    if posiciones is None:
+        return None
+    return abs(objetivo - sum(valores[i] for i in posiciones)), len(posiciones)
+
+# ==============================
+# BUSCAR_COMBINACION
+# ==============================
+class BuscarCombinacionTest(unittest.TestCase):
+
+    def test_suma_cercana_con_pocos_elementos_no_tapa_otra_valida(self):
+        # 1191 sola queda más cerca de 1133, pero no llega a min_items=2
+        valores = [2503, 3670, 4303, 1191, 7, 4900]
+        posiciones = buscar_combinacion(1133, valores, tolerancia_centavos=100)
+        self.assertEqual(sorted(posiciones), [3, 4])
+
+    def test_sin_combinacion_en_tolerancia(self):
+        self.assertIsNone(buscar_combinacion(100, [1000, 2000, 3000], tolerancia_centavos=10))
+        self.assertIsNone(buscar_combinacion(100, [100], tolerancia_centavos=10))
+
+    def test_igual_a_fuerza_bruta(self):
+        azar = random.Random(20251222)
+        for _ in range(3000):
+            valores = [azar.randint(1, 5000) for _ in range(azar.randint(0, 9))]
+            objetivo = azar.randint(1, 12000)
+            tolerancia = azar.choice([0, 1, 100])
+            min_items = azar.randint(1, 3)
+            with self.subTest(objetivo=objetivo, valores=valores, tolerancia=tolerancia, min_items=min_items):
+                posiciones = buscar_combinacion(objetivo, valores, tolerancia, min_items)
+                self.assertEqual(
+                    _resultado(objetivo, valores, posiciones),
+                    _combinacion_bruta(objetivo, valores, tolerancia, min_items),
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
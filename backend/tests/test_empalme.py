@@ -0,0 +1,45 @@
+import random
+import sys
+import unittest
+from pathlib import Path
+
+# Los módulos del backend se importan como hermanos (igual que db/init_db.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from empalme import largo_solape  # noqa: E402
+
+
+def _solape_bruto(cola, nuevas):
+    """Mayor k con cola[-k:] == nuevas[:k], probando todos los largos."""
+    for k in range(min(len(cola), len(nuevas)), 0, -1):
+        if list(cola[-k:]) == list(nuevas[:k]):
+            return k
+    return 0
+
+# ==============================
+# LARGO_SOLAPE
+# ==============================
+class LargoSolapeTest(unittest.TestCase):
+
+    def test_casos_conocidos(self):
+        self.assertEqual(largo_solape([1, 2, 3, 4], [3, 4, 5]), 2)
+        self.assertEqual(largo_solape([1, 2, 3], [4, 5]), 0)
+        self.assertEqual(largo_solape([], [1]), 0)
+        self.assertEqual(largo_solape([1], []), 0)
+        # nuevas completa dentro de la cola pero no al final: no es solape
+        self.assertEqual(largo_solape([7, 8, 9, 1], [7, 8]), 0)
+        # cartola que repite movimientos idénticos
+        self.assertEqual(largo_solape([5, 5, 5], [5, 5, 5, 5]), 3)
+
+    def test_igual_a_fuerza_bruta(self):
+        azar = random.Random(19122025)
+        for _ in range(5000):
+            alfabeto = azar.randint(1, 3)  # Pocas claves distintas: muchos calces parciales
+            cola = [azar.randint(1, alfabeto) for _ in range(azar.randint(0, 12))]
+            nuevas = [azar.randint(1, alfabeto) for _ in range(azar.randint(0, 12))]
+            with self.subTest(cola=cola, nuevas=nuevas):
+                self.assertEqual(largo_solape(cola, nuevas), _solape_bruto(cola, nuevas))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Los módulos del backend se importan como hermanos (igual que db/init_db.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from indice_contrapartes import ngramas, normalizar_clave, resolver_rfc_por_nombre  # noqa: E402
+
+
+def _indice(contrapartes):
+    """Índice en memoria con la forma de cargar_indice, desde pares (rfc, razón)."""
+    listas = {}
+    n_gramas = []
+    for pos, (_, razon) in enumerate(contrapartes):
+        gramas = ngramas(normalizar_clave(razon))
+        n_gramas.append(len(gramas))
+        for grama in gramas:
+            listas.setdefault(grama, []).append(pos)
+    return {
+        "listas": {grama: np.array(posiciones, dtype=np.int64) for grama, posiciones in listas.items()},
+        "rfc": np.array([rfc for rfc, _ in contrapartes], dtype=object),
+        "razon": np.array([razon for _, razon in contrapartes], dtype=object),
+        "n_gramas": np.array(n_gramas),
+    }
+
+# ==============================
+# RESOLVER_RFC_POR_NOMBRE
+# ==============================
+class ResolverRfcPorNombreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.indice = _indice([
+            ("ABC010101AAA", "ABARROTES DEL CENTRO SA DE CV"),
+            ("XYZ020202BBB", "TRANSPORTES DEL NORTE"),
+        ])
+
+    def test_nombre_truncado_resuelve(self):
+        nombres = pd.Series(["ABARROTES DEL CEN", "TRANSPORTES DEL NORTE"])
+        self.assertEqual(resolver_rfc_por_nombre(self.indice, nombres).tolist(), ["ABC010101AAA", "XYZ020202BBB"])
+
+    def test_nombre_corto_no_resuelve(self):
+        # "SADECV" está completo dentro de la primera razón social (similitud 1.0)
+        nombres = pd.Series(["SA DE CV", "S.A. de C.V.", None])
+        self.assertEqual(resolver_rfc_por_nombre(self.indice, nombres).tolist(), [None, None, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
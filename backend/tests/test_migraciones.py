@@ -0,0 +1,127 @@
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+# Los módulos del backend se importan como hermanos (igual que db/init_db.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bulk_loader import clave_dedup  # noqa: E402
+from migraciones import migrar_dedup_key  # noqa: E402
+
+# Esquema de antes de 002_dedup_key: UNIQUE de 10 columnas, ya con batch_id (001)
+ESQUEMA_ANTERIOR = """
+CREATE TABLE movimientos_bancarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha TEXT NOT NULL,
+    banco TEXT,
+    cuenta TEXT,
+    banco_origen TEXT,
+    cuenta_origen TEXT,
+    rut_pagador TEXT,
+    nombre_contraparte TEXT,
+    tipo_documento TEXT,
+    moneda TEXT,
+    descripcion TEXT,
+    comentario_movimiento TEXT,
+    referencia_movimiento TEXT,
+    abonos REAL DEFAULT 0,
+    cargos REAL DEFAULT 0,
+    saldo REAL,
+    neto REAL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    batch_id INTEGER,
+    UNIQUE (fecha, banco, cuenta, tipo_documento, descripcion, comentario_movimiento,
+            referencia_movimiento, abonos, cargos, saldo)
+);
+CREATE TABLE conciliaciones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    movimiento_id INTEGER NOT NULL REFERENCES movimientos_bancarios (id),
+    factura_id INTEGER NOT NULL,
+    etapa TEXT NOT NULL,
+    monto_aplicado REAL,
+    diferencia REAL,
+    dias INTEGER,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (movimiento_id, factura_id)
+);
+"""
+
+# (id, fecha, descripcion, abonos, saldo). Con saldo la clave no mira la
+# descripción: el mismo movimiento cargado con otro concepto es repetido
+MOVIMIENTOS = [
+    (1, "2025-12-01", "SPEI RECIBIDO CLIENTE A", 1500.25, 10_000.25),
+    (2, "2025-12-01", "SPEI RECIBIDO CLIENTE A REF 123", 1500.25, 10_000.25),  # repetido de 1
+    (3, "2025-12-02", "DEPOSITO", 99.99, 10_100.24),
+    (4, "2025-12-02", "DEPOSITO EN EFECTIVO", 99.99, 10_100.24),               # repetido de 3
+    (5, "2025-12-03", "PAGO TARJETA", 10.00, None),                            # sin saldo: cuenta la
+    (6, "2025-12-03", "PAGO SERVICIO", 10.00, None),                           # descripción, no se repiten
+]
+
+# (movimiento_id, factura_id)
+CONCILIACIONES = [
+    (1, 11),
+    (2, 10),  # pasa a 1
+    (2, 11),  # 1 ya tiene la 11: se elimina
+    (4, 12),  # pasa a 3
+    (6, 13),
+]
+
+
+class MigrarDedupKeyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(Path(self.tmp.name) / "conciliador.db")
+        self.conn.executescript(ESQUEMA_ANTERIOR)
+        self.conn.executemany(
+            "INSERT INTO movimientos_bancarios (id, fecha, banco, cuenta, descripcion, abonos, cargos, saldo, batch_id)"
+            " VALUES (?, ?, 'BBVA', '0123', ?, ?, 0, ?, 1)",
+            MOVIMIENTOS,
+        )
+        self.conn.executemany(
+            "INSERT INTO conciliaciones (movimiento_id, factura_id, etapa) VALUES (?, ?, 'MONTO_FECHA')",
+            CONCILIACIONES,
+        )
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_conserva_el_menor_id_y_mueve_las_conciliaciones(self):
+        detalle = migrar_dedup_key(self.conn)
+        self.assertEqual(detalle, "6 movimientos con dedup_key, 2 repetidos eliminados")
+
+        movimientos = pd.read_sql("SELECT * FROM movimientos_bancarios ORDER BY id", self.conn)
+        self.assertEqual(movimientos["id"].tolist(), [1, 3, 5, 6])
+        self.assertEqual(movimientos["descripcion"].tolist()[:2], ["SPEI RECIBIDO CLIENTE A", "DEPOSITO"])
+        self.assertEqual(movimientos["dedup_key"].tolist(), clave_dedup(movimientos).tolist())
+        self.assertEqual(movimientos["batch_id"].tolist(), [1, 1, 1, 1])
+
+        conciliaciones = self.conn.execute(
+            "SELECT movimiento_id, factura_id FROM conciliaciones ORDER BY factura_id"
+        ).fetchall()
+        self.assertEqual(conciliaciones, [(1, 10), (1, 11), (3, 12), (6, 13)])
+
+    def test_la_tabla_nueva_rechaza_claves_repetidas(self):
+        migrar_dedup_key(self.conn)
+        dedup_key = self.conn.execute("SELECT dedup_key FROM movimientos_bancarios WHERE id = 1").fetchone()[0]
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.conn.execute(
+                "INSERT INTO movimientos_bancarios (fecha, dedup_key) VALUES ('2025-12-31', ?)", (dedup_key,)
+            )
+        indices = {fila[1] for fila in self.conn.execute("PRAGMA index_list(movimientos_bancarios)")}
+        self.assertIn("idx_movimientos_batch", indices)
+
+    def test_no_hace_nada_si_ya_hay_dedup_key(self):
+        migrar_dedup_key(self.conn)
+        self.assertIsNone(migrar_dedup_key(self.conn))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM movimientos_bancarios").fetchone()[0], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+# Los módulos del backend se importan como hermanos (igual que db/init_db.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from parse_facturas_emitidas import COLUMNAS_TABLA, guardar_facturas  # noqa: E402
+import sync_postgres  # noqa: E402
+
+DSN = os.environ.get(sync_postgres.DSN_ENV)
+
+# ==============================
+# SMOKE TEST SQLITE -> POSTGRES
+# ==============================
+# Necesita un Postgres de verdad: sin CONCILIADOR_PG_DSN (o sin psycopg) se
+# salta. Usa un esquema propio que se borra al terminar.
+
+
+def _crear_sqlite(path):
+    """Base SQLite mínima con las columnas que lee sync_postgres."""
+    conn = sqlite3.connect(path)
+    movimientos = [n for n in sync_postgres._nombres("movimientos_bancarios") if n not in ("sqlite_id", "created_at")]
+    conn.execute(f"""
+        CREATE TABLE movimientos_bancarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            {", ".join(movimientos)},
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE facturas_emitidas_mx (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            uuid TEXT NOT NULL UNIQUE,
+            {", ".join(c for c in COLUMNAS_TABLA if c != "uuid")},
+            contenido_hash TEXT,
+            version INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    return conn
+
+
+def _factura(uuid, estado="Vigente"):
+    fila = dict.fromkeys(COLUMNAS_TABLA)
+    fila.update(uuid=uuid, folio=uuid[-3:], tipo="I - Ingreso", fecha_emision="2025-01-15T10:00:00",
+                rfc_receptor="XAXX010101000", estado=estado, moneda="MXN", total=116.0)
+    return fila
+
+
+@unittest.skipUnless(DSN and sync_postgres.psycopg is not None, f"sin {sync_postgres.DSN_ENV} o psycopg")
+class SyncPostgresTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmp.name) / "conciliador.db"
+        self.conn = _crear_sqlite(self.db_path)
+        self.esquema = f"test_sync_{os.getpid()}"
+
+    def tearDown(self):
+        self.conn.close()
+        with sync_postgres.psycopg.connect(DSN, autocommit=True) as pg:
+            pg.execute(f"DROP SCHEMA IF EXISTS {self.esquema} CASCADE")
+        self.tmp.cleanup()
+
+    def _sincronizar(self):
+        resultados = sync_postgres.sincronizar(DSN, self.db_path, self.esquema)
+        return {r["tabla"]: r["enviadas"] for r in resultados}
+
+    def _estado_pg(self, uuid):
+        with sync_postgres.psycopg.connect(DSN) as pg:
+            return pg.execute(
+                f"SELECT estado FROM {self.esquema}.facturas_emitidas_mx WHERE uuid = %s", (uuid,)
+            ).fetchone()[0]
+
+    def test_sincroniza_cambios_del_mismo_segundo(self):
+        self.conn.execute(
+            "INSERT INTO movimientos_bancarios (dedup_key, fecha, banco, abonos) VALUES (1, '2025-01-15', 'BBVA', 116.0)"
+        )
+        self.conn.commit()
+        guardar_facturas(self.conn, pd.DataFrame([_factura("UUID-001"), _factura("UUID-002")]))
+        self.assertEqual(self._sincronizar(), {"movimientos_bancarios": 1, "facturas_emitidas_mx": 2})
+
+        # La factura de id menor cambia (casi seguro dentro del mismo segundo de la marca)
+        guardar_facturas(self.conn, pd.DataFrame([_factura("UUID-001", estado="Cancelado")]))
+        self.assertEqual(self._sincronizar(), {"movimientos_bancarios": 0, "facturas_emitidas_mx": 1})
+        self.assertEqual(self._estado_pg("UUID-001"), "Cancelado")
+
+        # Sin cambios no viaja nada
+        self.assertEqual(self._sincronizar(), {"movimientos_bancarios": 0, "facturas_emitidas_mx": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
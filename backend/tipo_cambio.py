@@ -0,0 +1,217 @@
+import argparse
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from normalizacion import avisar_no_parseadas, normalizar_fechas
+
+# ==============================
+# CONFIGURACIÓN
+# ==============================
+BASE_DIR = Path(__file__).parent
+DB_PATH = BASE_DIR / "db" / "conciliador.db"
+
+MONEDA_EMPRESA = "MXN"  # Moneda de la contabilidad: todo se concilia y reporta en esta moneda
+
+FORMATOS_FECHA = ["%Y-%m-%d", "%d/%m/%Y"]  # ISO o como lo publica el DOF
+
+# Nombres de columna aceptados en el CSV (en minúsculas, sin espacios extremos)
+COLUMNAS_CSV = {
+    "fecha": "fecha",
+    "moneda": "moneda",
+    "moneda_destino": "moneda_destino",
+    "tipo_cambio": "tipo_cambio",
+    "tipo de cambio": "tipo_cambio",
+    "tasa": "tipo_cambio",
+}
+
+# ==============================
+# TIPOS DE CAMBIO
+# ==============================
+# Tabla tipos_cambio (migración 004_tipos_cambio): un tipo por día y par de
+# monedas; cuántas unidades de moneda_destino vale una de moneda.
+# La conversión busca para cada fila el último tipo publicado hasta su fecha
+# (as-of) con un solo merge_asof ordenado sobre toda la columna; los tipos
+# de cada par se leen de la base una vez y quedan en _CACHE.
+
+_CACHE = {}  # (archivo de la base, moneda, moneda_destino) -> DataFrame fecha / tipo_cambio ordenado
+
+
+def _archivo_db(conn):
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+def limpiar_cache():
+    _CACHE.clear()
+
+
+def leer_csv(path, moneda_destino=MONEDA_EMPRESA):
+    """
+    Lee un CSV de tipos de cambio: columnas fecha, moneda y tipo_cambio
+    (opcional moneda_destino). Las filas con fecha o tipo no reconocidos
+    se avisan y se descartan.
+    """
+    df = pd.read_csv(path, dtype=str)
+    df.columns = [c.strip().lower() for c in df.columns]
+    df = df.rename(columns=COLUMNAS_CSV)
+
+    faltantes = {"fecha", "moneda", "tipo_cambio"} - set(df.columns)
+    if faltantes:
+        raise ValueError(f"Faltan columnas en {path}: {', '.join(sorted(faltantes))}")
+
+    fechas, no_parseadas = normalizar_fechas(df["fecha"], FORMATOS_FECHA, dayfirst=True)
+    avisar_no_parseadas("fecha", no_parseadas)
+    tasas = pd.to_numeric(df["tipo_cambio"].str.replace(",", "", regex=False), errors="coerce")
+    avisar_no_parseadas("tipo_cambio", df["tipo_cambio"][tasas.isna() & df["tipo_cambio"].notna()])
+
+    destino = df["moneda_destino"] if "moneda_destino" in df else pd.Series(moneda_destino, index=df.index)
+    tipos = pd.DataFrame({
+        "moneda": df["moneda"].str.strip().str.upper(),
+        "moneda_destino": destino.fillna(moneda_destino).str.strip().str.upper(),
+        "fecha": fechas.dt.strftime("%Y-%m-%d"),
+        "tipo_cambio": tasas,
+    })
+    return tipos[fechas.notna() & (tasas > 0) & tipos["moneda"].notna()]
+
+
+def guardar_tipos_cambio(conn, tipos, fuente=None):
+    """Inserta o actualiza (moneda, moneda_destino, fecha) -> tipo_cambio. Devuelve cuántas filas escribió."""
+    filas = zip(
+        tipos["moneda"].tolist(),
+        tipos["moneda_destino"].tolist(),
+        tipos["fecha"].tolist(),
+        tipos["tipo_cambio"].astype(float).tolist(),
+        [fuente] * len(tipos),
+    )
+    with conn:
+        conn.executemany("""
+            INSERT INTO tipos_cambio (moneda, moneda_destino, fecha, tipo_cambio, fuente)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (moneda, moneda_destino, fecha)
+            DO UPDATE SET tipo_cambio = excluded.tipo_cambio, fuente = excluded.fuente
+        """, filas)
+    limpiar_cache()  # Los pares en caché pueden haber cambiado
+    return len(tipos)
+
+
+def cargar_csv(path, db_path=DB_PATH, moneda_destino=MONEDA_EMPRESA):
+    conn = sqlite3.connect(db_path)
+    try:
+        return guardar_tipos_cambio(conn, leer_csv(path, moneda_destino), fuente=Path(path).name)
+    finally:
+        conn.close()
+
+
+def tipos_par(conn, moneda, moneda_destino=MONEDA_EMPRESA):
+    """Tipos de cambio de un par ordenados por fecha (datetime64), leídos una sola vez por base."""
+    clave = (_archivo_db(conn), moneda, moneda_destino)
+    if clave not in _CACHE:
+        tipos = pd.read_sql("""
+            SELECT fecha, tipo_cambio
+            FROM tipos_cambio
+            WHERE moneda = ? AND moneda_destino = ?
+            ORDER BY fecha
+        """, conn, params=(moneda, moneda_destino))
+        tipos["fecha"] = pd.to_datetime(tipos["fecha"]).astype("datetime64[us]")
+        tipos["moneda"] = moneda
+        _CACHE[clave] = tipos
+    return _CACHE[clave]
+
+# ==============================
+# CONVERSIÓN
+# ==============================
+def tipo_cambio_asof(conn, fechas, monedas, moneda_destino=MONEDA_EMPRESA):
+    """
+    Tipo de cambio de cada fila a moneda_destino: 1.0 si ya está en esa
+    moneda (o no trae moneda), el último publicado hasta su fecha si no, y
+    NaN si no hay ninguno anterior.
+    """
+    monedas = pd.Series(monedas).astype(object).str.strip().str.upper().fillna(moneda_destino).to_numpy()
+    fechas = normalizar_fechas(pd.Series(fechas).reset_index(drop=True))[0].astype("datetime64[us]").to_numpy()
+    tasas = np.where(monedas == moneda_destino, 1.0, np.nan)
+
+    extranjeras = (monedas != moneda_destino) & ~np.isnat(fechas)
+    if not extranjeras.any():
+        return tasas
+
+    tipos = pd.concat(
+        [tipos_par(conn, moneda, moneda_destino) for moneda in pd.unique(monedas[extranjeras])],
+        ignore_index=True,
+    ).sort_values("fecha", kind="stable")
+
+    filas = pd.DataFrame({
+        "posicion": np.flatnonzero(extranjeras),
+        "fecha": fechas[extranjeras],
+        "moneda": monedas[extranjeras],
+    }).sort_values("fecha", kind="stable")
+    cruce = pd.merge_asof(filas, tipos, on="fecha", by="moneda", direction="backward")
+
+    tasas[cruce["posicion"].to_numpy()] = cruce["tipo_cambio"].to_numpy(dtype=float)
+    return tasas
+
+
+def convertir(conn, df, montos, columna_fecha, columna_moneda="moneda", moneda_destino=MONEDA_EMPRESA):
+    """
+    Copia de df con la columna tipo_cambio y, por cada monto, su equivalente
+    en moneda_destino (sufijo _mxn para MXN):
+    - total -> total_mxn (float, 2 decimales)
+    - abonos_centavos -> abonos_mxn_centavos (Int64)
+    Las filas sin tipo de cambio quedan con el equivalente vacío.
+    """
+    sufijo = moneda_destino.lower()
+    tasas = tipo_cambio_asof(conn, df[columna_fecha], df[columna_moneda], moneda_destino)
+
+    salida = df.copy()
+    salida["tipo_cambio"] = tasas
+    for col in montos:
+        valores = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float) * tasas
+        if col.endswith("_centavos"):
+            base = col[:-len("_centavos")]
+            salida[f"{base}_{sufijo}_centavos"] = pd.Series(np.round(valores), index=df.index).astype("Int64")
+        else:
+            salida[f"{col}_{sufijo}"] = np.round(valores, 2)
+    return salida
+
+
+def convertir_movimientos(conn, df, moneda_destino=MONEDA_EMPRESA):
+    """Equivalentes de abonos / cargos (en centavos si df viene del parser, en pesos si viene de la base)."""
+    montos = [c for c in ("abonos_centavos", "cargos_centavos", "abonos", "cargos") if c in df]
+    return convertir(conn, df, montos, "fecha", moneda_destino=moneda_destino)
+
+
+def convertir_facturas(conn, df, moneda_destino=MONEDA_EMPRESA):
+    """Equivalentes de subtotal / iva_trasladado / total a la fecha de emisión."""
+    montos = [c for c in ("subtotal", "iva_trasladado", "total") if c in df]
+    return convertir(conn, df, montos, "fecha_emision", moneda_destino=moneda_destino)
+
+# ==============================
+# MAIN
+# ==============================
+def main():
+    ap = argparse.ArgumentParser(description="Tipos de cambio para convertir a la moneda de la empresa")
+    ap.add_argument("csv", nargs="*", help="CSV con fecha, moneda, tipo_cambio")
+    ap.add_argument("--db", default=str(DB_PATH))
+    args = ap.parse_args()
+
+    for path in args.csv:
+        print(f"💱 {path}: {cargar_csv(path, args.db)} tipos de cambio cargados")
+
+    conn = sqlite3.connect(args.db)
+    try:
+        resumen = conn.execute("""
+            SELECT moneda, moneda_destino, COUNT(*), MIN(fecha), MAX(fecha)
+            FROM tipos_cambio
+            GROUP BY moneda, moneda_destino
+            ORDER BY moneda, moneda_destino
+        """).fetchall()
+    finally:
+        conn.close()
+
+    for moneda, destino, dias, desde, hasta in resumen:
+        print(f"   {moneda}/{destino}: {dias} días ({desde} a {hasta})")
+
+
+if __name__ == "__main__":
+    main()